@@ -2,15 +2,15 @@
 """
 CRTS Admin/Staff Desktop App (Cosmo theme)
 Save this as admin_app.py and run: python admin_app.py
-Requires: pip install ttkbootstrap firebase-admin requests
+Requires: pip install ttkbootstrap firebase-admin requests aiohttp
 """
 
 import tkinter as tk
 from tkinter import simpledialog
 import ttkbootstrap as ttk
 from ttkbootstrap.dialogs import Messagebox
-import threading, traceback
-from datetime import datetime
+import os, threading, traceback
+from datetime import datetime, timedelta
 import requests
 
 from firebase_client import (
@@ -18,23 +18,44 @@ from firebase_client import (
     signin_with_email_password,
     create_user_doc,
     get_user_doc,
-    get_all_complaints,
+    query_complaints,
+    query_archive,
     get_complaint,
-    update_complaint_status,
-    add_complaint_update,
-    get_complaint_updates,
+    get_overdue_complaints,
+    assign_complaint,
     list_all_users,
-    db,
+    update_user,
+    set_user_roles,
+    search_users,
+    directory,
+    format_ts,
+    usage,
+    READ_BUDGET,
+    WRITE_BUDGET,
+    list_tenants,
+    set_tenant,
+    DEFAULT_TENANT,
 )
+import analytics
+from assignment import balancer_for
+from attachments import ThumbnailCache, show_thumbnails
+from schema import CATEGORIES, LIST_FIELDS, PRIORITIES, ROLES
+import firebase_client_async as afc
+from outbox import Outbox
+from util import DATA_DIR
+from ui_watchdog import UiWatchdog, open_diagnostics
 
 # Admin signup secret
 ADMIN_SIGNUP_CODE = "CRTS-FACULTY-999"
+USERS_PAGE = 100  # rows per page in the Users view
+USAGE_REFRESH_MS = 2000  # status bar Firestore read/write counter
 
 root = tk.Tk()
 root.withdraw()
 style = ttk.Style("cosmo")
+watchdog = UiWatchdog(root)  # Tk stall detection; Diagnostics button / Ctrl+Shift+D
 
-session = {"uid": None, "email": None, "name": None, "role": None}
+session = {"uid": None, "email": None, "name": None, "role": None, "tenant": "", "tenant_name": ""}
 login_win = None
 main_win = None
 
@@ -99,6 +120,31 @@ def run_thread(win, func, done=None):
         root.after(1, cb)
     threading.Thread(target=worker, daemon=True).start()
 
+_bridge = None
+
+def run_async(win, make_coro, done=None):
+    """Like run_thread, but for firebase_client_async coroutines: all of them
+    share one event loop (and one gRPC channel) instead of a thread each."""
+    global _bridge
+    if _bridge is None:
+        _bridge = afc.AsyncBridge(root)
+    _bridge.run(win, make_coro, done)
+
+# status changes go through a local outbox (SQLite) and are sent in the
+# background with retries; the main window listens for the results
+outbox_handlers = []
+
+def _outbox_event(kind, key, op, info):
+    def cb():
+        for h in list(outbox_handlers):
+            try: h(kind, key, op, info)
+            except Exception: print("Error in outbox handler:\n", traceback.format_exc())
+    try: root.after(1, cb)
+    except tk.TclError: pass
+
+outbox = Outbox(os.path.join(DATA_DIR, "admin_outbox.sqlite3"), on_event=_outbox_event)
+thumbs = ThumbnailCache()  # complaint photo thumbnails, loaded on demand
+
 def fb_error(exc, login=False):
     """Map Firebase HTTP errors to user-friendly messages"""
     if isinstance(exc, requests.exceptions.HTTPError) and exc.response is not None:
@@ -135,7 +181,7 @@ def open_login():
         except: pass
 
     w = tk.Toplevel(root); login_win = w
-    w.title("CRTS Admin/Staff Login"); center(w, 500, 340); w.resizable(False, False)
+    w.title("CRTS Admin/Staff Login"); center(w, 500, 380); w.resizable(False, False)
 
     f = ttk.Frame(w, padding=18); f.pack(fill="both", expand=True)
     ttk.Label(f, text="CRTS Admin/Staff Portal", font=("Segoe UI", 14, "bold")).grid(row=0, column=0, columnspan=2, pady=10)
@@ -152,6 +198,23 @@ def open_login():
     ttk.Label(f, text="Faculty Code:").grid(row=4, column=0, sticky="w")
     e_code = ttk.Entry(f, width=40, show="*"); e_code.grid(row=4, column=1, pady=5)
 
+    # institution picker, shown once the project has tenants registered
+    tenants = {}  # display name -> tenant id
+    l_tenant = ttk.Label(f, text="Institution:")
+    tenant_var = ttk.StringVar()
+    c_tenant = ttk.Combobox(f, textvariable=tenant_var, width=38, state="readonly")
+    def tenants_loaded(rows, exc):
+        if exc or not rows: return  # single-institution project
+        for tid, d in rows: tenants[d.get("name") or tid] = tid
+        c_tenant.config(values=list(tenants))
+        tenant_var.set(next((n for n, t in tenants.items() if t == DEFAULT_TENANT), next(iter(tenants))))
+        l_tenant.grid(row=5, column=0, sticky="w"); c_tenant.grid(row=5, column=1, pady=5)
+    run_thread(w, list_tenants, tenants_loaded)
+    def use_tenant():
+        name = tenant_var.get()
+        session["tenant"] = tenants.get(name, DEFAULT_TENANT); session["tenant_name"] = name if name in tenants else ""
+        set_tenant(session["tenant"])
+
     def signup():
         email = e_email.get().strip(); pwd = e_pwd.get().strip()
         name = e_name.get().strip() or "Staff"
@@ -161,18 +224,20 @@ def open_login():
         if code != ADMIN_SIGNUP_CODE:
             Messagebox.show_error("Invalid faculty code.", parent=w); return
 
+        use_tenant()
         L = loader(w, "Creating account...")
-        def work(): return signup_with_email_password(email, pwd)
+        def work():
+            res = signup_with_email_password(email, pwd)
+            try:
+                create_user_doc(uid=res.get("localId"), email=email, name=name, role="staff")
+            except Exception:
+                pass
+            return res
         def done(res, exc):
             try: L.destroy()
             except: pass
             if exc:
                 Messagebox.show_error(fb_error(exc, login=False), parent=w); return
-            uid = res.get("localId")
-            try:
-                create_user_doc(uid=uid, email=email, name=name, role="staff")
-            except Exception:
-                pass
             toast(w, "Staff account created. Please login.")
             e_code.delete(0, "end")
         run_thread(w, work, done)
@@ -181,32 +246,39 @@ def open_login():
         email = e_email.get().strip(); pwd = e_pwd.get().strip()
         if not email or not pwd:
             Messagebox.show_error("Email & Password required.", parent=w); return
+        use_tenant()
         L = loader(w, "Signing in...")
-        def work(): return signin_with_email_password(email, pwd)
-        def done(res, exc):
+        def work():
+            # the profile read runs here too, not on the Tk thread
+            res = signin_with_email_password(email, pwd)
+            try:
+                return res, get_user_doc(res.get("localId")), None
+            except Exception as e:
+                return res, None, e
+        def done(out, exc):
             try: L.destroy()
             except: pass
             if exc:
                 Messagebox.show_error(fb_error(exc, login=True), parent=w); return
-            uid = res.get("localId")
-            session["uid"] = uid; session["email"] = email
-            # load user doc (synchronously ok because small)
-            try:
-                user_doc = get_user_doc(uid)
-            except Exception as e:
-                Messagebox.show_error(f"Failed to fetch user profile: {e}", parent=w); return
+            res, user_doc, doc_exc = out
+            session["uid"] = res.get("localId"); session["email"] = email
+            if doc_exc:
+                Messagebox.show_error(f"Failed to fetch user profile: {doc_exc}", parent=w); return
             if not user_doc:
-                Messagebox.show_error("No user profile in DB.", parent=w); return
+                where = f" at {session['tenant_name']}" if session.get("tenant_name") else " in DB"
+                Messagebox.show_error(f"No user profile{where}.", parent=w); return
             if user_doc.get("role") not in ("staff", "admin"):
                 Messagebox.show_error("Not authorized for Admin Portal.", parent=w); return
             session["name"] = user_doc.get("name", email.split("@")[0])
             session["role"] = user_doc.get("role", "staff")
+            usage.reset()  # budgets are per session
+            usage.set_budget(reads=READ_BUDGET, writes=WRITE_BUDGET)
             try: w.destroy()
             except: pass
             open_main()
         run_thread(w, work, done)
 
-    row = ttk.Frame(f); row.grid(row=5, column=1, sticky="e", pady=12)
+    row = ttk.Frame(f); row.grid(row=6, column=1, sticky="e", pady=12)
     ttk.Button(row, text="Sign up", bootstyle="success", command=signup).pack(side="left", padx=5)
     ttk.Button(row, text="Login", bootstyle="primary", command=login).pack(side="left")
 
@@ -231,23 +303,45 @@ def open_main():
 
     # Topbar
     top = ttk.Frame(w, padding=10); top.pack(fill="x")
-    ttk.Label(top, text=f"{session.get('name')} ({session.get('email')})  | Role: {session.get('role')}", font=("Segoe UI", 10)).pack(side="left")
+    where = f"  | {session['tenant_name']}" if session.get("tenant_name") else ""
+    ttk.Label(top, text=f"{session.get('name')} ({session.get('email')})  | Role: {session.get('role')}{where}", font=("Segoe UI", 10)).pack(side="left")
     def logout():
         if Messagebox.yesno("Logout", "Do you really want to logout?", parent=w):
+            outbox_handlers.clear(); directory.stop()
             try: w.destroy()
             except: pass
             open_login()
     ttk.Button(top, text="Logout", bootstyle="outline-secondary", command=logout).pack(side="right")
+    ttk.Button(top, text="Diagnostics", bootstyle="link", command=lambda: open_diagnostics(w, watchdog)).pack(side="right", padx=6)
+    w.bind("<Control-Shift-D>", lambda e: open_diagnostics(w, watchdog))
 
     body = ttk.Frame(w); body.pack(fill="both", expand=True)
     sidebar = ttk.Frame(body, padding=10, width=220, bootstyle="secondary")
     sidebar.pack(side="left", fill="y"); sidebar.pack_propagate(False)
     content = ttk.Frame(body, padding=10); content.pack(side="left", fill="both", expand=True)
 
-    status_bar = ttk.Label(w, text="Ready", anchor="w", bootstyle="secondary"); status_bar.pack(side="bottom", fill="x")
+    bar = ttk.Frame(w); bar.pack(side="bottom", fill="x")
+    status_bar = ttk.Label(bar, text="Ready", anchor="w", bootstyle="secondary"); status_bar.pack(side="left", fill="x", expand=True)
+    usage_bar = ttk.Label(bar, anchor="e", bootstyle="secondary", padding=(8, 0)); usage_bar.pack(side="right")
     def set_status(msg, style="secondary"):
         try: status_bar.config(text=msg, bootstyle=f"inverse-{style}")
         except: status_bar.config(text=msg)
+    def refresh_usage():
+        if not w.winfo_exists(): return
+        text, style = usage.summary()
+        try: usage_bar.config(text=text, bootstyle=f"inverse-{style}")
+        except: usage_bar.config(text=text)
+        w.after(USAGE_REFRESH_MS, refresh_usage)
+    refresh_usage()
+
+    def on_outbox(kind, key, op, info):
+        if kind == "sent":
+            set_status(f"Status change saved: {op['status']}", "success")
+        elif kind == "retry":
+            set_status(f"Offline? {len(outbox.pending())} change(s) queued, retrying – {info}", "warning")
+        elif kind == "failed":
+            Messagebox.show_error(f"Could not change status to {op['status']}:\n{info}", parent=w)
+    outbox_handlers[:] = [on_outbox]
 
     def clear_content():
         for c in content.winfo_children():
@@ -258,8 +352,10 @@ def open_main():
         for c in sidebar.winfo_children():
             if isinstance(c, ttk.Button): c.config(bootstyle="secondary-outline")
         btn.config(bootstyle="secondary")
+        usage.set_view(btn.cget("text"))
 
     # ---------- Dashboard ----------
+    @watchdog.timed("Dashboard")
     def dashboard_view():
         clear_content(); activate(btn_dash)
         ttk.Label(content, text="Dashboard", font=("Segoe UI", 14, "bold")).pack(anchor="w", pady=8)
@@ -271,49 +367,66 @@ def open_main():
             cards[nm] = lf; frame.columnconfigure(i, weight=1)
 
         L = loader(w, "Loading stats...")
-        def work(): return get_all_complaints()
+        async def work():
+            # sharded status counter (a few shard reads); until it has been
+            # built, count the statuses of every complaint instead
+            totals = await afc.get_counter()
+            if totals is not None:
+                return totals
+            totals = {}
+            for _, d in await afc.get_all_complaints(fields=("status",)):
+                totals[d.get("status")] = totals.get(d.get("status"), 0) + 1
+            return totals
         def done(res, exc):
             try: L.destroy()
             except: pass
             if exc:
                 Messagebox.show_error(str(exc), parent=w); return
-            counts = {"OPEN": 0, "IN_PROGRESS": 0, "RESOLVED": 0, "CLOSED": 0}
-            for _, d in res:
-                s = d.get("status")
-                if s in counts: counts[s] += 1
+            counts = {st: max(0, int(res.get(st, 0))) for st in ("OPEN", "IN_PROGRESS", "RESOLVED", "CLOSED")}
             for st, lf in cards.items():
                 for child in lf.winfo_children():
                     try: child.destroy()
                     except: pass
                 ttk.Label(lf, text=str(counts[st]), font=("Segoe UI", 20, "bold")).pack()
-        run_thread(w, work, done)
+        run_async(w, work, done)
 
     # ---------- Complaints ----------
+    @watchdog.timed("Complaints")
     def complaints_view():
         clear_content(); activate(btn_comp)
-        ttk.Label(content, text="All Complaints", font=("Segoe UI", 14, "bold")).pack(anchor="w", pady=(0,6))
+        # staff work their own queue; admins see (and assign) everything
+        my_queue = session.get("role") == "staff"
+        ttk.Label(content, text="My Queue" if my_queue else "All Complaints", font=("Segoe UI", 14, "bold")).pack(anchor="w", pady=(0,6))
 
         # Filters
         f = ttk.Frame(content); f.pack(fill="x", pady=6)
         ttk.Label(f, text="Status:").pack(side="left")
         status_var = ttk.StringVar(value="ALL")
-        status_combo = ttk.Combobox(f, textvariable=status_var, values=("ALL","OPEN","IN_PROGRESS","RESOLVED","CLOSED"), width=14, state="readonly")
+        status_combo = ttk.Combobox(f, textvariable=status_var, values=("ALL","OPEN","IN_PROGRESS","RESOLVED","CLOSED","ARCHIVED"), width=14, state="readonly")
         status_combo.pack(side="left", padx=8)
+        ttk.Label(f, text="Category:").pack(side="left")
+        category_var = ttk.StringVar(value="ANY")
+        category_combo = ttk.Combobox(f, textvariable=category_var, values=("ANY",) + CATEGORIES, width=11, state="readonly")
+        category_combo.pack(side="left", padx=8)
+        ttk.Label(f, text="Priority:").pack(side="left")
+        priority_var = ttk.StringVar(value="ANY")
+        priority_combo = ttk.Combobox(f, textvariable=priority_var, values=("ANY",) + PRIORITIES, width=10, state="readonly")
+        priority_combo.pack(side="left", padx=8)
 
         ttk.Label(f, text="Search Title/Email:").pack(side="left", padx=(10,4))
         search_var = ttk.StringVar()
-        ttk.Entry(f, textvariable=search_var, width=30).pack(side="left")
+        search_entry = ttk.Entry(f, textvariable=search_var, width=30); search_entry.pack(side="left")
 
         btn_refresh = ttk.Button(f, text="Refresh", bootstyle="outline-secondary"); btn_refresh.pack(side="left", padx=8)
 
         # Table
         tf = ttk.Frame(content); tf.pack(fill="both", expand=True)
-        cols = ("cid","title","name","email","category","priority","status","created_at")
+        cols = ("cid","title","name","email","category","priority","status","assigned","created_at")
         tree = ttk.Treeview(tf, columns=cols, show="headings", bootstyle="info")
         tree.heading("cid", text=""); tree.column("cid", width=0, stretch=False)
         for c in cols[1:]:
             tree.heading(c, text=c.replace("_", " ").title())
-        tree.column("title", width=300); tree.column("status", width=120)
+        tree.column("title", width=300); tree.column("status", width=120); tree.column("assigned", width=120)
         tree.pack(side="left", fill="both", expand=True)
         sb = ttk.Scrollbar(tf, orient="vertical", command=tree.yview); sb.pack(side="right", fill="y"); tree.configure(yscrollcommand=sb.set)
 
@@ -333,31 +446,41 @@ def open_main():
         next_combo.pack(side="left")
         btn_update = ttk.Button(bf, text="Update Status", bootstyle="primary"); btn_update.pack(side="left", padx=8)
         btn_detail = ttk.Button(bf, text="View Details", bootstyle="secondary"); btn_detail.pack(side="left", padx=8)
+        btn_assign = ttk.Button(bf, text="Assign...", bootstyle="secondary")
+        if not my_queue: btn_assign.pack(side="left", padx=8)
 
+        @watchdog.timed("Complaints: populate")
         def populate():
+            # status/category/priority are applied by the query; search is local
             q = search_var.get().strip().lower()
-            fs = status_var.get()
             tree.delete(*tree.get_children())
             for cid, d in cache["items"]:
                 s = d.get("status", "")
-                # show behavior: ALL hides CLOSED; specific status shows only that
-                if fs == "ALL":
-                    if s == "CLOSED":
-                        continue
-                else:
-                    if s != fs:
-                        continue
                 t = d.get("title", "")
                 em = d.get("email", "")
                 if q and q not in t.lower() and q not in em.lower():
                     continue
-                vals = (cid, t[:70], d.get("name",""), em, d.get("category",""), d.get("priority",""), s, d.get("created_at",""))
+                vals = (cid, t[:70], d.get("name",""), em, d.get("category",""), d.get("priority",""), s,
+                        d.get("assigned_to_name") or "—", format_ts(d.get("created_at")))
                 tree.insert("", tk.END, values=vals, tags=(s,))
 
         def reload_data():
             L = loader(w, "Loading complaints...")
             set_status("Loading complaints...", "info")
-            def work(): return get_all_complaints()
+            # ALL = everything but CLOSED; CLOSED is only fetched when asked for
+            filters = {
+                "status": status_var.get(),
+                "category": None if category_var.get() == "ANY" else category_var.get(),
+                "priority": None if priority_var.get() == "ANY" else priority_var.get(),
+            }
+            if my_queue:
+                filters["assigned_to_uid"] = session.get("uid")
+            def work():
+                # the archive is only searched when explicitly selected
+                if filters["status"] == "ARCHIVED":
+                    return [(cid, d) for cid, d in query_archive(filters["category"], filters["priority"], fields=LIST_FIELDS)
+                            if not my_queue or d.get("assigned_to_uid") == session.get("uid")]
+                return query_complaints(fields=LIST_FIELDS, **filters)
             def done(res, exc):
                 try: L.destroy()
                 except: pass
@@ -396,24 +519,12 @@ def open_main():
                 Messagebox.show_error("Invalid state transition.", parent=w); return
             remark = simpledialog.askstring("Remark", f"Enter remark for {cur} → {nxt}:", parent=w)
             if remark is None: return
-            L = loader(w, "Updating status...")
-            def work():
-                update_complaint_status(cid, nxt)
-                add_complaint_update(cid, {
-                    "status": nxt,
-                    "remark": remark or "",
-                    "updated_by_uid": session.get("uid"),
-                    "updated_by_name": session.get("name"),
-                    "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                })
-            def done(_, exc):
-                try: L.destroy()
-                except: pass
-                if exc:
-                    Messagebox.show_error(str(exc), parent=w); return
-                toast(w, "Status updated.")
-                reload_data()
-            run_thread(w, work, done)
+            # queued locally and shown at once; the outbox sends it
+            outbox.enqueue_transition(cid, nxt, remark, session.get("uid"), session.get("name"))
+            for id_, dd in cache["items"]:
+                if id_ == cid: dd["status"] = nxt
+            populate(); on_select()
+            toast(w, "Status update queued.")
 
         btn_update.config(command=do_update)
 
@@ -422,8 +533,9 @@ def open_main():
             if not sel:
                 Messagebox.show_error("Select a complaint.", parent=w); return
             cid = tree.item(sel, "values")[0]
+            # rows only carry LIST_FIELDS; the full document is read on open
             L = loader(w, "Loading complaint...")
-            def work(): return get_complaint(cid)
+            def work(): return get_complaint(cid, include_archive=status_var.get() == "ARCHIVED")
             def done(doc, exc):
                 try: L.destroy()
                 except: pass
@@ -432,17 +544,60 @@ def open_main():
                 open_detail(cid, doc)
             run_thread(w, work, done)
 
+        def do_assign():
+            sel = tree.focus()
+            if not sel:
+                Messagebox.show_error("Select a complaint.", parent=w); return
+            vals = tree.item(sel, "values")
+            cid, category = vals[0], vals[4]
+            def work(): return [(uid, d) for uid, d in list_all_users() if d.get("role") == "staff"]
+            def done(staff, exc):
+                if exc:
+                    Messagebox.show_error(str(exc), parent=w); return
+                # staff handling this category (or any), least loaded first
+                staff = [r for r in staff if not r[1].get("categories") or category in r[1]["categories"]] or staff
+                if not staff:
+                    Messagebox.show_error("There are no staff users yet.", parent=w); return
+                staff.sort(key=lambda r: (r[1].get("open_load", 0), r[1].get("name", "")))
+                best = balancer_for(staff).pick(category)
+                labels = [f"{d.get('name','')} — {d.get('open_load', 0)} open" for _, d in staff]
+
+                dlg = tk.Toplevel(w); dlg.title("Assign Complaint"); center(dlg, 420, 170); dlg.transient(w)
+                ttk.Label(dlg, text=f"Assign \"{vals[1]}\" to:", padding=10).pack(anchor="w")
+                pick_var = ttk.StringVar(value=labels[[u for u, _ in staff].index(best[0])] if best else labels[0])
+                ttk.Combobox(dlg, textvariable=pick_var, values=labels, state="readonly", width=40).pack(padx=10)
+                def assign():
+                    uid, d = staff[labels.index(pick_var.get())]
+                    dlg.destroy()
+                    def work2(): return assign_complaint(cid, uid, d.get("name", ""), session.get("uid"), session.get("name"))
+                    def done2(changed, exc2):
+                        if exc2:
+                            Messagebox.show_error(str(exc2), parent=w); return
+                        for id_, dd in cache["items"]:
+                            if id_ == cid: dd["assigned_to_name"] = d.get("name", "")
+                        populate()
+                        toast(w, f"Assigned to {d.get('name','')}." if changed else "Already assigned to them.")
+                    run_thread(w, work2, done2)
+                ttk.Button(dlg, text="Assign", bootstyle="primary", command=assign).pack(pady=12)
+            run_thread(w, work, done)
+
+        btn_assign.config(command=do_assign)
         btn_detail.config(command=show_detail)
         btn_refresh.config(command=reload_data)
+        for cb in (status_combo, category_combo, priority_combo):
+            cb.bind("<<ComboboxSelected>>", lambda e: reload_data())
+        search_entry.bind("<Return>", lambda e: populate())
         reload_data()
 
     # ---------- Detail ----------
+    @watchdog.timed("Complaint detail")
     def open_detail(cid, doc):
         d = tk.Toplevel(main_win); d.title("Complaint Detail"); center(d, 820, 580)
         top = ttk.Frame(d, padding=10); top.pack(fill="x")
         ttk.Label(top, text=doc.get("title",""), font=("Segoe UI", 13, "bold")).pack(anchor="w")
         ttk.Label(top, text=f"User: {doc.get('name','')} <{doc.get('email','')}>").pack(anchor="w")
         ttk.Label(top, text=f"Category: {doc.get('category','')} | Priority: {doc.get('priority','')} | Status: {doc.get('status','')}").pack(anchor="w")
+        ttk.Label(top, text=f"Assigned to: {doc.get('assigned_to_name') or 'nobody yet'}").pack(anchor="w")
         pan = ttk.Panedwindow(d, orient="vertical"); pan.pack(fill="both", expand=True, padx=10, pady=8)
 
         lf1 = ttk.Labelframe(pan, text="Description", padding=8)
@@ -450,78 +605,357 @@ def open_main():
         txt.insert("1.0", doc.get("description","")); txt.config(state="disabled")
         pan.add(lf1, weight=1)
 
+        if doc.get("attachments"):
+            lf_photos = ttk.Labelframe(pan, text="Photos (click to open)", padding=8)
+            show_thumbnails(lf_photos, doc["attachments"], thumbs)
+            pan.add(lf_photos, weight=0)
+
         lf2 = ttk.Labelframe(pan, text="Timeline", padding=8)
         lst = tk.Listbox(lf2, height=10); lst.pack(fill="both", expand=True)
         pan.add(lf2, weight=1)
 
-        ttk.Button(d, text="Close", command=d.destroy).pack(pady=6)
+        bf = ttk.Frame(d); bf.pack(fill="x", padx=10, pady=6)
+        btn_full = ttk.Button(bf, text="Load full history", bootstyle="outline-secondary"); btn_full.pack(side="left")
+        ttk.Button(bf, text="Close", command=d.destroy).pack(side="right")
 
-        L = loader(d, "Loading timeline...")
-        def work2(): return get_complaint_updates(cid)
-        def done2(res, exc):
-            try: L.destroy()
-            except: pass
-            if exc:
-                lst.insert(tk.END, "Error loading timeline."); return
-            if not res:
+        def fill(updates):
+            lst.delete(0, tk.END)
+            if not updates:
                 lst.insert(tk.END, "No timeline yet."); return
-            for _, u in reversed(res):
-                lst.insert(tk.END, f"[{u.get('updated_at','')}] {u.get('status','')} by {u.get('updated_by_name','System')}")
+            for u in reversed(updates):
+                lst.insert(tk.END, f"[{format_ts(u.get('updated_at'))}] {u.get('status','')} by {u.get('updated_by_name','System')}")
                 if u.get("remark"):
                     lst.insert(tk.END, "  - " + u.get("remark", ""))
                     lst.insert(tk.END, "")
-        run_thread(d, work2, done2)
+
+        def load_full():
+            btn_full.config(state="disabled")
+            L = loader(d, "Loading timeline...")
+            def work2(): return afc.get_complaint_updates(cid, include_archive="archived_at" in doc)
+            def done2(res, exc):
+                try: L.destroy()
+                except: pass
+                if exc:
+                    lst.insert(tk.END, "Error loading timeline."); btn_full.config(state="normal"); return
+                fill([u for _, u in res])
+            run_async(d, work2, done2)
+
+        btn_full.config(command=load_full)
+        # render straight from the summary on the complaint doc; older docs
+        # without one fall back to reading the updates subcollection
+        if "recent_updates" in doc:
+            fill(doc.get("recent_updates") or [])
+        else:
+            load_full()
+
+    # ---------- Activity feed ----------
+    @watchdog.timed("Activity")
+    def activity_view():
+        clear_content(); activate(btn_act)
+        ttk.Label(content, text="Activity Feed", font=("Segoe UI", 14, "bold")).pack(anchor="w", pady=(0,6))
+
+        f = ttk.Frame(content); f.pack(fill="x", pady=6)
+        ttk.Label(f, text="Range:").pack(side="left")
+        ranges = {"Today": 0, "Last 7 days": 7, "Last 30 days": 30}
+        range_var = ttk.StringVar(value="Today")
+        ttk.Combobox(f, textvariable=range_var, values=list(ranges), width=14, state="readonly").pack(side="left", padx=8)
+        mine_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(f, text="Only my updates", variable=mine_var).pack(side="left", padx=8)
+        btn_refresh = ttk.Button(f, text="Refresh", bootstyle="outline-secondary"); btn_refresh.pack(side="left", padx=8)
+
+        tf = ttk.Frame(content); tf.pack(fill="both", expand=True)
+        cols = ("cid","updated_at","status","updated_by_name","remark")
+        tree = ttk.Treeview(tf, columns=cols, show="headings", bootstyle="info")
+        tree.heading("cid", text=""); tree.column("cid", width=0, stretch=False)
+        for c in cols[1:]:
+            tree.heading(c, text=c.replace("_", " ").title())
+        tree.column("updated_at", width=160); tree.column("status", width=120); tree.column("remark", width=420)
+        tree.pack(side="left", fill="both", expand=True)
+        sb = ttk.Scrollbar(tf, orient="vertical", command=tree.yview); sb.pack(side="right", fill="y"); tree.configure(yscrollcommand=sb.set)
+        for st, color in (("OPEN", "#d9534f"), ("IN_PROGRESS", "#0275d8"), ("RESOLVED", "#5cb85c"), ("CLOSED", "#6c757d")):
+            tree.tag_configure(st, foreground=color)
+
+        def reload_feed():
+            today = datetime.now().astimezone().replace(hour=0, minute=0, second=0, microsecond=0)
+            start = today - timedelta(days=ranges.get(range_var.get(), 0))
+            by = session.get("uid") if mine_var.get() else None
+            L = loader(w, "Loading activity...")
+            set_status("Loading activity...", "info")
+            def work(): return afc.get_recent_updates(start=start, updated_by_uid=by)
+            def done(res, exc):
+                try: L.destroy()
+                except: pass
+                if exc:
+                    Messagebox.show_error(str(exc), parent=w); return
+                tree.delete(*tree.get_children())
+                for cid, _, u in res:
+                    st = u.get("status", "")
+                    tree.insert("", tk.END, values=(cid, format_ts(u.get("updated_at")), st, u.get("updated_by_name","System"), u.get("remark","")), tags=(st,))
+                set_status(f"Loaded {len(res)} updates", "secondary")
+            run_async(w, work, done)
+
+        def open_selected(e=None):
+            sel = tree.focus()
+            if not sel: return
+            cid = tree.item(sel, "values")[0]
+            L = loader(w, "Loading complaint...")
+            def work(): return get_complaint(cid)
+            def done(doc, exc):
+                try: L.destroy()
+                except: pass
+                if exc or not doc:
+                    Messagebox.show_error("Failed to load complaint.", parent=w); return
+                open_detail(cid, doc)
+            run_thread(w, work, done)
+
+        tree.bind("<Double-1>", open_selected)
+        btn_refresh.config(command=reload_feed)
+        reload_feed()
+
+    # ---------- Overdue (past SLA, see escalation.py) ----------
+    @watchdog.timed("Overdue")
+    def overdue_view():
+        clear_content(); activate(btn_over)
+        ttk.Label(content, text="Overdue Complaints", font=("Segoe UI", 14, "bold")).pack(anchor="w", pady=(0,6))
+
+        f = ttk.Frame(content); f.pack(fill="x", pady=6)
+        ttk.Label(f, text="OPEN / IN_PROGRESS complaints past their SLA deadline, most overdue first.").pack(side="left")
+        btn_refresh = ttk.Button(f, text="Refresh", bootstyle="outline-secondary"); btn_refresh.pack(side="right", padx=8)
+
+        tf = ttk.Frame(content); tf.pack(fill="both", expand=True)
+        cols = ("cid","title","category","priority","status","due","overdue","escalations")
+        tree = ttk.Treeview(tf, columns=cols, show="headings", bootstyle="danger")
+        tree.heading("cid", text=""); tree.column("cid", width=0, stretch=False)
+        for c in cols[1:]:
+            tree.heading(c, text=c.title())
+        tree.column("title", width=280); tree.column("due", width=150); tree.column("overdue", width=90); tree.column("escalations", width=90)
+        tree.pack(side="left", fill="both", expand=True)
+        sb = ttk.Scrollbar(tf, orient="vertical", command=tree.yview); sb.pack(side="right", fill="y"); tree.configure(yscrollcommand=sb.set)
+
+        def reload_overdue():
+            L = loader(w, "Loading overdue complaints...")
+            set_status("Loading overdue complaints...", "info")
+            def work(): return get_overdue_complaints(fields=LIST_FIELDS + ("escalation_count",))
+            def done(res, exc):
+                try: L.destroy()
+                except: pass
+                if exc:
+                    Messagebox.show_error(str(exc), parent=w); return
+                now = datetime.now().astimezone()
+                tree.delete(*tree.get_children())
+                for cid, d in res:
+                    hours = (now - d["sla_due_at"]).total_seconds() / 3600
+                    late = f"{hours:.0f}h" if hours < 48 else f"{hours / 24:.0f}d"
+                    tree.insert("", tk.END, values=(cid, d.get("title",""), d.get("category",""), d.get("priority",""),
+                                                    d.get("status",""), format_ts(d["sla_due_at"]), late, d.get("escalation_count", 0)))
+                set_status(f"{len(res)} overdue complaint(s)", "danger" if res else "secondary")
+            run_thread(w, work, done)
+
+        def open_selected(e=None):
+            sel = tree.focus()
+            if not sel: return
+            cid = tree.item(sel, "values")[0]
+            L = loader(w, "Loading complaint...")
+            def work(): return get_complaint(cid)
+            def done(doc, exc):
+                try: L.destroy()
+                except: pass
+                if exc or not doc:
+                    Messagebox.show_error("Failed to load complaint.", parent=w); return
+                open_detail(cid, doc)
+            run_thread(w, work, done)
+
+        tree.bind("<Double-1>", open_selected)
+        btn_refresh.config(command=reload_overdue)
+        reload_overdue()
+
+    # ---------- Analytics (rollups only) ----------
+    @watchdog.timed("Analytics")
+    def analytics_view():
+        clear_content(); activate(btn_ana)
+        ttk.Label(content, text="Analytics", font=("Segoe UI", 14, "bold")).pack(anchor="w", pady=(0,6))
+
+        f = ttk.Frame(content); f.pack(fill="x", pady=6)
+        ttk.Label(f, text="Range:").pack(side="left")
+        ranges = {"Last 7 days": 7, "Last 30 days": 30, "Last 90 days": 90, "Last 365 days": 365}
+        range_var = ttk.StringVar(value="Last 30 days")
+        ttk.Combobox(f, textvariable=range_var, values=list(ranges), width=14, state="readonly").pack(side="left", padx=8)
+        ttk.Label(f, text="Group by:").pack(side="left", padx=(10,4))
+        groupings = {"Category": ("category",), "Priority": ("priority",), "Category + Priority": ("category", "priority")}
+        group_var = ttk.StringVar(value="Category")
+        ttk.Combobox(f, textvariable=group_var, values=list(groupings), width=18, state="readonly").pack(side="left", padx=8)
+        btn_refresh = ttk.Button(f, text="Refresh", bootstyle="outline-secondary"); btn_refresh.pack(side="left", padx=8)
+
+        tf = ttk.Frame(content); tf.pack(fill="both", expand=True)
+        buckets = [b for b, _ in analytics.RESOLVE_BUCKETS]
+        cols = ("group", "created", "resolved", "avg") + tuple(buckets)
+        tree = ttk.Treeview(tf, columns=cols, show="headings", bootstyle="info")
+        tree.heading("group", text="Group"); tree.column("group", width=220)
+        tree.heading("created", text="Created"); tree.heading("resolved", text="Resolved"); tree.heading("avg", text="Avg to Resolve")
+        for c in cols[1:]:
+            tree.column(c, width=90, anchor="e")
+        for b in buckets:
+            tree.heading(b, text=b.replace("_", " "))
+        tree.pack(side="left", fill="both", expand=True)
+        sb = ttk.Scrollbar(tf, orient="vertical", command=tree.yview); sb.pack(side="right", fill="y"); tree.configure(yscrollcommand=sb.set)
+
+        def reload_stats():
+            days = ranges.get(range_var.get(), 30); by = groupings.get(group_var.get(), ("category",))
+            L = loader(w, "Loading analytics...")
+            start = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+            async def work(): return analytics.summarize(await afc.get_rollups(start), by=by)
+            def done(res, exc):
+                try: L.destroy()
+                except: pass
+                if exc:
+                    Messagebox.show_error(str(exc), parent=w); return
+                tree.delete(*tree.get_children())
+                for key, st in sorted(res.items()):
+                    avg = f"{st['avg_hours']:.1f} h" if st["avg_hours"] is not None else "-"
+                    tree.insert("", tk.END, values=(" / ".join(key), st["created"], st["resolved"], avg) + tuple(st["hist"][b] for b in buckets))
+                set_status(f"Analytics: {len(res)} groups over {days} days", "secondary")
+            run_async(w, work, done)
+
+        btn_refresh.config(command=reload_stats)
+        reload_stats()
 
     # ---------- Users (admin only) ----------
+    @watchdog.timed("Users")
     def users_view():
         clear_content(); activate(btn_users)
         if session.get("role") != "admin":
             Messagebox.show_error("Only admins can manage users.", parent=main_win); return
         ttk.Label(content, text="User Management", font=("Segoe UI", 14, "bold")).pack(anchor="w", pady=6)
+
+        # Filters: prefix search on email or name, optional role
+        f = ttk.Frame(content); f.pack(fill="x", pady=6)
+        ttk.Label(f, text="Search:").pack(side="left")
+        q_var = ttk.StringVar()
+        q_entry = ttk.Entry(f, textvariable=q_var, width=30); q_entry.pack(side="left", padx=6)
+        ttk.Label(f, text="in").pack(side="left")
+        field_var = ttk.StringVar(value="email")
+        field_combo = ttk.Combobox(f, textvariable=field_var, values=("email", "name"), width=8, state="readonly"); field_combo.pack(side="left", padx=6)
+        ttk.Label(f, text="Role:").pack(side="left", padx=(10, 0))
+        role_var = ttk.StringVar(value="ANY")
+        role_combo = ttk.Combobox(f, textvariable=role_var, values=("ANY",) + ROLES, width=8, state="readonly"); role_combo.pack(side="left", padx=6)
+        btn_search = ttk.Button(f, text="Search", bootstyle="outline-secondary"); btn_search.pack(side="left", padx=6)
+
         tf = ttk.Frame(content); tf.pack(fill="both", expand=True)
-        cols = ("uid", "email", "name", "role")
-        tree = ttk.Treeview(tf, columns=cols, show="headings", bootstyle="info")
+        cols = ("uid", "email", "name", "role", "open", "categories")
+        tree = ttk.Treeview(tf, columns=cols, show="headings", bootstyle="info", selectmode="extended")
         for c in cols:
             tree.heading(c, text=c.title()); tree.column(c, width=200)
+        tree.column("open", width=60)
         tree.pack(side="left", fill="both", expand=True)
         sb = ttk.Scrollbar(tf, orient="vertical", command=tree.yview); sb.pack(side="right", fill="y"); tree.configure(yscrollcommand=sb.set)
-        bf = ttk.Frame(content); bf.pack(fill="x", pady=8)
-        btn_change = ttk.Button(bf, text="Change Role", bootstyle="primary"); btn_change.pack(side="left")
 
-        def reload_users():
-            L = loader(main_win, "Loading users...")
-            def work(): return list_all_users()
+        bf = ttk.Frame(content); bf.pack(fill="x", pady=8)
+        btn_prev = ttk.Button(bf, text="◀ Prev", bootstyle="outline-secondary", state="disabled"); btn_prev.pack(side="left")
+        page_lbl = ttk.Label(bf, text="Page 1"); page_lbl.pack(side="left", padx=8)
+        btn_next = ttk.Button(bf, text="Next ▶", bootstyle="outline-secondary", state="disabled"); btn_next.pack(side="left")
+        btn_change = ttk.Button(bf, text="Set Role for Selected", bootstyle="primary"); btn_change.pack(side="right")
+        new_role = ttk.StringVar(value="staff")
+        ttk.Combobox(bf, textvariable=new_role, values=ROLES, width=8, state="readonly").pack(side="right", padx=6)
+        btn_cats = ttk.Button(bf, text="Categories...", bootstyle="outline-primary"); btn_cats.pack(side="right", padx=6)
+
+        # cursors[i] is where page i starts; search_users hands back the next one
+        pages = {"cursors": [None], "i": 0, "next": None}
+
+        def load_page():
+            filters = dict(prefix=q_var.get().strip(), field=field_var.get(),
+                           role=None if role_var.get() == "ANY" else role_var.get())
+            after = pages["cursors"][pages["i"]]
+            def work(): return search_users(limit=USERS_PAGE, after=after, **filters)
             def done(res, exc):
-                try: L.destroy()
-                except: pass
                 if exc:
                     Messagebox.show_error(str(exc), parent=main_win); return
+                rows, pages["next"] = res
                 tree.delete(*tree.get_children())
-                for uid, doc in res:
-                    tree.insert("", tk.END, values=(uid, doc.get("email",""), doc.get("name",""), doc.get("role","")))
-            run_thread(main_win, work, done)
+                for uid, doc in rows:
+                    tree.insert("", tk.END, values=(uid, doc.get("email",""), doc.get("name",""), doc.get("role",""),
+                                                    doc.get("open_load", "") if doc.get("role") == "staff" else "",
+                                                    ", ".join(doc.get("categories") or ())))
+                page_lbl.config(text=f"Page {pages['i'] + 1}")
+                btn_prev.config(state="normal" if pages["i"] > 0 else "disabled")
+                btn_next.config(state="normal" if pages["next"] else "disabled")
+            run_thread(tree, work, done)
+
+        def search():
+            pages.update(cursors=[None], i=0, next=None); load_page()
+
+        def next_page():
+            if not pages["next"]: return
+            del pages["cursors"][pages["i"] + 1:]
+            pages["cursors"].append(pages["next"]); pages["i"] += 1; load_page()
+
+        def prev_page():
+            if pages["i"] == 0: return
+            pages["i"] -= 1; load_page()
+
+        # the directory is kept current by a listener; re-render the page
+        # when anyone's profile changes
+        def on_users_changed(_uids):
+            def cb():
+                try:
+                    alive = tree.winfo_exists()
+                except tk.TclError:
+                    alive = False
+                if not alive:
+                    directory.unsubscribe(on_users_changed); return
+                load_page()
+            try: root.after(1, cb)
+            except tk.TclError: pass
 
         def change_role():
-            sel = tree.focus()
-            if not sel:
-                Messagebox.show_error("Select a user.", parent=main_win); return
-            uid, email, name, role = tree.item(sel, "values")
-            new = simpledialog.askstring("Role", f"{name} ({email})\nCurrent role: {role}\nEnter new role (user/staff/admin):", parent=main_win)
-            if not new or new not in ("user", "staff", "admin"):
+            uids = [tree.item(i, "values")[0] for i in tree.selection()]
+            if not uids:
+                Messagebox.show_error("Select one or more users.", parent=main_win); return
+            role = new_role.get()
+            if role not in ROLES:
                 Messagebox.show_error("Invalid role.", parent=main_win); return
-            L = loader(main_win, "Updating role...")
-            def work(): db.collection("users").document(uid).update({"role": new})
+            if Messagebox.yesno("Role", f"Set role '{role}' for {len(uids)} user(s)?", parent=main_win) != "Yes":
+                return
+            L = loader(main_win, "Updating roles...")
+            def work(): set_user_roles(uids, role)
             def done(_, exc):
                 try: L.destroy()
                 except: pass
                 if exc: Messagebox.show_error(str(exc), parent=main_win); return
-                toast(main_win, "Role updated."); reload_users()
+                toast(main_win, f"Role updated for {len(uids)} user(s)."); load_page()
+            run_thread(main_win, work, done)
+
+        def set_categories():
+            # which categories auto-assignment hands these staff (empty = any)
+            uids = [tree.item(i, "values")[0] for i in tree.selection()]
+            if not uids:
+                Messagebox.show_error("Select one or more users.", parent=main_win); return
+            text = simpledialog.askstring("Categories", f"Categories for {len(uids)} user(s), comma separated\n"
+                                          f"({', '.join(CATEGORIES)}; empty = any):", parent=main_win)
+            if text is None: return
+            cats = [c.strip() for c in text.split(",") if c.strip()]
+            bad = [c for c in cats if c not in CATEGORIES]
+            if bad:
+                Messagebox.show_error(f"Unknown categories: {', '.join(bad)}", parent=main_win); return
+            def work():
+                for uid in uids: update_user(uid, {"categories": cats})
+            def done(_, exc):
+                if exc: Messagebox.show_error(str(exc), parent=main_win); return
+                toast(main_win, f"Categories updated for {len(uids)} user(s)."); load_page()
             run_thread(main_win, work, done)
 
+        btn_search.config(command=search)
+        btn_cats.config(command=set_categories)
+        btn_next.config(command=next_page)
+        btn_prev.config(command=prev_page)
         btn_change.config(command=change_role)
-        reload_users()
+        q_entry.bind("<Return>", lambda e: search())
+        for cb in (field_combo, role_combo):
+            cb.bind("<<ComboboxSelected>>", lambda e: search())
+        directory.subscribe(on_users_changed)
+        search()
 
     # ---------- Profile ----------
+    @watchdog.timed("Profile")
     def profile_view():
         clear_content(); activate(btn_prof)
         ttk.Label(content, text="My Profile", font=("Segoe UI", 14, "bold")).pack(anchor="w", pady=6)
@@ -537,7 +971,7 @@ def open_main():
             new_name = name_var.get().strip()
             if not new_name: return
             L = loader(main_win, "Saving...")
-            def work(): db.collection("users").document(session.get("uid")).update({"name": new_name})
+            def work(): update_user(session.get("uid"), {"name": new_name})
             def done(_, exc):
                 try: L.destroy()
                 except: pass
@@ -549,14 +983,19 @@ def open_main():
     # Sidebar buttons
     btn_dash = ttk.Button(sidebar, text="Dashboard", bootstyle="secondary-outline", command=dashboard_view); btn_dash.pack(fill="x", pady=6)
     btn_comp = ttk.Button(sidebar, text="Complaints", bootstyle="secondary-outline", command=complaints_view); btn_comp.pack(fill="x", pady=6)
+    btn_act = ttk.Button(sidebar, text="Activity", bootstyle="secondary-outline", command=activity_view); btn_act.pack(fill="x", pady=6)
+    btn_over = ttk.Button(sidebar, text="Overdue", bootstyle="secondary-outline", command=overdue_view); btn_over.pack(fill="x", pady=6)
+    btn_ana = ttk.Button(sidebar, text="Analytics", bootstyle="secondary-outline", command=analytics_view); btn_ana.pack(fill="x", pady=6)
     btn_prof = ttk.Button(sidebar, text="My Profile", bootstyle="secondary-outline", command=profile_view); btn_prof.pack(fill="x", pady=6)
     btn_users = None
     if session.get("role") == "admin":
         btn_users = ttk.Button(sidebar, text="Users", bootstyle="secondary-outline", command=users_view); btn_users.pack(fill="x", pady=6)
+        run_thread(None, directory.start)  # warm the user directory in the background
 
     dashboard_view()
     # handle window close
     def on_close():
+        outbox_handlers.clear(); directory.stop()
         try: w.destroy()
         except: pass
         open_login()
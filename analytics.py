@@ -0,0 +1,143 @@
+# analytics.py
+"""
+SLA / resolution-time analytics over the precomputed rollup documents.
+
+The rollups (collection 'analytics_rollups') are maintained incrementally by
+firebase_client on every complaint creation and status transition. This
+module aggregates them for the admin Analytics view and can rebuild them
+from scratch with a local batch job:
+
+    python analytics.py rebuild
+    python analytics.py summary --days 30
+"""
+
+import argparse
+import itertools
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import firebase_client
+from firebase_client import ROLLUP_COLLECTION, collection, db, get_rollups
+from schema import RESOLVE_BUCKETS, rollup_delta, rollup_id
+
+BATCH_SIZE = 400
+
+
+# -------------------------------------------------------
+# AGGREGATION (reads rollups only)
+# -------------------------------------------------------
+def summarize(rollups, by=("category",)):
+    """
+    Merge rollup documents grouped by the given keys
+    (any of 'day', 'category', 'priority').
+    Returns {group_tuple: {"created", "resolved", "avg_hours", "entered", "hist"}}.
+    """
+    groups = defaultdict(lambda: {
+        "created": 0,
+        "resolved": 0,
+        "seconds": 0.0,
+        "entered": defaultdict(int),
+        "hist": defaultdict(int),
+    })
+    for r in rollups:
+        g = groups[tuple(r.get(k, "") for k in by)]
+        g["created"] += r.get("created", 0)
+        g["resolved"] += r.get("resolved_count", 0)
+        g["seconds"] += r.get("resolve_seconds_sum", 0)
+        for st, n in (r.get("entered") or {}).items():
+            g["entered"][st] += n
+        for b, n in (r.get("resolve_hist") or {}).items():
+            g["hist"][b] += n
+
+    out = {}
+    for key, g in groups.items():
+        out[key] = {
+            "created": g["created"],
+            "resolved": g["resolved"],
+            "avg_hours": (g["seconds"] / g["resolved"] / 3600) if g["resolved"] else None,
+            "entered": dict(g["entered"]),
+            "hist": {b: g["hist"].get(b, 0) for b, _ in RESOLVE_BUCKETS},
+        }
+    return out
+
+
+def load_summary(days=30, by=("category",)):
+    start = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+    return summarize(get_rollups(start), by=by)
+
+
+# -------------------------------------------------------
+# BATCH REBUILD
+# -------------------------------------------------------
+def compute_rollups(complaints):
+    """
+    Rebuild rollup counters from complaint documents alone, using
+    created_at and the status_times summary (latest entry per status).
+    """
+    rollups = {}
+    for _, d in complaints:
+        events = [("CREATED", d.get("created_at"))]
+        events += [(st, at) for st, at in (d.get("status_times") or {}).items() if st != "OPEN"]
+        for event, at in events:
+            res = rollup_delta(d, event, at)
+            if res is None:
+                continue
+            day, category, priority, delta = res
+            doc = rollups.setdefault(
+                rollup_id(day, category, priority),
+                {"day": day, "category": category, "priority": priority},
+            )
+            for path, value in delta.items():
+                node = doc
+                *parents, leaf = path.split(".")
+                for p in parents:
+                    node = node.setdefault(p, {})
+                node[leaf] = node.get(leaf, 0) + value
+    return rollups
+
+
+def rebuild_rollups():
+    """Recompute every rollup document and overwrite the collection."""
+    # parallel scans, consumed as they stream in; archived complaints still
+    # count towards history
+    fields = ("created_at", "status_times", "category", "priority")
+    complaints = itertools.chain(
+        firebase_client.scan_collection("complaints", fields=fields),
+        firebase_client.scan_collection(firebase_client.ARCHIVE_COLLECTION, fields=fields),
+    )
+    rollups = compute_rollups(complaints)
+    col = collection(ROLLUP_COLLECTION)
+
+    stale = [d.reference for d in col.stream() if d.id not in rollups]
+    batch, n = db.batch(), 0
+    for ref in stale:
+        batch.delete(ref); n += 1
+        if n % BATCH_SIZE == 0:
+            batch.commit(); batch = db.batch()
+    for rid, doc in rollups.items():
+        batch.set(col.document(rid), doc); n += 1
+        if n % BATCH_SIZE == 0:
+            batch.commit(); batch = db.batch()
+    batch.commit()
+    return len(rollups), len(stale)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="CRTS analytics rollups")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("rebuild", help="recompute all rollup documents from complaints")
+    p_sum = sub.add_parser("summary", help="print resolution times per category/priority")
+    p_sum.add_argument("--days", type=int, default=30)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "rebuild":
+        written, deleted = rebuild_rollups()
+        print(f"Wrote {written} rollup documents, removed {deleted} stale.")
+    else:
+        for (cat, pr), s in sorted(load_summary(args.days, by=("category", "priority")).items()):
+            avg = f"{s['avg_hours']:.1f}h" if s["avg_hours"] is not None else "-"
+            print(f"{cat:<12} {pr:<9} created={s['created']:<5} resolved={s['resolved']:<5} avg={avg}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+# api_server.py
+"""
+Headless REST/JSON service over the complaint API, for web and kiosk clients.
+
+    python api_server.py --backend memory --seed      # local, no Firebase
+    python api_server.py --backend firestore --port 8080
+
+One process holds the backend (one Firestore client / gRPC channel) and a
+shared response cache, so any number of clients reuse a warm backend. Lists
+are indexed, projected (LIST_FIELDS) and limited queries, and /stats reads
+the sharded status counter, so no request downloads the collection.
+Responses carry an ETag; clients that send If-None-Match get 304 Not
+Modified while the data is unchanged.
+
+Auth: every route except /auth/* needs "Authorization: Bearer <idToken>"
+(a Firebase ID token, or a token from /auth/signin on the memory backend).
+
+Routes
+    POST /auth/signup                     {email, password, name}
+    POST /auth/signin                     {email, password}
+    GET  /complaints?status=&limit=&cursor=   (list fields only; cursor from next_cursor)
+    POST /complaints                      {title, description, category, ...}
+                                          (Idempotency-Key header: the new doc id)
+    GET  /complaints/{id}
+    GET  /complaints/{id}/timeline
+    POST /complaints/{id}/transition      {status, remark}   (staff/admin, Idempotency-Key)
+    GET  /stats
+"""
+
+import argparse
+import asyncio
+import hashlib
+import inspect
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from aiohttp import web
+
+from schema import (
+    ALLOWED_TRANSITIONS, LIST_FIELDS, STATUSES, InvalidTransition, now_ts, sort_newest, to_datetime,
+    validate_complaint,
+)
+
+CACHE_TTL = 30          # seconds a cached response stays fresh
+USER_TTL = 300          # seconds a resolved token -> user profile is reused
+DEFAULT_PAGE = 50
+MAX_PAGE = 500
+IDEMPOTENCY_KEY = re.compile(r"^[A-Za-z0-9_-]{8,128}$")
+
+
+# -------------------------------------------------------
+# HELPERS
+# -------------------------------------------------------
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _dumps(data) -> bytes:
+    return json.dumps(data, default=_json_default, separators=(",", ":")).encode("utf-8")
+
+
+def _error(status, message):
+    return web.json_response({"error": message}, status=status)
+
+
+async def _body(request) -> dict:
+    """The request's JSON object; 400 if it is missing or malformed."""
+    try:
+        body = await request.json()
+    except ValueError:  # json.JSONDecodeError included
+        raise web.HTTPBadRequest(text="Body must be valid JSON")
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text="Body must be a JSON object")
+    return body
+
+
+# List order is (created_at desc, id asc); rows without a date sort last.
+_FLOOR = datetime.min.replace(tzinfo=timezone.utc)
+
+
+def _position(cid, doc):
+    return to_datetime(doc.get("created_at")) or _FLOOR, cid
+
+
+def _cursor(cid, doc):
+    """Opaque list cursor: the last row's created_at and id."""
+    at, _ = _position(cid, doc)
+    return f"{at.isoformat()}~{cid}"
+
+
+def _parse_cursor(cursor):
+    """(created_at, id) of a cursor; ValueError if it is not one of ours."""
+    at, sep, cid = cursor.partition("~")
+    if not sep or not cid:
+        raise ValueError(cursor)
+    return to_datetime(datetime.fromisoformat(at)), cid
+
+
+def _after(items, position):
+    """Rows that come after position in list order."""
+    at, cid = position
+    out = []
+    for c, d in items:
+        t, _ = _position(c, d)
+        if t < at or (t == at and c > cid):
+            out.append((c, d))
+    return out
+
+
+class TTLCache:
+    """Tiny time-based cache; clear() on every write keeps it consistent."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.items = {}
+
+    def get(self, key):
+        hit = self.items.get(key)
+        if hit and hit[0] > time.monotonic():
+            return hit[1]
+        self.items.pop(key, None)
+        return None
+
+    def put(self, key, value):
+        self.items[key] = (time.monotonic() + self.ttl, value)
+        return value
+
+    def clear(self):
+        self.items.clear()
+
+
+class Service:
+    def __init__(self, backend, workers=16, cache_ttl=CACHE_TTL):
+        self.backend = backend
+        # bounded pool shared by all requests for blocking backends
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="crts-api")
+        self.responses = TTLCache(cache_ttl)
+        self.users = TTLCache(USER_TTL)
+
+    async def call(self, name, *args, **kwargs):
+        fn = getattr(self.backend, name)
+        if inspect.iscoroutinefunction(fn):
+            return await fn(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, lambda: fn(*args, **kwargs))
+
+    def invalidate(self):
+        self.responses.clear()
+
+    async def user_for(self, request):
+        header = request.headers.get("Authorization", "")
+        if not header.startswith("Bearer "):
+            raise web.HTTPUnauthorized(text="Missing bearer token")
+        token = header[len("Bearer "):].strip()
+        user = self.users.get(token)
+        if user is None:
+            try:
+                uid = await self.call("verify_id_token", token)
+            except Exception:
+                raise web.HTTPUnauthorized(text="Invalid token")
+            doc = await self.call("get_user_doc", uid) or {}
+            user = self.users.put(token, {"uid": uid, **doc, "role": doc.get("role", "user")})
+        return user
+
+    async def cached_json(self, request, key, build):
+        """
+        Serve key from the response cache (awaiting build() on a miss) with
+        an ETag; 304 when the client already has this version.
+        """
+        hit = self.responses.get(key)
+        if hit is None:
+            body = _dumps(await build())
+            hit = self.responses.put(key, (body, '"%s"' % hashlib.sha1(body).hexdigest()))
+        body, etag = hit
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(body=body, content_type="application/json", headers={"ETag": etag})
+
+
+# -------------------------------------------------------
+# ROUTES
+# -------------------------------------------------------
+def build_app(backend, workers=16, cache_ttl=CACHE_TTL):
+    svc = Service(backend, workers, cache_ttl)
+    routes = web.RouteTableDef()
+
+    def visible(user, doc):
+        return user["role"] in ("staff", "admin") or doc.get("created_by_uid") == user["uid"]
+
+    @routes.post("/auth/signup")
+    async def signup(request):
+        body = await _body(request)
+        try:
+            res = await svc.call("signup_with_email_password", body.get("email", ""), body.get("password", ""))
+        except Exception as e:
+            return _error(400, str(e))
+        await svc.call("create_user_doc", res["localId"], body.get("email", ""), body.get("name") or "Unnamed User", "user")
+        return web.json_response({"uid": res["localId"], "idToken": res["idToken"]})
+
+    @routes.post("/auth/signin")
+    async def signin(request):
+        body = await _body(request)
+        try:
+            res = await svc.call("signin_with_email_password", body.get("email", ""), body.get("password", ""))
+        except Exception as e:
+            return _error(401, str(e))
+        return web.json_response({"uid": res["localId"], "idToken": res["idToken"]})
+
+    @routes.get("/complaints")
+    async def list_complaints(request):
+        user = await svc.user_for(request)
+        status = request.query.get("status", "ALL").upper()
+        if status != "ALL" and status not in STATUSES:
+            return _error(400, f"Unknown status {status}")
+        cursor = request.query.get("cursor")
+        try:
+            limit = max(1, min(int(request.query.get("limit", DEFAULT_PAGE)), MAX_PAGE))
+        except ValueError:
+            return _error(400, "limit must be an integer")
+        try:
+            position = _parse_cursor(cursor) if cursor else None
+        except ValueError:
+            return _error(400, "Invalid cursor")
+        scope = user["uid"] if user["role"] not in ("staff", "admin") else "*"
+
+        async def build():
+            filters = {"status": None if status == "ALL" else status, "fields": LIST_FIELDS}
+            if scope != "*":
+                filters["created_by_uid"] = scope
+            created_to = None
+            if position and position[0] != _FLOOR:
+                # a second past the cursor: legacy string dates have whole
+                # seconds; rows up to the cursor are dropped by _after()
+                created_to = position[0] + timedelta(seconds=1)
+            fetch = limit + 1
+            while True:
+                rows = await svc.call("query_complaints", created_to=created_to, limit=fetch, **filters)
+                items = sort_newest(sorted(rows, key=lambda r: r[0]), "created_at")
+                if position:
+                    items = _after(items, position)
+                if len(items) > limit or len(rows) < fetch:
+                    break
+                fetch *= 2  # rows sharing the cursor's second used up the limit
+            page = items[:limit]
+            nxt = _cursor(*page[-1]) if len(items) > limit else None
+            return {"items": [{"id": cid, **d} for cid, d in page], "next_cursor": nxt}
+
+        return await svc.cached_json(request, ("list", scope, status, cursor, limit), build)
+
+    @routes.post("/complaints")
+    async def create(request):
+        user = await svc.user_for(request)
+        body = await _body(request)
+        data, errors = validate_complaint({
+            **body,
+            "status": "OPEN",
+            "created_at": now_ts(),
+            "created_by_uid": user["uid"],
+            "name": user.get("name", ""),
+            "email": user.get("email", ""),
+        })
+        if errors:
+            return _error(400, "; ".join(errors))
+        # a retried POST with the same key returns the existing complaint
+        key = request.headers.get("Idempotency-Key")
+        if key is not None and not IDEMPOTENCY_KEY.match(key):
+            return _error(400, "Idempotency-Key must be 8-128 characters of [A-Za-z0-9_-]")
+        written, ref = await svc.call("create_complaint_doc", data, doc_id=key)
+        svc.invalidate()
+        return web.json_response({"id": ref.id}, status=201 if written is not None else 200)
+
+    async def load_visible(request):
+        user = await svc.user_for(request)
+        cid = request.match_info["cid"]
+        doc = await svc.call("get_complaint", cid)
+        if doc is None or not visible(user, doc):
+            raise web.HTTPNotFound(text="No such complaint")
+        return user, cid, doc
+
+    @routes.get("/complaints/{cid}")
+    async def get_one(request):
+        _, cid, doc = await load_visible(request)
+
+        async def build():
+            return {"id": cid, **doc}
+
+        return await svc.cached_json(request, ("doc", cid), build)
+
+    @routes.get("/complaints/{cid}/timeline")
+    async def timeline(request):
+        _, cid, _ = await load_visible(request)
+
+        async def build():
+            return [{"id": uid, **u} for uid, u in await svc.call("get_complaint_updates", cid)]
+
+        return await svc.cached_json(request, ("timeline", cid), build)
+
+    @routes.post("/complaints/{cid}/transition")
+    async def transition(request):
+        user, cid, doc = await load_visible(request)
+        if user["role"] not in ("staff", "admin"):
+            return _error(403, "Only staff/admin can change status")
+        body = await _body(request)
+        nxt = str(body.get("status", "")).upper()
+        if nxt not in ALLOWED_TRANSITIONS.get(doc.get("status"), []):
+            return _error(409, f"Invalid transition {doc.get('status')} -> {nxt}")
+        key = request.headers.get("Idempotency-Key")
+        if key is not None and not IDEMPOTENCY_KEY.match(key):
+            return _error(400, "Idempotency-Key must be 8-128 characters of [A-Za-z0-9_-]")
+        try:
+            update = await svc.call("transition_complaint", cid, nxt, body.get("remark", ""), user["uid"],
+                                    user.get("name", ""), update_id=key)
+        except InvalidTransition as e:
+            # the status moved on since load_visible() read it
+            return _error(409, str(e))
+        svc.invalidate()
+        return web.Response(body=_dumps(update), content_type="application/json")
+
+    @routes.get("/stats")
+    async def stats(request):
+        user = await svc.user_for(request)
+        scope = user["uid"] if user["role"] not in ("staff", "admin") else "*"
+
+        async def build():
+            counts = {s: 0 for s in STATUSES}
+            totals = await svc.call("get_counter") if scope == "*" else None
+            if totals is not None:
+                counts.update({s: n for s, n in totals.items() if s in counts})
+                return counts
+            # a student's own complaints, or a counter that was never built
+            rows = await svc.call("query_complaints", created_by_uid=None if scope == "*" else scope,
+                                  fields=("status",))
+            for _, d in rows:
+                if d.get("status") in counts:
+                    counts[d["status"]] += 1
+            return counts
+
+        return await svc.cached_json(request, ("stats", scope), build)
+
+    app = web.Application()
+    app.add_routes(routes)
+    app["service"] = svc
+    return app
+
+
+def seed_memory_store(store):
+    """Demo accounts for local runs (password 'password' for all)."""
+    for email, name, role in (
+        ("admin@example.com", "Admin", "admin"),
+        ("staff@example.com", "Staff", "staff"),
+        ("student@example.com", "Student", "user"),
+    ):
+        res = store.signup_with_email_password(email, "password")
+        store.create_user_doc(res["localId"], email, name, role)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="CRTS REST/JSON API")
+    ap.add_argument("--backend", choices=("memory", "firestore"), default="memory")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8080)
+    ap.add_argument("--workers", type=int, default=16, help="backend thread pool size")
+    ap.add_argument("--cache-ttl", type=int, default=CACHE_TTL)
+    ap.add_argument("--seed", action="store_true", help="create demo accounts (memory backend)")
+    args = ap.parse_args(argv)
+
+    if args.backend == "memory":
+        from memory_store import MemoryStore
+        backend = MemoryStore()
+        if args.seed:
+            seed_memory_store(backend)
+    else:
+        import firebase_client as backend
+
+    web.run_app(build_app(backend, args.workers, args.cache_ttl), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
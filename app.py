@@ -1,14 +1,15 @@
 # app.py
 import tkinter as tk
 from tkinter import ttk, messagebox
-from datetime import datetime
 from firebase_client import (
     signup_with_email_password, signin_with_email_password,
     create_user_doc, get_user_doc, create_complaint_doc,
-    get_complaint, update_complaint_status, add_complaint_update,
-    get_complaint_updates, list_all_users, get_all_complaints as get_all_complaints_fn
+    get_complaint, transition_complaint,
+    get_complaint_updates, list_all_users, get_all_complaints as get_all_complaints_fn,
+    now_ts, format_ts
 )
 import firebase_client
+from schema import new_doc_id
 
 # NOTE: Some imports above refer to functions defined in firebase_client.py and models.py
 # Make sure files are in the same folder and FIREBASE_API_KEY is set.
@@ -135,6 +136,8 @@ def show_main_window():
     ttk.Label(top, text="Description:").grid(row=1, column=0, sticky="nw", pady=6)
     desc_text = tk.Text(top, width=80, height=4); desc_text.grid(row=1, column=1, columnspan=5, pady=6, sticky="w")
 
+    form = {"id": new_doc_id()}  # reused until the create succeeds
+
     def on_create_complaint():
         title = title_var.get().strip()
         category = category_var.get().strip() or "General"
@@ -151,11 +154,12 @@ def show_main_window():
             "description": description,
             "priority": priority,
             "status": "OPEN",
-            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "created_at": now_ts(),
             "created_by_uid": session.get("uid")
         }
         try:
-            create_complaint_doc(doc)
+            create_complaint_doc(doc, doc_id=form["id"])
+            form["id"] = new_doc_id()
             messagebox.showinfo("Success", "Complaint created.")
             title_var.set(""); category_var.set(""); desc_text.delete("1.0", tk.END)
             load_complaints()
@@ -199,7 +203,7 @@ def show_main_window():
                     d.get("category", ""),
                     d.get("priority", ""),
                     d.get("status", ""),
-                    d.get("created_at", "")
+                    format_ts(d.get("created_at"))
                 ))
         except Exception as e:
             messagebox.showerror("Error loading complaints", str(e))
@@ -222,15 +226,8 @@ def show_main_window():
             return
         remark = tk.simpledialog.askstring("Remark", "Enter remark (optional):")
         try:
-            update_complaint_status(cid, new_status)
-            # add update entry
-            add_complaint_update(cid, {
-                "status": new_status,
-                "remark": remark or "",
-                "updated_by_uid": session.get("uid"),
-                "updated_by_name": session.get("name"),
-                "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            })
+            # status, timeline entry, SLA and counters in one transaction
+            transition_complaint(cid, new_status, remark or "", session.get("uid"), session.get("name"))
             messagebox.showinfo("Success", "Status updated.")
             load_complaints()
         except Exception as e:
@@ -263,7 +260,7 @@ def show_main_window():
         listbox = tk.Listbox(detail_win, height=8)
         listbox.pack(fill=tk.BOTH, padx=8, pady=4, expand=True)
         for uid, u in updates:
-            ts = u.get("updated_at", "")
+            ts = format_ts(u.get("updated_at"))
             st = u.get("status", "")
             by = u.get("updated_by_name", "")
             rk = u.get("remark", "")
@@ -301,7 +298,7 @@ def show_main_window():
                 messagebox.showerror("Invalid", "Role must be user/staff/admin")
                 return
             # update in Firestore
-            firebase_client.db.collection("users").document(uid).update({"role": new_role})
+            firebase_client.update_user(uid, {"role": new_role})
             messagebox.showinfo("Success", "Role updated")
             admin_win.destroy()
         btn_promote = ttk.Button(admin_win, text="Change Role", command=promote)
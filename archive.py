@@ -0,0 +1,178 @@
+# archive.py
+"""
+Move complaints that have been CLOSED for a while out of the hot
+`complaints` collection, together with their `updates`.
+
+    python archive.py --days 90                   # into complaints_archive
+    python archive.py --days 90 --to-dir archive  # gzip JSONL snapshots
+    python archive.py --days 365 --dry-run
+
+A complaint is archived once it is CLOSED and its status_changed_at (the
+time of the CLOSED transition) is older than --days; documents written
+before status_changed_at existed are matched on updated_at. Candidates are read in pages
+and each page is written with batched writes: the copies are committed
+before the deletes, so an interrupted run leaves at worst a complaint that
+exists in both places. Re-running simply picks it up again (the copy is an
+overwrite), so no checkpoint file is needed.
+
+With --to-dir each run appends to its own archive-<timestamp>.jsonl.gz
+file (one line per complaint: id, doc, updates), which is flushed to disk
+before the originals are deleted. read_snapshots() reads them back.
+
+Rollups are left as they are, so Analytics keeps counting archived
+complaints; the dashboard's CLOSED counter is decremented with the deletes.
+Archived data is only read on request, via firebase_client.query_archive()
+/ get_complaint(..., include_archive=True).
+"""
+
+import argparse
+import glob
+import gzip
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+from firebase_client import (
+    ARCHIVE_COLLECTION, ARCHIVE_UPDATES, archive_decrement, closed_before_queries, collection, db,
+    forget_status_counter, now_ts,
+)
+
+BATCH_SIZE = 400
+PAGE_SIZE = 100
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def candidates(cutoff, page_size=PAGE_SIZE):
+    """Yield pages of complaint snapshots CLOSED before cutoff."""
+    seen = set()
+    for field, base in closed_before_queries(cutoff):
+        last = None
+        while True:
+            q = base.limit(page_size)
+            if last is not None:
+                q = q.start_after(last)
+            rows = list(q.stream())
+            if not rows:
+                break
+            last = rows[-1]
+            page = []
+            for snap in rows:
+                # the updated_at pass is only for documents without status_changed_at
+                if snap.id in seen or (field == "updated_at" and "status_changed_at" in (snap.to_dict() or {})):
+                    continue
+                seen.add(snap.id)
+                page.append(snap)
+            if page:
+                yield page
+
+
+def commit_ops(ops, dry_run=False):
+    """
+    Apply ops in order, at most BATCH_SIZE per commit. Each op is a
+    (kind, ref, data) tuple or a list of them that must share a batch.
+    """
+    if dry_run:
+        return
+    batch, n = db.batch(), 0
+    for op in ops:
+        group = op if isinstance(op, list) else [op]
+        if n and n + len(group) > BATCH_SIZE:
+            batch.commit()
+            batch, n = db.batch(), 0
+        for kind, ref, data in group:
+            if kind == "set":
+                batch.set(ref, data)
+            elif kind == "merge":
+                batch.set(ref, data, merge=True)
+            else:
+                batch.delete(ref)
+        n += len(group)
+    if n:
+        batch.commit()
+
+
+def archive_page(page, snapshot=None, dry_run=False):
+    copies, deletes = [], []
+    archive_col = collection(ARCHIVE_COLLECTION)
+    for snap in page:
+        updates = list(snap.reference.collection("updates").stream())
+        doc = dict(snap.to_dict() or {}, archived_at=now_ts())
+        if snapshot is not None:
+            line = {"id": snap.id, "doc": doc, "updates": {u.id: u.to_dict() for u in updates}}
+            snapshot.write(json.dumps(line, default=_json_default) + "\n")
+        else:
+            target = archive_col.document(snap.id)
+            copies.append(("set", target, doc))
+            for u in updates:
+                copies.append(("set", target.collection(ARCHIVE_UPDATES).document(u.id), u.to_dict()))
+        deletes.extend(("delete", u.reference, None) for u in updates)
+        # the CLOSED count drops in the same batch as the complaint goes
+        shard_ref, counts = archive_decrement()
+        deletes.append([("delete", snap.reference, None), ("merge", shard_ref, counts)])
+
+    commit_ops(copies, dry_run)
+    if snapshot is not None:
+        # text wrapper -> GzipFile (sync flush) -> underlying file
+        snapshot.flush()
+        raw = snapshot.buffer.fileobj
+        raw.flush()
+        os.fsync(raw.fileno())
+    commit_ops(deletes, dry_run)
+    forget_status_counter()
+
+
+def run_archive(days=90, to_dir=None, page_size=PAGE_SIZE, dry_run=False):
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+    snapshot = raw = None
+    if to_dir and not dry_run:
+        os.makedirs(to_dir, exist_ok=True)
+        name = f"archive-{datetime.now().strftime('%Y%m%d-%H%M%S')}.jsonl.gz"
+        raw = open(os.path.join(to_dir, name), "wb")
+        snapshot = gzip.open(raw, "wt", encoding="utf-8")
+
+    archived = 0
+    try:
+        for page in candidates(cutoff, page_size):
+            archive_page(page, snapshot, dry_run)
+            archived += len(page)
+            print(f"archived={archived}")
+    finally:
+        if snapshot is not None:
+            snapshot.close()
+            raw.close()
+    return archived
+
+
+def read_snapshots(directory):
+    """Yield (cid, doc, updates) from snapshot files; later files win."""
+    seen = {}
+    for path in sorted(glob.glob(os.path.join(directory, "archive-*.jsonl.gz"))):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    row = json.loads(line)
+                    seen[row["id"]] = row
+    for row in seen.values():
+        yield row["id"], row["doc"], row["updates"]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Archive long-CLOSED complaints")
+    ap.add_argument("--days", type=int, default=90, help="archive complaints CLOSED longer than this")
+    ap.add_argument("--to-dir", help="write gzip JSONL snapshots here instead of complaints_archive")
+    ap.add_argument("--page-size", type=int, default=PAGE_SIZE)
+    ap.add_argument("--dry-run", action="store_true", help="count only, write nothing")
+    args = ap.parse_args(argv)
+
+    n = run_archive(args.days, args.to_dir, args.page_size, args.dry_run)
+    print(f"Done: {n} complaint(s) {'would be ' if args.dry_run else ''}archived")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+# assignment.py
+"""
+Workload-aware assignment of complaints to staff.
+
+    python assignment.py              # assign new complaints as they arrive
+    python assignment.py --once       # assign the current backlog and exit
+    python assignment.py --recount    # first rebuild open_load from complaints
+
+Every staff user document carries open_load (complaints assigned to them
+that are still OPEN / IN_PROGRESS; kept exact by firebase_client with
+Increment writes in the same transaction as each status change) and an
+optional categories list. LoadBalancer keeps one min-heap per category
+keyed on that load, so picking the least-loaded staff member for a
+complaint is O(log n) however many staff there are.
+
+The service keeps the balancer current from the user directory listener
+and watches OPEN complaints; each unassigned one is handed to a worker
+thread that assigns it with firebase_client.assign_complaint(...,
+if_unassigned=True), so two assigners, or an admin assigning by hand at the
+same moment, never both win.
+"""
+
+import argparse
+import heapq
+import itertools
+import queue
+import threading
+import traceback
+
+ANY = "*"                # heap of staff without a category list
+SYSTEM_UID = "system"
+SYSTEM_NAME = "Auto-assign"
+
+
+class LoadBalancer:
+    """
+    Least-loaded staff per category. update() / remove() follow user
+    changes; pick() chooses and counts the assignment; release() undoes it.
+    Old heap entries are skipped lazily on pick(). Thread-safe.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seq = itertools.count()   # tie-break: longest-waiting first
+        self.staff = {}                 # uid -> (load, categories, name, version)
+        self.heaps = {}                 # category or ANY -> [(load, seq, uid, version)]
+
+    def __len__(self):
+        return len(self.staff)
+
+    def _push(self, uid):
+        load, categories, _, version = self.staff[uid]
+        for cat in categories or (ANY,):
+            heapq.heappush(self.heaps.setdefault(cat, []), (load, next(self._seq), uid, version))
+
+    def update(self, uid, load=0, categories=(), name=""):
+        with self._lock:
+            version = self.staff[uid][3] + 1 if uid in self.staff else 0
+            self.staff[uid] = (max(0, load or 0), tuple(categories or ()), name, version)
+            self._push(uid)
+
+    def remove(self, uid):
+        with self._lock:
+            self.staff.pop(uid, None)
+
+    def _top(self, cat):
+        heap = self.heaps.get(cat)
+        while heap:
+            load, _, uid, version = heap[0]
+            cur = self.staff.get(uid)
+            if cur is not None and cur[3] == version:
+                return load, uid
+            heapq.heappop(heap)
+        return None
+
+    def _bump(self, uid, delta):
+        load, categories, name, version = self.staff[uid]
+        self.staff[uid] = (max(0, load + delta), categories, name, version + 1)
+        self._push(uid)
+
+    def pick(self, category=None):
+        """(uid, name) of the least-loaded staff member for category, or None."""
+        with self._lock:
+            tops = [t for t in (self._top(category) if category else None, self._top(ANY)) if t]
+            if not tops:
+                return None
+            _, uid = min(tops)
+            self._bump(uid, 1)
+            return uid, self.staff[uid][2]
+
+    def release(self, uid):
+        """Give back a pick() whose assignment did not go through."""
+        with self._lock:
+            if uid in self.staff:
+                self._bump(uid, -1)
+
+    def loads(self):
+        with self._lock:
+            return {uid: s[0] for uid, s in self.staff.items()}
+
+
+def balancer_for(users):
+    """LoadBalancer over the staff among (uid, doc) user rows."""
+    lb = LoadBalancer()
+    for uid, d in users:
+        if d.get("role") == "staff":
+            lb.update(uid, d.get("open_load", 0), d.get("categories"), d.get("name", ""))
+    return lb
+
+
+class AutoAssigner:
+    """Assigns OPEN, unassigned complaints as they appear (see module doc)."""
+
+    def __init__(self, backend=None):
+        if backend is None:
+            import firebase_client as backend
+        self.backend = backend
+        self.balancer = LoadBalancer()
+        self.jobs = queue.Queue()
+        self.assigned = 0
+        self._watch = None
+        self._thread = threading.Thread(target=self._run, name="crts-assign", daemon=True)
+
+    def _on_users(self, uids):
+        for uid in uids:
+            d = self.backend.directory.get(uid)
+            if d and d.get("role") == "staff":
+                self.balancer.update(uid, d.get("open_load", 0), d.get("categories"), d.get("name", ""))
+            else:
+                self.balancer.remove(uid)
+
+    def _on_complaints(self, upserts, _removed):
+        for cid, d in upserts:
+            if not d.get("assigned_to_uid"):
+                self.jobs.put((cid, d.get("category")))
+
+    def assign(self, cid, category):
+        picked = self.balancer.pick(category)
+        if picked is None:
+            print(f"No staff available for {category or 'any'} complaint {cid}")
+            return False
+        uid, name = picked
+        try:
+            ok = self.backend.assign_complaint(cid, uid, name, SYSTEM_UID, SYSTEM_NAME, if_unassigned=True)
+        except Exception:
+            ok = False
+            print(f"Assigning {cid} failed:\n", traceback.format_exc())
+        if ok:
+            self.assigned += 1
+        else:
+            self.balancer.release(uid)
+        return ok
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            self.assign(*job)
+
+    def start(self):
+        directory = self.backend.directory
+        directory.start()
+        self._on_users([uid for uid, _ in directory.all()])
+        directory.subscribe(self._on_users)
+        self._thread.start()
+        self._watch = self.backend.watch_complaints(self._on_complaints, status="OPEN")
+
+    def stop(self):
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
+        self.backend.directory.unsubscribe(self._on_users)
+        self.jobs.put(None)
+
+
+def assign_backlog(backend=None):
+    """Assign every OPEN complaint that has no assignee yet; returns the count."""
+    assigner = AutoAssigner(backend)
+    assigner.balancer = balancer_for(assigner.backend.list_all_users())
+    rows = assigner.backend.query_complaints(status="OPEN", fields=("category", "assigned_to_uid"))
+    for cid, d in reversed(rows):  # oldest first
+        if not d.get("assigned_to_uid"):
+            assigner.assign(cid, d.get("category"))
+    return assigner.assigned
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Assign complaints to the least-loaded staff")
+    ap.add_argument("--once", action="store_true", help="assign the current backlog and exit")
+    ap.add_argument("--recount", action="store_true", help="rebuild every staff open_load first")
+    args = ap.parse_args(argv)
+
+    import firebase_client
+    if args.recount:
+        loads = firebase_client.recount_open_loads()
+        print(f"Recounted open_load for {len(loads)} staff")
+    if args.once:
+        print(f"Assigned {assign_backlog(firebase_client)} complaint(s)")
+        return
+    assigner = AutoAssigner(firebase_client)
+    assigner.start()
+    print(f"Assigning for {len(assigner.balancer)} staff; Ctrl+C to stop")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        assigner.stop()
+        print(f"Assigned {assigner.assigned} complaint(s)")
+
+
+if __name__ == "__main__":
+    main()
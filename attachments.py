@@ -0,0 +1,411 @@
+# attachments.py
+"""
+Photo attachments for complaints.
+
+    uploader = Uploader(on_event=...)
+    ref = uploader.add(complaint_id, "/path/to/photo.jpg")   # returns at once
+    data["attachments"] = [ref, ...]                         # saved on the complaint
+
+add() only picks the blob keys. The image is shrunk to MAX_SIDE and
+thumbnailed in a process pool (Pillow work would otherwise hold up the Tk
+thread), staged under ~/.crts/uploads with a small JSON manifest, and sent
+to the blob store in CHUNK_SIZE pieces. After a crash or lost connection
+the upload continues from the last acknowledged byte: resume_pending()
+restarts whatever manifests are left, so the complaint can be saved (and
+queued in the outbox) before its photos have finished uploading.
+
+The complaint document only holds references ({id, name, key, thumb_key});
+ThumbnailCache loads the small PNGs on demand for the detail windows.
+
+Blob stores: StorageBlobStore writes to the Firebase Storage bucket named
+in STORAGE_BUCKET with resumable upload sessions; with no bucket set,
+LocalBlobStore keeps blobs under ~/.crts/blobs (single machine, for local
+runs and tests). Without Pillow, files are uploaded unmodified and no
+thumbnails are made.
+
+on_event(kind, ref, info) is called from an upload thread with kind
+"sent", "retry" (info = exception) or "failed" (the manifest is kept and
+retried by the next resume_pending()).
+"""
+
+import base64
+import glob
+import io
+import json
+import mimetypes
+import os
+import pathlib
+import tempfile
+import threading
+import time
+import tkinter as tk
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import requests
+
+from outbox import backoff
+from util import DATA_DIR
+from schema import new_doc_id
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pip install pillow
+    Image = None
+
+STORAGE_BUCKET = ""               # e.g. "<project-id>.appspot.com"; empty = LocalBlobStore
+STAGING_DIR = os.path.join(DATA_DIR, "uploads")
+CHUNK_SIZE = 256 * 1024           # resumable sessions want multiples of 256 KiB
+MAX_FILE_BYTES = 20 * 1024 * 1024
+MAX_ATTACHMENTS = 5
+MAX_SIDE = 1600                   # longest edge of the stored photo
+JPEG_QUALITY = 82
+THUMB_SIDE = 160
+MAX_ATTEMPTS = 6
+IMAGE_FILETYPES = [("Images", "*.jpg *.jpeg *.png *.gif *.bmp *.webp"), ("All files", "*.*")]
+
+
+# -------------------------------------------------------
+# IMAGE PROCESSING (runs in worker processes)
+# -------------------------------------------------------
+def process_image(path):
+    """
+    {"data", "content_type", "thumb"} for one file: a JPEG no larger than
+    MAX_SIDE plus a PNG thumbnail (Tk shows PNG natively). Non-images, or
+    any file when Pillow is missing, are passed through with thumb None.
+    """
+    with open(path, "rb") as f:
+        raw = f.read()
+    content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if Image is None:
+        return {"data": raw, "content_type": content_type, "thumb": None}
+    try:
+        img = ImageOps.exif_transpose(Image.open(io.BytesIO(raw)))
+    except Exception:
+        return {"data": raw, "content_type": content_type, "thumb": None}
+    img = img.convert("RGB")
+    img.thumbnail((MAX_SIDE, MAX_SIDE))
+    out = io.BytesIO()
+    img.save(out, "JPEG", quality=JPEG_QUALITY, optimize=True)
+    img.thumbnail((THUMB_SIDE, THUMB_SIDE))
+    thumb = io.BytesIO()
+    img.save(thumb, "PNG", optimize=True)
+    return {"data": out.getvalue(), "content_type": "image/jpeg", "thumb": thumb.getvalue()}
+
+
+# -------------------------------------------------------
+# BLOB STORES
+# -------------------------------------------------------
+# begin(key, size, content_type) -> token; offset(token, size) -> bytes
+# already stored; write(token, offset, chunk, size); commit(token);
+# read(key) -> bytes. The token is saved in the manifest, so it must be
+# usable again after a restart.
+class LocalBlobStore:
+    def __init__(self, root=os.path.join(DATA_DIR, "blobs")):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split("/"))
+
+    def begin(self, key, size, content_type):
+        path = self._path(key) + ".part"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, "ab").close()
+        return key
+
+    def offset(self, token, size):
+        part = self._path(token) + ".part"
+        if os.path.exists(part):
+            return os.path.getsize(part)
+        return size if os.path.exists(self._path(token)) else 0
+
+    def write(self, token, offset, chunk, size):
+        with open(self._path(token) + ".part", "r+b") as f:
+            f.seek(offset)
+            f.write(chunk)
+            f.truncate()
+
+    def commit(self, token):
+        part = self._path(token) + ".part"
+        if os.path.exists(part):
+            os.replace(part, self._path(token))
+
+    def read(self, key):
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+
+class StorageBlobStore:
+    """Firebase Storage bucket; uploads use resumable session URLs."""
+
+    def __init__(self, bucket_name=STORAGE_BUCKET):
+        import firebase_client  # noqa: F401  (initialises the default app)
+        from firebase_admin import storage
+        self.bucket = storage.bucket(bucket_name)
+
+    def begin(self, key, size, content_type):
+        return self.bucket.blob(key).create_resumable_upload_session(content_type=content_type, size=size)
+
+    def offset(self, token, size):
+        r = requests.put(token, headers={"Content-Range": f"bytes */{size}"}, timeout=30)
+        if r.status_code in (200, 201):
+            return size
+        if r.status_code != 308:
+            r.raise_for_status()
+        received = r.headers.get("Range")  # "bytes=0-N"
+        return int(received.rsplit("-", 1)[1]) + 1 if received else 0
+
+    def write(self, token, offset, chunk, size):
+        end = offset + len(chunk) - 1
+        r = requests.put(token, data=chunk, headers={"Content-Range": f"bytes {offset}-{end}/{size}"}, timeout=120)
+        if r.status_code not in (200, 201, 308):
+            r.raise_for_status()
+
+    def commit(self, token):
+        pass  # the session completes with its last chunk
+
+    def read(self, key):
+        return self.bucket.blob(key).download_as_bytes()
+
+
+def default_store():
+    return StorageBlobStore() if STORAGE_BUCKET else LocalBlobStore()
+
+
+# -------------------------------------------------------
+# UPLOADER
+# -------------------------------------------------------
+class Uploader:
+    def __init__(self, store=None, on_event=None, staging_dir=STAGING_DIR, workers=2):
+        self.store = store or default_store()
+        self.on_event = on_event
+        self.staging_dir = staging_dir
+        os.makedirs(staging_dir, exist_ok=True)
+        self.workers = workers
+        self.procs = None  # process pool, started by the first add()
+        self.io = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="crts-upload")
+        self._lock = threading.Lock()
+        self._active = set()
+
+    def add(self, complaint_id, path):
+        """Start processing + uploading path; returns the reference to store."""
+        if os.path.getsize(path) > MAX_FILE_BYTES:
+            raise ValueError(f"{os.path.basename(path)} is larger than {MAX_FILE_BYTES // (1024 * 1024)} MB")
+        att_id = new_doc_id()
+        ref = {
+            "id": att_id,
+            "name": os.path.basename(path),
+            "key": f"complaints/{complaint_id}/{att_id}",
+            "thumb_key": f"complaints/{complaint_id}/{att_id}_thumb.png",
+        }
+        with self._lock:
+            if self.procs is None:
+                self.procs = ProcessPoolExecutor(max_workers=self.workers)
+            future = self.procs.submit(process_image, path)
+        self.io.submit(self._stage_then_upload, ref, future)
+        return ref
+
+    def _notify(self, *args):
+        if self.on_event:
+            try:
+                self.on_event(*args)
+            except Exception:
+                print("Error in upload callback:\n", traceback.format_exc())
+
+    def _save(self, manifest, path):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, path)
+
+    def _stage_then_upload(self, ref, future):
+        try:
+            out = future.result()
+        except Exception as e:
+            self._notify("failed", ref, e)
+            return
+        base = os.path.join(self.staging_dir, ref["id"])
+        parts = [(ref["key"], base + ".bin", out["content_type"], out["data"])]
+        if out["thumb"]:
+            parts.append((ref["thumb_key"], base + "_thumb.png", "image/png", out["thumb"]))
+        manifest = {"ref": ref, "parts": []}
+        for key, file, content_type, data in parts:
+            with open(file, "wb") as f:
+                f.write(data)
+            manifest["parts"].append({"key": key, "file": file, "content_type": content_type, "token": None, "done": False})
+        self._save(manifest, base + ".json")
+        self._upload(base + ".json")
+
+    def _send_part(self, part, manifest, manifest_path):
+        size = os.path.getsize(part["file"])
+        if not part["token"]:
+            part["token"] = self.store.begin(part["key"], size, part["content_type"])
+            self._save(manifest, manifest_path)
+        try:
+            offset = self.store.offset(part["token"], size)
+        except Exception:
+            part["token"] = None  # session expired: start this part over
+            self._save(manifest, manifest_path)
+            raise
+        with open(part["file"], "rb") as f:
+            f.seek(offset)
+            while offset < size:
+                chunk = f.read(CHUNK_SIZE)
+                self.store.write(part["token"], offset, chunk, size)
+                offset += len(chunk)
+        self.store.commit(part["token"])
+        part["done"] = True
+        self._save(manifest, manifest_path)
+
+    def _upload(self, manifest_path):
+        with self._lock:
+            if manifest_path in self._active:
+                return
+            self._active.add(manifest_path)
+        try:
+            with open(manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            attempts = 0
+            while True:
+                try:
+                    for part in manifest["parts"]:
+                        if not part["done"]:
+                            self._send_part(part, manifest, manifest_path)
+                    break
+                except Exception as e:
+                    attempts += 1
+                    if attempts >= MAX_ATTEMPTS:
+                        self._notify("failed", manifest["ref"], e)
+                        return
+                    self._notify("retry", manifest["ref"], e)
+                    time.sleep(backoff(attempts))
+            for part in manifest["parts"]:
+                if os.path.exists(part["file"]):
+                    os.remove(part["file"])
+            os.remove(manifest_path)
+            self._notify("sent", manifest["ref"], None)
+        finally:
+            with self._lock:
+                self._active.discard(manifest_path)
+
+    def resume_pending(self):
+        """Continue uploads left over from an earlier run; returns how many."""
+        paths = glob.glob(os.path.join(self.staging_dir, "*.json"))
+        for path in paths:
+            self.io.submit(self._upload, path)
+        return len(paths)
+
+    def pending(self):
+        return len(glob.glob(os.path.join(self.staging_dir, "*.json")))
+
+    def close(self):
+        self.io.shutdown(wait=False, cancel_futures=True)
+        if self.procs is not None:
+            self.procs.shutdown(wait=False, cancel_futures=True)
+
+
+# -------------------------------------------------------
+# THUMBNAILS (Tk side)
+# -------------------------------------------------------
+class ThumbnailCache:
+    """
+    Least-recently-used cache of thumbnail PhotoImages shared by all detail
+    windows. load() reads a missing thumbnail on a background thread and
+    builds the image on the Tk thread (Tk objects are not thread-safe).
+    """
+
+    def __init__(self, store=None, capacity=64):
+        self.store = store or default_store()
+        self.capacity = capacity
+        self._images = OrderedDict()
+        self._io = ThreadPoolExecutor(max_workers=2, thread_name_prefix="crts-thumbs")
+
+    def get(self, key):
+        img = self._images.get(key)
+        if img is not None:
+            self._images.move_to_end(key)
+        return img
+
+    def _put(self, key, img):
+        self._images[key] = img
+        self._images.move_to_end(key)
+        while len(self._images) > self.capacity:
+            self._images.popitem(last=False)
+
+    def load(self, widget, key, callback):
+        """callback(image or None) on the Tk thread once the thumbnail is known."""
+        img = self.get(key)
+        if img is not None:
+            callback(img)
+            return
+
+        def work():
+            try:
+                data = self.store.read(key)
+            except Exception:
+                data = None
+
+            def done():
+                try:
+                    if not widget.winfo_exists():
+                        return
+                except tk.TclError:
+                    return
+                img = None
+                if data:
+                    try:
+                        img = tk.PhotoImage(data=base64.b64encode(data))
+                        self._put(key, img)
+                    except tk.TclError:
+                        img = None
+                callback(img)
+
+            try:
+                widget.after(0, done)
+            except (tk.TclError, RuntimeError):
+                pass
+
+        self._io.submit(work)
+
+    def open(self, ref):
+        """Open the full photo behind ref in the system viewer (downloads off the Tk thread)."""
+        self._io.submit(open_full, self.store, ref)
+
+
+def show_thumbnails(parent, refs, cache):
+    """
+    Row of thumbnails for a complaint's attachments inside parent; a click
+    opens the full photo in the system viewer. Missing ones (still
+    uploading) show their file name instead.
+    """
+    row = tk.Frame(parent)
+    row.pack(fill="x")
+    for ref in refs:
+        lbl = tk.Label(row, text=ref.get("name", ""), width=THUMB_SIDE // 8, cursor="hand2")
+        lbl.pack(side="left", padx=4, pady=4)
+
+        def shown(img, lbl=lbl):
+            if img is not None:
+                lbl.config(image=img, width=0)
+                lbl.image = img  # keep a reference while displayed
+
+        cache.load(lbl, ref["thumb_key"], shown)
+        lbl.bind("<Button-1>", lambda e, ref=ref: cache.open(ref))
+    return row
+
+
+def open_full(store, ref):
+    """Download the full photo to a temp file and open it with the default viewer."""
+    import webbrowser
+    try:
+        data = store.read(ref["key"])
+    except Exception as e:
+        print(f"Could not open {ref.get('name')}: {e}")
+        return
+    # process_image re-encodes photos as JPEG whatever their original name
+    suffix = ".jpg" if data[:3] == b"\xff\xd8\xff" else os.path.splitext(ref.get("name", ""))[1]
+    fd, path = tempfile.mkstemp(prefix="crts-", suffix=suffix)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    webbrowser.open(pathlib.Path(path).as_uri())
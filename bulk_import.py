@@ -0,0 +1,147 @@
+# bulk_import.py
+"""
+Bulk import of legacy complaints from CSV or JSONL.
+
+    python bulk_import.py complaints.csv
+    python bulk_import.py export.jsonl --rate 300 --dry-run
+
+Rows are streamed (the file is never loaded whole), validated against the
+complaint schema in schema.py and written through a Firestore BulkWriter,
+which sends writes concurrently and ramps its rate up to --rate ops/sec.
+
+Every --checkpoint-every rows the writer is flushed and the last fully
+written row number is saved to <input>.checkpoint.json, so a crashed import
+resumes from there. Document ids are the 'id' column when there is one,
+otherwise a hash of the row's validated content, so rows replayed after a
+crash (or the same file re-exported or re-sorted) overwrite the same
+documents, and an edited or unrelated file never overwrites other
+complaints.
+
+Invalid rows are skipped and reported in <input>.errors.jsonl. The writes
+bypass the dashboard's status counter, so it is rebuilt when the import
+finishes (firebase_client.rebuild_status_counter()). Rollups for the
+Analytics view are not touched; run `python analytics.py rebuild` after an
+import.
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+
+from google.cloud.firestore_v1.bulk_writer import BulkWriterOptions
+
+from firebase_client import collection, db, prepare_complaint_doc, rebuild_status_counter
+from schema import validate_complaint
+
+
+def read_rows(path, fmt):
+    """Yield (row_number, dict) starting at 1."""
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        if fmt == "csv":
+            for i, row in enumerate(csv.DictReader(f), start=1):
+                yield i, row
+        else:
+            for i, line in enumerate(f, start=1):
+                line = line.strip()
+                if line:
+                    yield i, json.loads(line)
+
+
+def import_doc_id(row, data):
+    """The row's 'id', else a hash of its validated fields (same row -> same id)."""
+    if row.get("id"):
+        return str(row["id"]).replace("/", "-")
+    content = json.dumps(data, sort_keys=True, default=str)
+    return f"import-{hashlib.sha1(content.encode()).hexdigest()[:20]}"
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, row_no, stats):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"row": row_no, **stats}, f)
+    os.replace(tmp, path)
+
+
+def run_import(path, fmt=None, rate=500, checkpoint_every=1000, dry_run=False, restart=False):
+    fmt = fmt or ("jsonl" if path.lower().endswith((".jsonl", ".ndjson")) else "csv")
+    checkpoint_path = path + ".checkpoint.json"
+    errors_path = path + ".errors.jsonl"
+    if restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    checkpoint = load_checkpoint(checkpoint_path)
+    resume_after = checkpoint.get("row", 0)
+    stats = {k: checkpoint.get(k, 0) for k in ("written", "invalid", "failed")}
+
+    writer = col = None
+    if not dry_run:
+        col = collection("complaints")
+        writer = db.bulk_writer(options=BulkWriterOptions(
+            initial_ops_per_second=min(rate, 500), max_ops_per_second=rate,
+        ))
+
+        def on_error(error, bw):
+            # retry transient failures a few times, then count and move on
+            if error.attempts < 5:
+                return True
+            stats["failed"] += 1
+            print(f"Write failed for {error.operation.reference.path}: {error.message}")
+            return False
+
+        writer.on_write_error(on_error)
+
+    last_row = resume_after
+    if resume_after:
+        print(f"Resuming after row {resume_after}")
+    with open(errors_path, "a", encoding="utf-8") as err_f:
+        for row_no, row in read_rows(path, fmt):
+            if row_no <= resume_after:
+                continue
+            data, errors = validate_complaint(row)
+            if errors:
+                stats["invalid"] += 1
+                err_f.write(json.dumps({"row": row_no, "errors": errors}) + "\n")
+            elif writer is not None:
+                writer.set(col.document(import_doc_id(row, data)), prepare_complaint_doc(data))
+                stats["written"] += 1
+            else:
+                stats["written"] += 1
+            last_row = row_no
+
+            if row_no % checkpoint_every == 0:
+                if writer is not None:
+                    writer.flush()
+                    save_checkpoint(checkpoint_path, row_no, stats)
+                print(f"row {row_no}: {stats}")
+
+    if writer is not None:
+        writer.close()
+        save_checkpoint(checkpoint_path, last_row, stats)
+        rebuild_status_counter()
+    return stats
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Bulk import complaints from CSV / JSONL")
+    ap.add_argument("path")
+    ap.add_argument("--format", choices=("csv", "jsonl"), help="default: from file extension")
+    ap.add_argument("--rate", type=int, default=500, help="max writes per second")
+    ap.add_argument("--checkpoint-every", type=int, default=1000, help="rows between checkpoints")
+    ap.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    ap.add_argument("--dry-run", action="store_true", help="validate only, write nothing")
+    args = ap.parse_args(argv)
+
+    stats = run_import(args.path, args.format, args.rate, args.checkpoint_every, args.dry_run, args.restart)
+    print(f"Done: {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+# escalation.py
+"""
+Escalation of complaints that sit in OPEN / IN_PROGRESS past their SLA.
+
+    python escalation.py                  # check every 15 minutes, forever
+    python escalation.py --once
+    python escalation.py --backfill       # first give older complaints an sla_due_at
+
+Every complaint carries sla_due_at, the deadline for its current status
+(schema.SLA_HOURS by priority; null once RESOLVED / CLOSED). Each run reads
+overdue complaints with one range query on that field, raises their
+priority one step (schema.ESCALATE_TO), re-arms the deadline for the new
+priority and adds a timeline entry, all in batched writes. Nothing needs
+the Tk apps; run it as a service or from cron (one per institution, with
+CRTS_TENANT set, when the project hosts several).
+
+Writes are conditional on the document being unchanged since it was read,
+so a concurrent status change wins; a complaint skipped that way is still
+overdue (or no longer is) at the next run.
+"""
+
+import argparse
+import time
+from datetime import timedelta
+
+from google.api_core.exceptions import FailedPrecondition
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from firebase_client import _tenant_fields, collection, db, now_ts, to_datetime
+from schema import ESCALATE_TO, SLA_HOURS, SLA_STATUSES, note_fields, sla_due_at
+
+PAGE_SIZE = 200          # complaints per batch (2 writes each)
+SYSTEM_UID = "system"
+SYSTEM_NAME = "SLA escalation"
+
+
+def escalation_writes(doc: dict, now):
+    """(complaint fields, timeline entry) escalating one overdue complaint."""
+    old = doc.get("priority") or "MEDIUM"
+    new = ESCALATE_TO.get(old, old)
+    status = doc.get("status", "OPEN")
+    hours = SLA_HOURS.get(old, SLA_HOURS["MEDIUM"])
+    if new != old:
+        remark = f"Escalated {old} → {new}: {status} longer than the {hours}h SLA"
+    else:
+        overdue = (now - to_datetime(doc["sla_due_at"])).total_seconds() / 3600
+        remark = f"Still {status} {overdue:.0f}h past the {hours}h SLA"
+    entry = {
+        "status": status,
+        "remark": remark,
+        "updated_by_uid": SYSTEM_UID,
+        "updated_by_name": SYSTEM_NAME,
+        "updated_at": now,
+        "escalated_from": old,
+        "escalated_to": new,
+        **_tenant_fields(),
+    }
+    fields = note_fields(doc, entry)
+    fields.update({
+        "priority": new,
+        "sla_due_at": sla_due_at(new, status, now),
+        "escalation_count": (doc.get("escalation_count") or 0) + 1,
+        "escalated_at": now,
+    })
+    return fields, entry
+
+
+def escalate_overdue(now=None, page_size=PAGE_SIZE, dry_run=False):
+    """Escalate everything overdue at `now`; returns how many were escalated."""
+    now = now or now_ts()
+    base = (
+        collection("complaints")
+        .where(filter=FieldFilter("sla_due_at", "<", now))
+        .order_by("sla_due_at")
+    )
+    escalated, last = 0, None
+    while True:
+        q = base.limit(page_size)
+        if last is not None:
+            q = q.start_after(last)
+        page = list(q.stream())
+        if not page:
+            break
+        last = page[-1]
+
+        batch = db.batch()
+        for snap in page:
+            fields, entry = escalation_writes(snap.to_dict(), now)
+            batch.update(snap.reference, fields, option=db.write_option(last_update_time=snap.update_time))
+            batch.set(snap.reference.collection("updates").document(), entry)
+        if dry_run:
+            escalated += len(page)
+            continue
+        try:
+            batch.commit()
+            escalated += len(page)
+        except FailedPrecondition:
+            # one of them changed meanwhile; retry this page one by one
+            for snap in page:
+                fresh = snap.reference.get()
+                data = fresh.to_dict() or {}
+                due = to_datetime(data.get("sla_due_at"))
+                if due is None or due >= now:
+                    continue
+                fields, entry = escalation_writes(data, now)
+                single = db.batch()
+                single.update(fresh.reference, fields, option=db.write_option(last_update_time=fresh.update_time))
+                single.set(fresh.reference.collection("updates").document(), entry)
+                try:
+                    single.commit()
+                    escalated += 1
+                except FailedPrecondition:
+                    pass
+    return escalated
+
+
+def backfill_sla(dry_run=False):
+    """Set sla_due_at on open complaints written before it existed."""
+    n = 0
+    batch = db.batch()
+    for status in SLA_STATUSES:
+        q = collection("complaints").where(filter=FieldFilter("status", "==", status))
+        for snap in q.stream():
+            d = snap.to_dict() or {}
+            if "sla_due_at" in d:
+                continue
+            since = d.get("status_changed_at") or d.get("created_at")
+            batch.update(snap.reference, {"sla_due_at": sla_due_at(d.get("priority"), status, since)})
+            n += 1
+            if n % 400 == 0 and not dry_run:
+                batch.commit(); batch = db.batch()
+    if not dry_run:
+        batch.commit()
+    return n
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Escalate complaints past their SLA")
+    ap.add_argument("--interval", type=float, default=15, help="minutes between runs")
+    ap.add_argument("--once", action="store_true", help="run a single pass and exit")
+    ap.add_argument("--backfill", action="store_true", help="set sla_due_at on older complaints first")
+    ap.add_argument("--dry-run", action="store_true", help="count only, write nothing")
+    args = ap.parse_args(argv)
+
+    if args.backfill:
+        print(f"Backfilled sla_due_at on {backfill_sla(args.dry_run)} complaint(s)")
+    while True:
+        started = now_ts()
+        n = escalate_overdue(started, dry_run=args.dry_run)
+        print(f"[{started:%Y-%m-%d %H:%M:%S}] escalated {n} complaint(s)")
+        if args.once:
+            break
+        next_run = started + timedelta(minutes=args.interval)
+        time.sleep(max(0.0, (next_run - now_ts()).total_seconds()))
+
+
+if __name__ == "__main__":
+    main()
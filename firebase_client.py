@@ -1,10 +1,28 @@
 # firebase_client.py
 import firebase_admin
 from firebase_admin import credentials, firestore, auth as admin_auth
+from google.cloud.firestore_v1.base_query import FieldFilter
+from google.api_core.exceptions import AlreadyExists
 import requests
+import contextlib
+import contextvars
+import functools
 import os
+import queue
+import random
 import sys
-from datetime import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from schema import (
+    now_ts, to_datetime, format_ts, normalize_dates, sort_newest,
+    summary_fields, status_fields, note_fields, prepare_complaint_doc, LOAD_STATUSES, load_change,
+    rollup_id, rollup_delta, nest_paths,
+    STATUSES, status_count_delta, sum_counter_shards,
+    USER_SEARCH_FIELDS, user_search_fields, page_users,
+    check_transition,
+)
 
 # -------------------------------------------------------
 # FIREBASE CONFIG
@@ -15,10 +33,11 @@ from datetime import datetime
 FIREBASE_API_KEY = "<Add your API key>" #
 
 
-
 # -------------------------------------------------------
 # RESOURCE PATH FIX (supports PyInstaller .exe)
 # -------------------------------------------------------
+
+
 def resource_path(filename):
     """
     Get absolute path to a bundled resource.
@@ -43,6 +62,272 @@ if not firebase_admin._apps:
 db = firestore.client()
 
 
+# -------------------------------------------------------
+# TENANTS (several institutions in one Firebase project)
+# -------------------------------------------------------
+# Each institution's users, complaints (with their updates), archive,
+# rollups and counters live under tenants/{tenant_id}/, so its queries,
+# listeners and indexes only ever touch its own documents, and it can be
+# exported, archived or removed on its own. The tenant "" is the original
+# layout with the collections at the root, so a single-institution project
+# needs no migration. The apps choose the tenant at login (set_tenant);
+# work done later for a stored tenant (the outbox) runs inside
+# tenant_scope(). Timeline entries also carry tenant_id ("" at the root),
+# which the activity feed's collection-group query filters on server-side;
+# run backfill_tenant_ids() once on projects that predate tenants.
+TENANT_COLLECTION = "tenants"
+DEFAULT_TENANT = os.environ.get("CRTS_TENANT", "")
+
+_tenant = DEFAULT_TENANT
+_scoped_tenant = contextvars.ContextVar("crts_tenant", default=None)
+
+
+def current_tenant():
+    scoped = _scoped_tenant.get()
+    return _tenant if scoped is None else scoped
+
+
+def set_tenant(tenant_id):
+    """Switch this process to another institution (at login)."""
+    global _tenant
+    _tenant = tenant_id or ""
+    with _counter_lock:
+        _counter_cache.clear()
+
+
+@contextlib.contextmanager
+def tenant_scope(tenant_id):
+    """Run a block (in this thread / task only) against another tenant."""
+    token = _scoped_tenant.set(tenant_id or "")
+    try:
+        yield
+    finally:
+        _scoped_tenant.reset(token)
+
+
+def collection(name, client=None):
+    """The current tenant's collection `name`; client defaults to db."""
+    client = client or db
+    tenant = current_tenant()
+    if tenant:
+        return client.collection(TENANT_COLLECTION).document(tenant).collection(name)
+    return client.collection(name)
+
+
+def _tenant_fields():
+    """Extra fields for timeline entries of the current tenant."""
+    return {"tenant_id": current_tenant()}
+
+
+def updates_group(client=None):
+    """Collection-group query over the current tenant's timeline entries."""
+    q = (client or db).collection_group("updates")
+    return q.where(filter=FieldFilter("tenant_id", "==", current_tenant()))
+
+
+def in_tenant(ref):
+    """Whether a document from a collection-group query belongs to the current tenant."""
+    tenant = current_tenant()
+    path = ref.path
+    if tenant:
+        return path.startswith(f"{TENANT_COLLECTION}/{tenant}/")
+    return not path.startswith(TENANT_COLLECTION + "/")
+
+
+def backfill_tenant_ids(batch_size=400):
+    """
+    One-off for projects that predate tenants: set tenant_id "" on the root
+    complaints' timeline entries so the activity feed finds them.
+    Returns how many entries were updated.
+    """
+    batch, n = db.batch(), 0
+    for c in db.collection("complaints").select([]).stream():
+        for u in c.reference.collection("updates").stream():
+            if "tenant_id" in (u.to_dict() or {}):
+                continue
+            batch.update(u.reference, {"tenant_id": ""}); n += 1
+            if n % batch_size == 0:
+                batch.commit(); batch = db.batch()
+    batch.commit()
+    return n
+
+
+def list_tenants():
+    """[(tenant_id, doc)] of the registered institutions, by name."""
+    rows = [(d.id, d.to_dict() or {}) for d in db.collection(TENANT_COLLECTION).stream()]
+    usage.add(reads=max(1, len(rows)))
+    return sorted(rows, key=lambda r: (r[1].get("name") or r[0]).lower())
+
+
+def create_tenant(tenant_id: str, name: str):
+    """Register an institution (its collections appear with the first write)."""
+    if not tenant_id or "/" in tenant_id:
+        raise ValueError(f"Invalid tenant id {tenant_id!r}")
+    db.collection(TENANT_COLLECTION).document(tenant_id).set({"name": name, "created_at": now_ts()}, merge=True)
+    usage.add(writes=1)
+
+
+# -------------------------------------------------------
+# TIMESTAMPS (helpers live in schema.py)
+# -------------------------------------------------------
+# Set to False once the migration has finished; range queries then stop
+# issuing the extra query that matches legacy string values.
+LEGACY_STRING_DATES = True
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _date_range_variants(start, end, limited=False):
+    """
+    Bounds to query with: native timestamps, plus the legacy string form
+    while LEGACY_STRING_DATES is on (Firestore range filters only match
+    values of the same type). For a query with a limit an open range is
+    split by type too: Firestore sorts every string after every timestamp,
+    so a single limited query would cut one type off before sort_newest().
+    """
+    start, end = to_datetime(start), to_datetime(end)
+    if limited and LEGACY_STRING_DATES and not (start or end):
+        start = _EPOCH
+    variants = [(start, end)]
+    if LEGACY_STRING_DATES and (start or end):
+        variants.append(tuple(format_ts(b) if b else None for b in (start, end)))
+    return variants
+
+
+# -------------------------------------------------------
+# READ / WRITE ACCOUNTING
+# -------------------------------------------------------
+# Firestore bills every document read and written. `usage` counts both for
+# the current app session (reset at login), split by the view that was open
+# (the apps call usage.set_view()). The desktop apps give each login a read
+# budget (usage.set_budget(READ_BUDGET, WRITE_BUDGET)); past LOW_AT of it,
+# list queries are answered from their last result for up to LOW_TTL
+# seconds; once it is used up only earlier results are served, and a query
+# never seen before raises BudgetExceeded. Snapshot listeners keep running
+# since they bill only what changed. Writes are counted, never refused.
+# Without set_budget() (servers, jobs, tools) nothing is limited or cached.
+READ_BUDGET = 50_000     # per desktop session
+WRITE_BUDGET = 5_000
+LOW_AT = 0.8
+LOW_TTL = 300
+CACHE_SIZE = 200         # query results kept for the fallback
+
+
+class BudgetExceeded(Exception):
+    """The session's read budget is used up and there is no cached result."""
+
+
+class Usage:
+    def __init__(self, reads=0, writes=0):
+        self._lock = threading.Lock()
+        self.read_budget, self.write_budget = reads, writes
+        self.view = "-"
+        self.reset()
+
+    def reset(self):
+        """Start a new session: zero the counters and drop cached results."""
+        with self._lock:
+            self.reads = self.writes = 0
+            self.by_view = {}
+            self._cache = {}
+
+    def set_budget(self, reads=None, writes=None):
+        """Budgets for this session; 0 means unlimited (the default)."""
+        if reads is not None:
+            self.read_budget = reads
+        if writes is not None:
+            self.write_budget = writes
+
+    def set_view(self, name):
+        self.view = name
+
+    def add(self, reads=0, writes=0):
+        with self._lock:
+            self.reads += reads
+            self.writes += writes
+            counts = self.by_view.setdefault(self.view, [0, 0])
+            counts[0] += reads
+            counts[1] += writes
+            if writes:
+                # our own change must show on the next read; stale results
+                # are still served once the budget is used up
+                self._cache = {k: (float("-inf"), v) for k, (_, v) in self._cache.items()}
+
+    @property
+    def state(self):
+        """"ok", "low" (past LOW_AT of the read budget) or "exhausted"."""
+        if not self.read_budget:
+            return "ok"
+        if self.reads >= self.read_budget:
+            return "exhausted"
+        return "low" if self.reads >= LOW_AT * self.read_budget else "ok"
+
+    def lookup(self, key):
+        """Cached result to answer with instead of reading, or None."""
+        state = self.state
+        if state == "ok":
+            return None
+        with self._lock:
+            hit = self._cache.get(key)
+        if hit is not None and (state == "exhausted" or time.monotonic() - hit[0] < LOW_TTL):
+            return hit[1]
+        if state == "exhausted":
+            raise BudgetExceeded(
+                f"Read budget used up ({self.reads:,} of {self.read_budget:,} document reads "
+                f"this session) and nothing cached for this view; log in again to reset."
+            )
+        return None
+
+    def store(self, key, result, reads):
+        self.add(reads=max(1, reads))  # an empty query still bills one read
+        with self._lock:
+            self._cache.pop(key, None)
+            self._cache[key] = (time.monotonic(), result)
+            if len(self._cache) > CACHE_SIZE:
+                del self._cache[next(iter(self._cache))]
+
+    def cached(self, key, fetch, count=len):
+        """fetch() under the budget; see the section comment."""
+        key = repr(key)
+        hit = self.lookup(key)
+        if hit is not None:
+            return hit
+        result = fetch()
+        self.store(key, result, count(result))
+        return result
+
+    def summary(self):
+        """Short status bar text, and the bar style for it."""
+        text = f"Firestore: {self.reads:,} reads / {self.writes:,} writes"
+        if self.read_budget:
+            text += f" (budget {self.reads * 100 // self.read_budget}%)"
+        view = self.by_view.get(self.view)
+        if view:
+            text += f"  ·  {self.view}: {view[0]:,} / {view[1]:,}"
+        state = self.state
+        if state != "ok":
+            text += "  ·  showing cached results" if state == "exhausted" else "  ·  budget low, lists cached"
+        if self.write_budget and self.writes >= self.write_budget:
+            text += "  ·  write budget passed"
+            state = state if state != "ok" else "low"
+        return text, {"ok": "secondary", "low": "warning", "exhausted": "danger"}[state]
+
+
+usage = Usage()
+
+
+def budgeted(count=len):
+    """Decorator: run a read helper through usage.cached(), keyed on its arguments."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            key = (current_tenant(), fn.__name__, args, kwargs)
+            return usage.cached(key, lambda: fn(*args, **kwargs), count)
+        return inner
+    return wrap
+
+
 # -------------------------------------------------------
 # REST AUTH ENDPOINTS (Signup/Login)
 # -------------------------------------------------------
@@ -58,6 +343,8 @@ FIREBASE_REST_SIGNIN = (
 # -------------------------------------------------------
 # AUTH HELPERS
 # -------------------------------------------------------
+
+
 def signup_with_email_password(email: str, password: str):
     payload = {
         "email": email,
@@ -80,72 +367,444 @@ def signin_with_email_password(email: str, password: str):
     return resp.json()
 
 
+def verify_id_token(id_token: str):
+    """uid for a Firebase ID token (raises if invalid/expired)."""
+    return admin_auth.verify_id_token(id_token)["uid"]
+
+
 # -------------------------------------------------------
 # USER HELPERS
 # -------------------------------------------------------
+
+
 def create_user_doc(uid: str, email: str, name: str, role="user"):
-    doc_ref = db.collection("users").document(uid)
-    doc_ref.set(
-        {
-            "email": email,
-            "name": name,
-            "role": role,
-            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        }
-    )
+    doc_ref = collection("users").document(uid)
+    doc = {
+        "email": email,
+        "name": name,
+        "role": role,
+        "created_at": now_ts(),
+    }
+    doc.update(user_search_fields(doc))
+    doc_ref.set(doc)
+    usage.add(writes=1)
 
 
 def get_user_doc(uid: str):
-    doc = db.collection("users").document(uid).get()
-    return doc.to_dict() if doc.exists else None
+    cached = directory.get(uid) if directory.ready else None
+    if cached is not None:
+        return cached
+    doc = collection("users").document(uid).get()
+    usage.add(reads=1)
+    return normalize_dates(doc.to_dict()) if doc.exists else None
 
 
 def list_all_users():
-    users = db.collection("users").stream()
-    return [(u.id, u.to_dict()) for u in users]
+    if directory.ready:
+        return directory.all()
+    return usage.cached((current_tenant(), "list_all_users"), lambda: [
+        (u.id, normalize_dates(u.to_dict())) for u in collection("users").stream()
+    ])
+
+
+def update_user(uid: str, fields: dict):
+    """Partial update of a user doc (name, role, ...)."""
+    fields = dict(fields, **user_search_fields(fields))
+    collection("users").document(uid).update(fields)
+    usage.add(writes=1)
+    directory.patch(uid, fields)
+
+
+USER_BATCH_SIZE = 400
+
+
+def set_user_roles(uids, role: str):
+    """Give many users the same role, in batched writes."""
+    uids = list(uids)
+    for i in range(0, len(uids), USER_BATCH_SIZE):
+        batch = db.batch()
+        for uid in uids[i:i + USER_BATCH_SIZE]:
+            batch.update(collection("users").document(uid), {"role": role})
+        batch.commit()
+    usage.add(writes=len(uids))
+    for uid in uids:
+        directory.patch(uid, {"role": role})
+
+
+def search_users(prefix="", field="email", role=None, limit=50, after=None):
+    """
+    One page of users whose email / name starts with prefix (case-
+    insensitive), ordered by that field. Pass the returned cursor as
+    `after` for the next page; it is None on the last page. Answered from
+    the user directory when it is running, otherwise by a Firestore range
+    query on email_lower / name_lower.
+    """
+    if directory.ready:
+        return page_users(directory.all(), prefix, field, role, limit, after)
+    return _search_users(prefix, field, role, limit, after)
+
+
+@budgeted(count=lambda res: len(res[0]) + 1)
+def _search_users(prefix, field, role, limit, after):
+    key = USER_SEARCH_FIELDS[field]
+    prefix = (prefix or "").lower()
+    q = collection("users")
+    if role:
+        q = q.where(filter=FieldFilter("role", "==", role))
+    if prefix:
+        q = q.where(filter=FieldFilter(key, ">=", prefix))
+        q = q.where(filter=FieldFilter(key, "<", prefix + "\uf8ff"))
+    q = q.order_by(key).order_by(firestore.FieldPath.document_id())
+    if after:
+        q = q.start_after({key: after[0], firestore.FieldPath.document_id(): collection("users").document(after[1])})
+    snaps = list(q.limit(limit + 1).stream())
+    page = [(u.id, normalize_dates(u.to_dict())) for u in snaps[:limit]]
+    cursor = None
+    if len(snaps) > limit:
+        last_id, last = page[-1]
+        cursor = (last.get(key, ""), last_id)
+    return page, cursor
+
+
+def backfill_user_search_fields():
+    """One-off: add email_lower / name_lower to users created before search."""
+    batch, n = db.batch(), 0
+    for u in collection("users").stream():
+        data = u.to_dict() or {}
+        missing = {k: v for k, v in user_search_fields(data).items() if data.get(k) != v}
+        if missing:
+            batch.update(u.reference, missing); n += 1
+            if n % USER_BATCH_SIZE == 0:
+                batch.commit(); batch = db.batch()
+    batch.commit()
+    return n
+
+
+class UserDirectory:
+    """
+    In-memory copy of the users collection, indexed by uid, email and role.
+
+    start() opens a snapshot listener: the first snapshot loads every user,
+    later ones carry only the changed documents. While it runs,
+    get_user_doc() / list_all_users() are answered from memory. Callbacks
+    added with subscribe() are called (on the listener thread) after every
+    change with the list of changed uids.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = threading.Event()
+        self._watch = None
+        self._subscribers = []
+        self.by_uid = {}
+        self.by_email = {}
+        self.by_role = {}
+
+    @property
+    def ready(self):
+        return self._watch is not None and self._loaded.is_set()
+
+    def start(self, timeout=30):
+        """Start listening (idempotent) and wait for the initial load."""
+        with self._lock:
+            if self._watch is None:
+                self._watch = collection("users").on_snapshot(self._on_snapshot)
+        return self._loaded.wait(timeout)
+
+    def stop(self):
+        with self._lock:
+            if self._watch is not None:
+                self._watch.unsubscribe()
+            self._watch = None
+            self._loaded.clear()
+            self.by_uid, self.by_email, self.by_role = {}, {}, {}
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def _on_snapshot(self, _docs, changes, _read_time):
+        usage.add(reads=len(changes))
+        changed = []
+        with self._lock:
+            for ch in changes:
+                uid = ch.document.id
+                if ch.type.name == "REMOVED":
+                    self._drop(uid)
+                else:
+                    self._put(uid, normalize_dates(ch.document.to_dict()))
+                changed.append(uid)
+        self._loaded.set()
+        for cb in list(self._subscribers):
+            try:
+                cb(changed)
+            except Exception as e:
+                print(f"UserDirectory subscriber failed: {e}")
+
+    def _drop(self, uid):
+        old = self.by_uid.pop(uid, None)
+        if old is None:
+            return
+        self.by_email.pop((old.get("email") or "").lower(), None)
+        self.by_role.get(old.get("role"), set()).discard(uid)
+
+    def _put(self, uid, doc):
+        self._drop(uid)
+        self.by_uid[uid] = doc
+        if doc.get("email"):
+            self.by_email[doc["email"].lower()] = uid
+        self.by_role.setdefault(doc.get("role", "user"), set()).add(uid)
+
+    def patch(self, uid, fields):
+        """Apply a local write right away; the listener confirms it later."""
+        with self._lock:
+            if self._watch is not None and uid in self.by_uid:
+                self._put(uid, dict(self.by_uid[uid], **fields))
+
+    def get(self, uid):
+        with self._lock:
+            doc = self.by_uid.get(uid)
+            return dict(doc) if doc is not None else None
+
+    def find_email(self, email):
+        with self._lock:
+            uid = self.by_email.get((email or "").lower())
+            return (uid, dict(self.by_uid[uid])) if uid else None
+
+    def with_role(self, role):
+        with self._lock:
+            return [(uid, dict(self.by_uid[uid])) for uid in self.by_role.get(role, ())]
+
+    def all(self):
+        with self._lock:
+            return [(uid, dict(d)) for uid, d in self.by_uid.items()]
+
+
+# started on demand (the admin app does it for admins); until then the
+# user helpers above read Firestore directly
+directory = UserDirectory()
 
 
 # -------------------------------------------------------
 # COMPLAINT HELPERS
 # -------------------------------------------------------
-def create_complaint_doc(doc_data: dict):
+
+
+def create_complaint_doc(doc_data: dict, doc_id: str = None):
     """
     doc_data includes:
         title, description, category, priority,
         location, contact, status,
         created_at, created_by_uid, name, email
+    created_at may be a datetime or a legacy string.
+
+    With a doc_id the write is idempotent: the document is create()d, and if
+    it already exists (an earlier attempt went through) nothing is written
+    and (None, ref) is returned.
     """
-    return db.collection("complaints").add(doc_data)
+    data = prepare_complaint_doc(doc_data)
+    created_at = data["created_at"]
+    col = collection("complaints")
+    ref = col.document(doc_id) if doc_id else col.document()
+    batch = db.batch()
+    batch.create(ref, data)
+    rollup_ref, rollup = _rollup_increments(data, "CREATED", created_at)
+    if rollup_ref is not None:
+        batch.set(rollup_ref, rollup, merge=True)
+    shard_ref, counts = _counter_increments(STATUS_COUNTER, status_count_delta(None, data["status"]))
+    if shard_ref is not None:
+        batch.set(shard_ref, counts, merge=True)
+    try:
+        results = batch.commit()
+    except AlreadyExists:
+        # the batch is atomic, so the rollup and counter were not counted twice either
+        return None, ref
+    usage.add(writes=len(results))
+    _forget_counter(STATUS_COUNTER)
+    return results[0].update_time, ref
 
 
-def get_all_complaints():
+def _select(q, fields):
     """
-    'created_at' is stored as a string, so Firestore cannot order by timestamp directly.
-    We save timestamp as string YYYY-MM-DD HH:MM:SS so lexicographic order works.
+    Field projection for list queries (e.g. schema.LIST_FIELDS): only those
+    fields are sent, so long descriptions etc. are not downloaded.
+    created_at is always included since results are sorted on it.
     """
-    docs = (
-        db.collection("complaints")
-        .order_by("created_at", direction=firestore.Query.DESCENDING)
-        .stream()
-    )
-    return [(d.id, d.to_dict()) for d in docs]
+    if fields:
+        q = q.select(sorted(set(fields) | {"created_at"}))
+    return q
+
+
+@budgeted()
+def get_all_complaints(fields=None):
+    """
+    Newest first. Firestore orders timestamps before strings, so while
+    unmigrated string dates exist the final order is applied client-side.
+    fields: optional projection, see _select().
+    """
+    q = collection("complaints").order_by("created_at", direction=firestore.Query.DESCENDING)
+    docs = _select(q, fields).stream()
+    return sort_newest([(d.id, normalize_dates(d.to_dict())) for d in docs], "created_at")
+
+
+# status filter value meaning "everything still being worked on"
+ACTIVE = "ALL"
+ACTIVE_STATUSES = ["OPEN", "IN_PROGRESS", "RESOLVED"]
+
+
+@budgeted()
+def query_complaints(status=None, category=None, priority=None, created_by_uid=None,
+                     created_from=None, created_to=None, limit=None, fields=None, assigned_to_uid=None):
+    """
+    Complaints matching the filters, newest first, filtered by Firestore
+    rather than after downloading the collection.
+        status        -> one status, ACTIVE ("ALL": everything but CLOSED) or None
+        category / priority / created_by_uid / assigned_to_uid
+                      -> equality filters (None = any)
+        created_from / created_to -> datetime range on created_at [from, to)
+        fields        -> optional projection, see _select()
+    Equality filters are combined with the (field, created_at) composite
+    indexes in firestore.indexes.json.
+    """
+    rows = {}
+    for lo, hi in _date_range_variants(created_from, created_to, limited=bool(limit)):
+        q = collection("complaints")
+        if status == ACTIVE:
+            q = q.where(filter=FieldFilter("status", "in", ACTIVE_STATUSES))
+        elif status:
+            q = q.where(filter=FieldFilter("status", "==", status))
+        for field, value in (("category", category), ("priority", priority),
+                             ("created_by_uid", created_by_uid), ("assigned_to_uid", assigned_to_uid)):
+            if value:
+                q = q.where(filter=FieldFilter(field, "==", value))
+        if lo:
+            q = q.where(filter=FieldFilter("created_at", ">=", lo))
+        if hi:
+            q = q.where(filter=FieldFilter("created_at", "<", hi))
+        q = _select(q.order_by("created_at", direction=firestore.Query.DESCENDING), fields)
+        if limit:
+            q = q.limit(limit)
+        for d in q.stream():
+            rows[d.id] = normalize_dates(d.to_dict())
+    rows = sort_newest(rows.items(), "created_at")
+    return rows[:limit] if limit else rows
+
+
+def watch_complaints(on_change, status=ACTIVE):
+    """
+    Live query over complaints with the given status (default: not CLOSED).
+    on_change(upserts, removed_ids) runs on a background thread, first with
+    every matching complaint and afterwards only with what changed, where
+    upserts is [(cid, doc)]. Returns the watch; call .unsubscribe() to stop.
+    """
+    q = collection("complaints")
+    if status == ACTIVE:
+        q = q.where(filter=FieldFilter("status", "in", ACTIVE_STATUSES))
+    elif status:
+        q = q.where(filter=FieldFilter("status", "==", status))
+
+    def callback(_snapshots, changes, _read_time):
+        usage.add(reads=len(changes))
+        upserts, removed = [], []
+        for ch in changes:
+            if ch.type.name == "REMOVED":
+                removed.append(ch.document.id)
+            else:
+                upserts.append((ch.document.id, normalize_dates(ch.document.to_dict())))
+        on_change(upserts, removed)
+
+    return q.on_snapshot(callback)
+
+
+@budgeted()
+def get_status_changes(since, fields=None):
+    """
+    Complaints created or moved to another status at or after since, in
+    any status: a polling alternative to watch_complaints() for callers
+    that must not hold a listener. fields: optional projection, see _select().
+    """
+    rows = {}
+    for lo, _ in _date_range_variants(since, None):
+        q = collection("complaints").where(filter=FieldFilter("status_changed_at", ">=", lo))
+        for d in _select(q, fields).stream():
+            rows[d.id] = normalize_dates(d.to_dict())
+    return list(rows.items())
+
+
+@budgeted(count=lambda doc: 1)
+def get_complaint(complaint_id: str, include_archive=False):
+    doc = collection("complaints").document(complaint_id).get()
+    if not doc.exists and include_archive:
+        doc = collection(ARCHIVE_COLLECTION).document(complaint_id).get()
+    return normalize_dates(doc.to_dict()) if doc.exists else None
+
+
+def _status_change(transaction, current: dict, status: str, at, client=None):
+    """
+    Rollup, assignee load and status counter writes for moving a complaint
+    from its stored status to status; returns how many documents it wrote.
+    """
+    if status == current.get("status"):
+        return 0
+    writes = 0
+    rollup_ref, rollup = _rollup_increments(current, status, at, client=client)
+    if rollup_ref is not None:
+        transaction.set(rollup_ref, rollup, merge=True); writes += 1
+    load_ref, load = _load_increment(current, status, client=client)
+    if load_ref is not None:
+        transaction.update(load_ref, load); writes += 1
+    shard_ref, counts = _counter_increments(STATUS_COUNTER, status_count_delta(current.get("status"), status), client=client)
+    if shard_ref is not None:
+        transaction.set(shard_ref, counts, merge=True); writes += 1
+    return writes
 
 
-def get_complaint(complaint_id: str):
-    doc = db.collection("complaints").document(complaint_id).get()
-    return doc.to_dict() if doc.exists else None
+# Transaction bodies run again when Firestore retries on contention, so they
+# return their (reads, writes) and callers count them once, after the commit.
+@firestore.transactional
+def _set_status(transaction, complaint_ref, status: str):
+    current = complaint_ref.get(transaction=transaction).to_dict() or {}
+    at = now_ts()
+    fields = dict(status_fields(current, status, at), status=status, updated_at=at)
+    transaction.update(complaint_ref, fields)
+    return 1, 1 + _status_change(transaction, current, status, at)
 
 
 def update_complaint_status(complaint_id: str, status: str):
     """
-    Admin will use this.
+    Admin will use this; no timeline entry and no transition check (prefer
+    transition_complaint()). SLA / status_times, rollups, the assignee's
+    load and the status counter are updated in the same transaction.
     """
-    db.collection("complaints").document(complaint_id).update(
-        {
-            "status": status,
-            "updated_at": firestore.SERVER_TIMESTAMP,
-        }
-    )
+    reads, writes = _set_status(db.transaction(), collection("complaints").document(complaint_id), status)
+    usage.add(reads=reads, writes=writes)
+    _forget_counter(STATUS_COUNTER)
+
+
+@firestore.transactional
+def _write_update(transaction, complaint_ref, update_data: dict, set_status: bool, update_id=None):
+    updates = complaint_ref.collection("updates")
+    update_ref = updates.document(update_id) if update_id else updates.document()
+    if update_id and update_ref.get(transaction=transaction).exists:
+        return False, 1, 0  # already applied by an earlier attempt
+    snap = complaint_ref.get(transaction=transaction)
+    current = snap.to_dict() or {}
+    if set_status:
+        # checked against the stored status, so a late retry cannot move it back
+        check_transition(current.get("status"), update_data["status"])
+    fields = summary_fields(current, update_data)
+    if set_status:
+        fields["status"] = update_data["status"]
+        fields["updated_at"] = update_data.get("updated_at")
+    transaction.set(update_ref, dict(update_data, **_tenant_fields()))
+    transaction.update(complaint_ref, fields)
+    writes = 2
+    if set_status:
+        writes += _status_change(transaction, current, update_data["status"], update_data.get("updated_at"))
+    return True, 2 if update_id else 1, writes
 
 
 def add_complaint_update(complaint_id: str, update_data: dict):
@@ -155,25 +814,447 @@ def add_complaint_update(complaint_id: str, update_data: dict):
         remark
         updated_by_uid
         updated_by_name
-        updated_at (string: YYYY-MM-DD HH:MM:SS)
+        updated_at (datetime; legacy strings are converted)
+    The timeline entry and the summary on the parent document are written
+    in one transaction.
     """
-    updates_col = (
-        db.collection("complaints").document(complaint_id).collection("updates")
-    )
-    updates_col.add(update_data)
+    update_data = dict(update_data)
+    update_data["updated_at"] = to_datetime(update_data.get("updated_at")) or now_ts()
+    complaint_ref = collection("complaints").document(complaint_id)
+    _, reads, writes = _write_update(db.transaction(), complaint_ref, update_data, False)
+    usage.add(reads=reads, writes=writes)
 
 
-def get_complaint_updates(complaint_id: str):
+def transition_complaint(complaint_id: str, status: str, remark: str,
+                         updated_by_uid: str, updated_by_name: str, update_id: str = None):
     """
-    ordered by updated_at DESCENDING
-    Our updated_at is saved as a string "2025-02-24 13:45:55",
-    So ordering works correctly in Firestore.
+    Status change + timeline entry + summary in a single transaction.
+    Preferred over update_complaint_status() followed by add_complaint_update().
+    With an update_id (used as the timeline entry's id) a retried call is a
+    no-op once an earlier attempt has committed.
+    Raises InvalidTransition if the stored status does not allow the move.
+    """
+    update_data = {
+        "status": status,
+        "remark": remark or "",
+        "updated_by_uid": updated_by_uid,
+        "updated_by_name": updated_by_name,
+        "updated_at": now_ts(),
+    }
+    complaint_ref = collection("complaints").document(complaint_id)
+    _, reads, writes = _write_update(db.transaction(), complaint_ref, update_data, True, update_id)
+    usage.add(reads=reads, writes=writes)
+    _forget_counter(STATUS_COUNTER)
+    return update_data
+
+
+@budgeted()
+def get_complaint_updates(complaint_id: str, include_archive=False):
+    """
+    ordered by updated_at DESCENDING (re-sorted client-side, see get_all_complaints)
     """
     col = (
-        db.collection("complaints")
+        collection("complaints")
         .document(complaint_id)
         .collection("updates")
         .order_by("updated_at", direction=firestore.Query.DESCENDING)
         .stream()
     )
-    return [(d.id, d.to_dict()) for d in col]
+    rows = [(d.id, normalize_dates(d.to_dict())) for d in col]
+    if not rows and include_archive:
+        col = (
+            collection(ARCHIVE_COLLECTION)
+            .document(complaint_id)
+            .collection(ARCHIVE_UPDATES)
+            .stream()
+        )
+        rows = [(d.id, normalize_dates(d.to_dict())) for d in col]
+    return sort_newest(rows, "updated_at")
+
+
+@budgeted()
+def get_overdue_complaints(now=None, limit=200, fields=None):
+    """
+    Complaints past their sla_due_at (see schema.SLA_HOURS), most overdue
+    first. One indexed range query; escalation.py escalates these.
+    """
+    q = (
+        collection("complaints")
+        .where(filter=FieldFilter("sla_due_at", "<", to_datetime(now) or now_ts()))
+        .order_by("sla_due_at")
+    )
+    if fields:
+        q = q.select(sorted(set(fields) | {"created_at", "sla_due_at"}))
+    if limit:
+        q = q.limit(limit)
+    return [(d.id, normalize_dates(d.to_dict())) for d in q.stream()]
+
+
+# -------------------------------------------------------
+# ASSIGNMENT (balancing engine: assignment.py)
+# -------------------------------------------------------
+def _load_increment(current: dict, new_status: str, client=None):
+    """(assignee's user ref, open_load increment) for a status change, or (None, None)."""
+    assignee = current.get("assigned_to_uid")
+    delta = load_change(current.get("status"), new_status)
+    if not assignee or not delta:
+        return None, None
+    return collection("users", client).document(assignee), {"open_load": firestore.Increment(delta)}
+
+
+@firestore.transactional
+def _assign(transaction, complaint_ref, staff_uid, entry, if_unassigned):
+    current = complaint_ref.get(transaction=transaction).to_dict()
+    if current is None:
+        raise KeyError(f"No complaint {complaint_ref.id}")
+    old = current.get("assigned_to_uid")
+    if old == staff_uid or (if_unassigned and old):
+        return False, 1, 0
+    entry = dict(entry, status=current.get("status", ""))  # timeline shows the status it happened in
+    fields = note_fields(current, entry)
+    fields.update({"assigned_to_uid": staff_uid, "assigned_to_name": entry["assigned_to_name"],
+                   "assigned_at": entry["updated_at"]})
+    transaction.set(complaint_ref.collection("updates").document(), dict(entry, **_tenant_fields()))
+    transaction.update(complaint_ref, fields)
+    writes = 2
+    if current.get("status") in LOAD_STATUSES:
+        users = collection("users")
+        transaction.update(users.document(staff_uid), {"open_load": firestore.Increment(1)})
+        writes += 1
+        if old:
+            transaction.update(users.document(old), {"open_load": firestore.Increment(-1)})
+            writes += 1
+    return True, 1, writes
+
+
+def assign_complaint(complaint_id: str, staff_uid: str, staff_name: str,
+                     assigned_by_uid: str, assigned_by_name: str, if_unassigned=False):
+    """
+    (Re)assign a complaint, moving one unit of open_load from the previous
+    assignee to staff_uid, with a timeline entry, in one transaction.
+    Returns False when nothing changed (already assigned to staff_uid, or
+    to anyone if if_unassigned).
+    """
+    entry = {
+        "remark": f"Assigned to {staff_name}",
+        "updated_by_uid": assigned_by_uid,
+        "updated_by_name": assigned_by_name,
+        "updated_at": now_ts(),
+        "assigned_to_uid": staff_uid,
+        "assigned_to_name": staff_name,
+    }
+    ref = collection("complaints").document(complaint_id)
+    changed, reads, writes = _assign(db.transaction(), ref, staff_uid, entry, if_unassigned)
+    usage.add(reads=reads, writes=writes)
+    return changed
+
+
+def recount_open_loads():
+    """
+    Recompute open_load for every staff user from the complaints themselves
+    (first run, or after manual edits). Returns {uid: load}.
+    """
+    loads = {uid: 0 for uid, d in list_all_users() if d.get("role") == "staff"}
+    q = collection("complaints").where(filter=FieldFilter("status", "in", list(LOAD_STATUSES)))
+    for d in q.select(["assigned_to_uid"]).stream():
+        uid = (d.to_dict() or {}).get("assigned_to_uid")
+        if uid:
+            loads[uid] = loads.get(uid, 0) + 1
+    items = list(loads.items())
+    for i in range(0, len(items), USER_BATCH_SIZE):
+        batch = db.batch()
+        for uid, load in items[i:i + USER_BATCH_SIZE]:
+            batch.set(collection("users").document(uid), {"open_load": load}, merge=True)
+        batch.commit()
+    return loads
+
+
+# -------------------------------------------------------
+# ARCHIVE (CLOSED complaints moved out by archive.py)
+# -------------------------------------------------------
+ARCHIVE_COLLECTION = "complaints_archive"
+# not called 'updates', so collection-group queries (activity feed) skip it
+ARCHIVE_UPDATES = "archived_updates"
+
+
+@budgeted()
+def query_archive(category=None, priority=None, created_by_uid=None, limit=200, fields=None):
+    """
+    Archived complaints, newest first. Never consulted implicitly: the list
+    views and get_all_complaints() only see the hot collection.
+    """
+    q = collection(ARCHIVE_COLLECTION)
+    for field, value in (("category", category), ("priority", priority), ("created_by_uid", created_by_uid)):
+        if value:
+            q = q.where(filter=FieldFilter(field, "==", value))
+    q = _select(q.order_by("created_at", direction=firestore.Query.DESCENDING), fields)
+    if limit:
+        q = q.limit(limit)
+    return sort_newest([(d.id, normalize_dates(d.to_dict())) for d in q.stream()], "created_at")
+
+
+def closed_before_queries(cutoff):
+    """
+    [(field, query)] finding CLOSED complaints that were closed before
+    cutoff, each ordered by field for paging. status_changed_at is set by
+    every write path (creation and bulk import included); updated_at only
+    covers documents from before it existed.
+    """
+    queries = []
+    for field in ("status_changed_at", "updated_at"):
+        for _, hi in _date_range_variants(None, cutoff):
+            q = (
+                collection("complaints")
+                .where(filter=FieldFilter("status", "==", "CLOSED"))
+                .where(filter=FieldFilter(field, "<", hi))
+                .order_by(field)
+            )
+            queries.append((field, q))
+    return queries
+
+
+def archive_decrement():
+    """
+    (shard ref, merge data) taking one complaint off the CLOSED count.
+    Commit it in the same batch as that complaint's delete, then call
+    forget_status_counter().
+    """
+    return _counter_increments(STATUS_COUNTER, {"CLOSED": -1})
+
+
+def forget_status_counter():
+    """Drop this process's cached status totals (after writing the shards directly)."""
+    _forget_counter(STATUS_COUNTER)
+
+
+# -------------------------------------------------------
+# ACTIVITY FEED (collection-group over every 'updates')
+# -------------------------------------------------------
+
+
+@budgeted()
+def get_recent_updates(start=None, end=None, updated_by_uid=None, limit=200):
+    """
+    Cross-complaint timeline read: one indexed collection-group query over
+    every complaints/*/updates subcollection instead of one read per complaint.
+    start / end are datetimes (inclusive / exclusive).
+    Filtering by updated_by_uid together with a range needs the composite
+    index declared in firestore.indexes.json. Only the current tenant's
+    entries are returned (see updates_group()).
+    Returns [(complaint_id, update_id, data)] ordered by updated_at DESCENDING.
+    """
+    rows = {}
+    for lo, hi in _date_range_variants(start, end, limited=bool(limit)):
+        q = updates_group()
+        if updated_by_uid:
+            q = q.where(filter=FieldFilter("updated_by_uid", "==", updated_by_uid))
+        if lo:
+            q = q.where(filter=FieldFilter("updated_at", ">=", lo))
+        if hi:
+            q = q.where(filter=FieldFilter("updated_at", "<", hi))
+        q = q.order_by("updated_at", direction=firestore.Query.DESCENDING)
+        if limit:
+            q = q.limit(limit)
+        for d in q.stream():
+            if in_tenant(d.reference):
+                rows[d.reference.path] = (d.reference.parent.parent.id, d.id, normalize_dates(d.to_dict()))
+    rows = sort_newest(rows.values(), "updated_at", key=lambda r: r[2])
+    return rows[:limit] if limit else rows
+
+
+# -------------------------------------------------------
+# ANALYTICS ROLLUPS
+# -------------------------------------------------------
+# One small document per (day, category, priority) with counters, kept up to
+# date by create_complaint_doc() / transition_complaint() or rebuilt by
+# `python analytics.py rebuild`. The Analytics view only ever reads these.
+ROLLUP_COLLECTION = "analytics_rollups"
+
+
+def _rollup_increments(complaint: dict, event: str, at, client=None):
+    """(rollup doc ref, merge data) for one event; client defaults to db."""
+    res = rollup_delta(complaint, event, at)
+    if res is None:
+        return None, None
+    day, category, priority, delta = res
+    data = nest_paths(delta, firestore.Increment)
+    data.update({"day": day, "category": category, "priority": priority})
+    ref = collection(ROLLUP_COLLECTION, client).document(rollup_id(day, category, priority))
+    return ref, data
+
+
+@budgeted()
+def get_rollups(start_day: str, end_day: str = None):
+    """Rollup documents with start_day <= day <= end_day ('YYYY-MM-DD')."""
+    q = collection(ROLLUP_COLLECTION).where(filter=FieldFilter("day", ">=", start_day))
+    if end_day:
+        q = q.where(filter=FieldFilter("day", "<=", end_day))
+    return [d.to_dict() for d in q.stream()]
+
+
+# -------------------------------------------------------
+# SHARDED COUNTERS
+# -------------------------------------------------------
+# A single document that every status change increments would run into
+# Firestore's sustained limit of about one write per second per document.
+# A counter is spread over COUNTER_SHARDS documents
+# counters/{name}/shards/{i}: each write increments one shard picked at
+# random, in the same batch / transaction as the change it counts, and a
+# read sums the shards (cached for COUNTER_TTL seconds; this client's own
+# writes drop the cached value). STATUS_COUNTER holds complaints per status.
+COUNTER_COLLECTION = "counters"
+COUNTER_SHARDS = 10
+COUNTER_TTL = 15
+STATUS_COUNTER = "complaint_status"
+
+_counter_cache = {}      # (tenant, name) -> (time.monotonic(), totals or None)
+_counter_lock = threading.Lock()
+
+
+def _counter_shards(name, client=None):
+    return collection(COUNTER_COLLECTION, client).document(name).collection("shards")
+
+
+def _counter_increments(name, delta: dict, client=None):
+    """(random shard ref, merge data) adding delta {field: n}, or (None, None)."""
+    if not delta:
+        return None, None
+    ref = _counter_shards(name, client).document(str(random.randrange(COUNTER_SHARDS)))
+    return ref, {k: firestore.Increment(v) for k, v in delta.items()}
+
+
+def _cached_counter(name, max_age):
+    """(True, totals) if a fresh enough sum is cached, else (False, None)."""
+    with _counter_lock:
+        hit = _counter_cache.get((current_tenant(), name))
+    if hit is not None and time.monotonic() - hit[0] < max_age:
+        return True, (dict(hit[1]) if hit[1] is not None else None)
+    return False, None
+
+
+def _store_counter(name, shards):
+    usage.add(reads=max(1, len(shards)))
+    totals = sum_counter_shards(shards) if shards else None
+    with _counter_lock:
+        _counter_cache[(current_tenant(), name)] = (time.monotonic(), totals)
+    return dict(totals) if totals is not None else None
+
+
+def _forget_counter(name):
+    with _counter_lock:
+        _counter_cache.pop((current_tenant(), name), None)
+
+
+def get_counter(name=STATUS_COUNTER, max_age=COUNTER_TTL):
+    """
+    {field: total} over the counter's shards, e.g. {"OPEN": 12, ...} for
+    STATUS_COUNTER; None if it was never written (run rebuild_status_counter).
+    """
+    fresh, totals = _cached_counter(name, max_age)
+    if fresh:
+        return totals
+    return _store_counter(name, [s.to_dict() for s in _counter_shards(name).stream()])
+
+
+def rebuild_status_counter():
+    """
+    Recount complaints per status (count aggregations, no documents
+    downloaded) and reset the shards to match. Run once before the dashboard
+    uses the counter, and after bulk_import.py. Returns the totals.
+    """
+    totals = {}
+    for status in STATUSES:
+        q = collection("complaints").where(filter=FieldFilter("status", "==", status))
+        totals[status] = int(q.count().get()[0][0].value)
+    batch = db.batch()
+    shards = _counter_shards(STATUS_COUNTER)
+    for i in range(COUNTER_SHARDS):
+        batch.set(shards.document(str(i)), totals if i == 0 else dict.fromkeys(totals, 0))
+    batch.commit()
+    usage.add(reads=len(STATUSES), writes=COUNTER_SHARDS)
+    _forget_counter(STATUS_COUNTER)
+    return totals
+
+
+# -------------------------------------------------------
+# PARALLEL FULL SCAN (exports, checks, backfills)
+# -------------------------------------------------------
+# Characters Firestore auto-ids (and our hex / import ids) are drawn from,
+# in document-id order; used to cut the collection into id ranges.
+# (Partition queries only exist for collection groups, which span every
+# tenant's collection of the same name.)
+_ID_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+
+def _id_range_queries(name, count):
+    """count queries covering the collection by document-id ranges."""
+    col = collection(name)
+    step = len(_ID_ALPHABET) / count
+    bounds = [None] + [_ID_ALPHABET[int(i * step)] for i in range(1, count)] + [None]
+    queries = []
+    for lo, hi in zip(bounds, bounds[1:]):
+        q = col.order_by(firestore.FieldPath.document_id())
+        if lo:
+            q = q.where(filter=FieldFilter(firestore.FieldPath.document_id(), ">=", col.document(lo)))
+        if hi:
+            q = q.where(filter=FieldFilter(firestore.FieldPath.document_id(), "<", col.document(hi)))
+        queries.append(q)
+    return queries
+
+
+def scan_collection(name="complaints", partitions=8, workers=8, buffer=1000, fields=None):
+    """
+    Yield (doc_id, data) for every document of one of the current tenant's
+    collections, in no particular order. The collection is split into partitions that
+    are streamed concurrently by `workers` threads; at most `buffer`
+    documents wait in memory, so a slow consumer throttles the readers.
+    Stopping iteration early cancels the remaining work.
+    """
+    results = queue.Queue(maxsize=buffer)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def run(q):
+        try:
+            for d in _select(q, fields).stream():
+                if not put((d.id, normalize_dates(d.to_dict()))):
+                    return
+        except Exception as e:
+            put(e)
+        finally:
+            put(done)
+
+    queries = _id_range_queries(name, partitions)
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="crts-scan")
+    for q in queries:
+        pool.submit(run, q)
+    remaining = len(queries)
+    try:
+        while remaining:
+            item = results.get()
+            if item is done:
+                remaining -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield item
+    finally:
+        stop.set()
+        pool.shutdown(wait=False)
+
+
+# -------------------------------------------------------
+# CALL TRACING (opt-in with CRTS_TRACE, see tracer.py)
+# -------------------------------------------------------
+if os.environ.get("CRTS_TRACE"):
+    import tracer
+    tracer.install(sys.modules[__name__])
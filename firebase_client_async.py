@@ -0,0 +1,345 @@
+# firebase_client_async.py
+"""
+Asyncio version of firebase_client, built on the Firestore AsyncClient and
+an aiohttp.ClientSession (the same HTTP client as api_server) for the auth
+REST calls.
+
+All coroutines share one gRPC channel and one HTTP connection pool, so many
+concurrent reads cost one event loop instead of one OS thread each. Document
+shapes, date handling and summary/rollup writes are the same as in
+firebase_client (the helpers are reused from there).
+
+From Tk code use AsyncBridge: it runs a single event loop in a background
+thread and hands results back on the Tk thread, like run_thread /
+safe_run_in_thread do for blocking calls:
+
+    bridge = AsyncBridge(root)
+    bridge.run(win, lambda: get_all_complaints(), done)   # done(res, exc)
+"""
+
+import asyncio
+import functools
+import os
+import sys
+import threading
+import traceback
+
+import aiohttp
+from firebase_admin import firestore_async
+from google.cloud.firestore import async_transactional
+from google.api_core.exceptions import AlreadyExists
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from firebase_client import (
+    ARCHIVE_COLLECTION,
+    ARCHIVE_UPDATES,
+    FIREBASE_REST_SIGNIN,
+    FIREBASE_REST_SIGNUP,
+    COUNTER_TTL,
+    ROLLUP_COLLECTION,
+    STATUS_COUNTER,
+    _cached_counter,
+    _counter_increments,
+    _counter_shards,
+    _date_range_variants,
+    _forget_counter,
+    _rollup_increments,
+    _status_change,
+    _store_counter,
+    _tenant_fields,
+    collection,
+    current_tenant,
+    firestore,
+    in_tenant,
+    updates_group,
+    usage,
+)
+from schema import (
+    check_transition, normalize_dates, now_ts, prepare_complaint_doc, sort_newest, status_count_delta, summary_fields,
+    to_datetime, user_search_fields,
+)
+
+# firebase_client has already initialised the default app
+adb = firestore_async.client()
+
+_http = None
+
+
+def _http_client():
+    # created lazily so it binds to the loop that first uses it
+    global _http
+    if _http is None:
+        _http = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30))
+    return _http
+
+
+def budgeted(count=len):
+    """firebase_client.budgeted for coroutines; both share usage's cache."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        async def inner(*args, **kwargs):
+            key = repr((current_tenant(), fn.__name__, args, kwargs))
+            hit = usage.lookup(key)
+            if hit is not None:
+                return hit
+            result = await fn(*args, **kwargs)
+            usage.store(key, result, count(result))
+            return result
+        return inner
+    return wrap
+
+
+# -------------------------------------------------------
+# AUTH HELPERS
+# -------------------------------------------------------
+async def _post_auth(url, email, password):
+    payload = {"email": email, "password": password, "returnSecureToken": True}
+    async with _http_client().post(url, json=payload) as resp:
+        resp.raise_for_status()
+        return await resp.json()
+
+
+async def signup_with_email_password(email: str, password: str):
+    return await _post_auth(FIREBASE_REST_SIGNUP, email, password)
+
+
+async def signin_with_email_password(email: str, password: str):
+    return await _post_auth(FIREBASE_REST_SIGNIN, email, password)
+
+
+# -------------------------------------------------------
+# USER HELPERS
+# -------------------------------------------------------
+async def create_user_doc(uid: str, email: str, name: str, role="user"):
+    doc = {"email": email, "name": name, "role": role, "created_at": now_ts()}
+    doc.update(user_search_fields(doc))
+    await collection("users", adb).document(uid).set(doc)
+    usage.add(writes=1)
+
+
+async def get_user_doc(uid: str):
+    doc = await collection("users", adb).document(uid).get()
+    usage.add(reads=1)
+    return normalize_dates(doc.to_dict()) if doc.exists else None
+
+
+@budgeted()
+async def list_all_users():
+    return [(u.id, normalize_dates(u.to_dict())) async for u in collection("users", adb).stream()]
+
+
+# -------------------------------------------------------
+# COMPLAINT HELPERS
+# -------------------------------------------------------
+async def create_complaint_doc(doc_data: dict, doc_id: str = None):
+    data = prepare_complaint_doc(doc_data)
+    col = collection("complaints", adb)
+    ref = col.document(doc_id) if doc_id else col.document()
+    batch = adb.batch()
+    batch.create(ref, data)
+    rollup_ref, rollup = _rollup_increments(data, "CREATED", data["created_at"], client=adb)
+    if rollup_ref is not None:
+        batch.set(rollup_ref, rollup, merge=True)
+    shard_ref, counts = _counter_increments(STATUS_COUNTER, status_count_delta(None, data["status"]), client=adb)
+    if shard_ref is not None:
+        batch.set(shard_ref, counts, merge=True)
+    try:
+        results = await batch.commit()
+    except AlreadyExists:
+        return None, ref
+    usage.add(writes=len(results))
+    _forget_counter(STATUS_COUNTER)
+    return results[0].update_time, ref
+
+
+@budgeted()
+async def get_all_complaints(fields=None):
+    q = collection("complaints", adb).order_by("created_at", direction=firestore.Query.DESCENDING)
+    if fields:
+        q = q.select(sorted(set(fields) | {"created_at"}))
+    return sort_newest([(d.id, normalize_dates(d.to_dict())) async for d in q.stream()], "created_at")
+
+
+@budgeted(count=lambda doc: 1)
+async def get_complaint(complaint_id: str, include_archive=False):
+    doc = await collection("complaints", adb).document(complaint_id).get()
+    if not doc.exists and include_archive:
+        doc = await collection(ARCHIVE_COLLECTION, adb).document(complaint_id).get()
+    return normalize_dates(doc.to_dict()) if doc.exists else None
+
+
+@async_transactional
+async def _write_update(transaction, complaint_ref, update_data: dict, set_status: bool, update_id=None):
+    updates = complaint_ref.collection("updates")
+    update_ref = updates.document(update_id) if update_id else updates.document()
+    if update_id and (await update_ref.get(transaction=transaction)).exists:
+        return False, 1, 0
+    snap = await complaint_ref.get(transaction=transaction)
+    current = snap.to_dict() or {}
+    if set_status:
+        check_transition(current.get("status"), update_data["status"])
+    fields = summary_fields(current, update_data)
+    if set_status:
+        fields["status"] = update_data["status"]
+        fields["updated_at"] = update_data.get("updated_at")
+    transaction.set(update_ref, dict(update_data, **_tenant_fields()))
+    transaction.update(complaint_ref, fields)
+    writes = 2
+    if set_status:
+        writes += _status_change(transaction, current, update_data["status"], update_data.get("updated_at"), client=adb)
+    return True, 2 if update_id else 1, writes
+
+
+async def add_complaint_update(complaint_id: str, update_data: dict):
+    update_data = dict(update_data)
+    update_data["updated_at"] = to_datetime(update_data.get("updated_at")) or now_ts()
+    ref = collection("complaints", adb).document(complaint_id)
+    _, reads, writes = await _write_update(adb.transaction(), ref, update_data, False)
+    usage.add(reads=reads, writes=writes)
+
+
+async def transition_complaint(complaint_id: str, status: str, remark: str,
+                               updated_by_uid: str, updated_by_name: str, update_id: str = None):
+    update_data = {
+        "status": status,
+        "remark": remark or "",
+        "updated_by_uid": updated_by_uid,
+        "updated_by_name": updated_by_name,
+        "updated_at": now_ts(),
+    }
+    ref = collection("complaints", adb).document(complaint_id)
+    _, reads, writes = await _write_update(adb.transaction(), ref, update_data, True, update_id)
+    usage.add(reads=reads, writes=writes)
+    _forget_counter(STATUS_COUNTER)
+    return update_data
+
+
+@budgeted()
+async def get_complaint_updates(complaint_id: str, include_archive=False):
+    q = (
+        collection("complaints", adb)
+        .document(complaint_id)
+        .collection("updates")
+        .order_by("updated_at", direction=firestore.Query.DESCENDING)
+    )
+    rows = [(d.id, normalize_dates(d.to_dict())) async for d in q.stream()]
+    if not rows and include_archive:
+        q = collection(ARCHIVE_COLLECTION, adb).document(complaint_id).collection(ARCHIVE_UPDATES)
+        rows = [(d.id, normalize_dates(d.to_dict())) async for d in q.stream()]
+    return sort_newest(rows, "updated_at")
+
+
+@budgeted()
+async def get_recent_updates(start=None, end=None, updated_by_uid=None, limit=200):
+    async def run(lo, hi):
+        q = updates_group(adb)
+        if updated_by_uid:
+            q = q.where(filter=FieldFilter("updated_by_uid", "==", updated_by_uid))
+        if lo:
+            q = q.where(filter=FieldFilter("updated_at", ">=", lo))
+        if hi:
+            q = q.where(filter=FieldFilter("updated_at", "<", hi))
+        q = q.order_by("updated_at", direction=firestore.Query.DESCENDING)
+        if limit:
+            q = q.limit(limit)
+        return [(d.reference.path, d) async for d in q.stream() if in_tenant(d.reference)]
+
+    # the timestamp and legacy-string variants run concurrently
+    rows = {}
+    for result in await asyncio.gather(*(run(lo, hi) for lo, hi in _date_range_variants(start, end, bool(limit)))):
+        for path, d in result:
+            rows[path] = (d.reference.parent.parent.id, d.id, normalize_dates(d.to_dict()))
+    rows = sort_newest(rows.values(), "updated_at", key=lambda r: r[2])
+    return rows[:limit] if limit else rows
+
+
+@budgeted()
+async def get_rollups(start_day: str, end_day: str = None):
+    q = collection(ROLLUP_COLLECTION, adb).where(filter=FieldFilter("day", ">=", start_day))
+    if end_day:
+        q = q.where(filter=FieldFilter("day", "<=", end_day))
+    return [d.to_dict() async for d in q.stream()]
+
+
+async def get_counter(name=STATUS_COUNTER, max_age=COUNTER_TTL):
+    """Sharded counter totals; shares firebase_client's cache."""
+    fresh, totals = _cached_counter(name, max_age)
+    if fresh:
+        return totals
+    return _store_counter(name, [s.to_dict() async for s in _counter_shards(name, adb).stream()])
+
+
+async def get_complaints_with_updates(complaint_ids):
+    """{cid: (doc, updates)} for many complaints, fetched concurrently."""
+    async def one(cid):
+        doc, updates = await asyncio.gather(get_complaint(cid), get_complaint_updates(cid))
+        return cid, (doc, updates)
+    return dict(await asyncio.gather(*(one(cid) for cid in complaint_ids)))
+
+
+# -------------------------------------------------------
+# TK BRIDGE
+# -------------------------------------------------------
+class AsyncBridge:
+    """
+    One asyncio loop on a daemon thread. run() schedules a coroutine on it
+    and calls done(res, exc) on the Tk thread via root.after, skipping the
+    callback if the source window was destroyed meanwhile.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="crts-asyncio", daemon=True)
+        self.thread.start()
+
+    def submit(self, coro):
+        """Schedule a coroutine; returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, win, make_coro, done=None):
+        fut = self.submit(make_coro())
+
+        def finished(f):
+            res, exc = None, f.exception()
+            if exc is None:
+                res = f.result()
+
+            def cb():
+                try:
+                    if win is not None and not win.winfo_exists():
+                        return
+                except Exception:
+                    return
+                if done:
+                    try:
+                        done(res, exc)
+                    except Exception:
+                        print("Error in done callback:\n", traceback.format_exc())
+
+            try:
+                self.root.after(1, cb)
+            except Exception:
+                pass
+
+        fut.add_done_callback(finished)
+        return fut
+
+    def close(self):
+        async def shutdown():
+            global _http
+            if _http is not None:
+                await _http.close()
+                _http = None
+        try:
+            self.submit(shutdown()).result(timeout=5)
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+# -------------------------------------------------------
+# CALL TRACING (opt-in with CRTS_TRACE, see tracer.py)
+# -------------------------------------------------------
+if os.environ.get("CRTS_TRACE"):
+    import tracer
+    tracer.install(sys.modules[__name__])
@@ -0,0 +1,327 @@
+# loadtest.py
+"""
+Load test for the data layer: many simulated user and staff sessions.
+
+    python loadtest.py --users 2000 --staff 40 --duration 60       # in-memory store
+    python loadtest.py --backend emulator --users 200 --duration 60
+
+A user session signs in, lists their complaints, usually files a new one
+and opens one timeline; a staff session signs in, lists the active queue,
+opens a complaint and moves it one status forward. --concurrency threads
+run sessions back to back (--staff-share of them staff sessions, with
+--think seconds of random pause between steps) until --duration is over.
+
+Backends
+    memory    MemoryStore in this process (auth included), no network
+    emulator  firebase_client against the Firestore emulator
+              (FIRESTORE_EMULATOR_HOST must be set) and a stub of the
+              Identity Toolkit sign-up / sign-in REST API started here
+
+The report gives per operation: calls, errors, throughput, p50/p95/p99/max
+latency, and Firestore documents read (counted from what each call
+returned, plus the reads a transaction makes) and written (per call, from
+how firebase_client writes: e.g. a new complaint is the doc plus its
+rollup). --json saves the same numbers.
+"""
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from memory_store import AuthError, MemoryStore
+from schema import ALLOWED_TRANSITIONS, CATEGORIES, LIST_FIELDS, PRIORITIES, new_doc_id, now_ts
+from util import percentile
+
+PASSWORD = "loadtest-password"
+ACTIVE = "ALL"   # firebase_client.ACTIVE: every status but CLOSED
+
+# (fixed document reads, document writes) per call, on top of returned rows
+COST = {
+    "signin": (1, 0),          # profile read
+    "list_mine": (0, 0),
+    "list_queue": (0, 0),
+    "create": (0, 3),          # complaint, rollup, status counter shard
+    "timeline": (1, 0),        # complaint doc + returned entries
+    "transition": (2, 4),      # tx reads complaint + entry id; entry, complaint, rollup, counter shard
+}
+
+
+# -------------------------------------------------------
+# MEASUREMENT
+# -------------------------------------------------------
+class Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ops = {}   # name -> {"lat": [...], "errors", "reads", "writes"}
+
+    def call(self, name, fn, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self._add(name, time.perf_counter() - t0, error=True)
+            raise
+        rows = len(result) if isinstance(result, list) else 0
+        self._add(name, time.perf_counter() - t0, rows=rows)
+        return result
+
+    def _add(self, name, seconds, rows=0, error=False):
+        reads, writes = COST.get(name, (0, 0))
+        with self._lock:
+            op = self.ops.setdefault(name, {"lat": [], "errors": 0, "reads": 0, "writes": 0})
+            op["lat"].append(seconds)
+            if error:
+                op["errors"] += 1
+                return
+            # an empty query result is still billed as one read
+            op["reads"] += reads + max(rows, 1 if name.startswith("list") else 0)
+            op["writes"] += writes
+
+    def report(self, elapsed):
+        out = {}
+        with self._lock:
+            for name, op in sorted(self.ops.items()):
+                lat = op["lat"]
+                out[name] = {
+                    "calls": len(lat), "errors": op["errors"],
+                    "per_sec": round(len(lat) / elapsed, 1) if elapsed else 0.0,
+                    "p50_ms": round(percentile(lat, 0.50) * 1000, 1),
+                    "p95_ms": round(percentile(lat, 0.95) * 1000, 1),
+                    "p99_ms": round(percentile(lat, 0.99) * 1000, 1),
+                    "max_ms": round(max(lat, default=0.0) * 1000, 1),
+                    "reads": op["reads"], "writes": op["writes"],
+                }
+        return out
+
+
+def print_report(report, elapsed, sessions):
+    cols = ("calls", "errors", "per_sec", "p50_ms", "p95_ms", "p99_ms", "max_ms", "reads", "writes")
+    print(f"\n{sessions} sessions in {elapsed:.1f}s ({sessions / elapsed:.1f}/s)\n")
+    print(f"{'operation':<12}" + "".join(f"{c:>10}" for c in cols))
+    for name, r in report.items():
+        print(f"{name:<12}" + "".join(f"{r[c]:>10}" for c in cols))
+    total_r = sum(r["reads"] for r in report.values())
+    total_w = sum(r["writes"] for r in report.values())
+    print(f"\nDocument reads {total_r} ({total_r / elapsed:.0f}/s), writes {total_w} ({total_w / elapsed:.0f}/s)")
+
+
+# -------------------------------------------------------
+# STUB AUTH SERVER (Identity Toolkit REST shape)
+# -------------------------------------------------------
+class StubAuthServer:
+    """
+    accounts:signUp / accounts:signInWithPassword served from a MemoryStore,
+    answering like identitytoolkit.googleapis.com (errors as
+    {"error": {"message": "EMAIL_EXISTS"}} with status 400).
+    """
+
+    def __init__(self, store=None, host="127.0.0.1", port=0):
+        self.store = store or MemoryStore()
+        store = self.store
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                try:
+                    if "accounts:signUp" in self.path:
+                        res = store.signup_with_email_password(body.get("email"), body.get("password"))
+                    elif "accounts:signInWithPassword" in self.path:
+                        res = store.signin_with_email_password(body.get("email"), body.get("password"))
+                    else:
+                        return self._send(404, {"error": {"message": "NOT_FOUND"}})
+                except AuthError as e:
+                    return self._send(400, {"error": {"message": str(e)}})
+                self._send(200, res)
+
+            def _send(self, status, data):
+                raw = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.url = f"http://{host}:{self.httpd.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, name="stub-auth", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+
+
+# -------------------------------------------------------
+# SESSIONS
+# -------------------------------------------------------
+def new_complaint(account):
+    return {
+        "title": random.choice(("Projector", "Wi-Fi", "AC", "Printer", "Leak", "Door lock")) + " not working",
+        "description": "Reported by the load test. " * random.randint(1, 8),
+        "category": random.choice(CATEGORIES),
+        "priority": random.choice(PRIORITIES),
+        "location": f"Block {random.choice('ABCD')}-{random.randint(1, 400)}",
+        "contact": account["email"],
+        "status": "OPEN",
+        "created_at": now_ts(),
+        "created_by_uid": account["uid"],
+        "name": account["name"],
+        "email": account["email"],
+    }
+
+
+def _pause(think):
+    if think:
+        time.sleep(random.expovariate(1 / think))
+
+
+def user_session(backend, stats, account, think=0.0, create_share=0.6):
+    stats.call("signin", _signin, backend, account)
+    _pause(think)
+    mine = stats.call("list_mine", backend.query_complaints, created_by_uid=account["uid"],
+                      fields=LIST_FIELDS, limit=50)
+    _pause(think)
+    if random.random() < create_share:
+        stats.call("create", backend.create_complaint_doc, new_complaint(account), doc_id=new_doc_id())
+        _pause(think)
+    if mine:
+        cid = random.choice(mine)[0]
+        stats.call("timeline", _timeline, backend, cid)
+
+
+def staff_session(backend, stats, account, think=0.0):
+    stats.call("signin", _signin, backend, account)
+    _pause(think)
+    queue = stats.call("list_queue", backend.query_complaints, status=ACTIVE, fields=LIST_FIELDS, limit=100)
+    _pause(think)
+    workable = [(cid, d) for cid, d in queue if ALLOWED_TRANSITIONS.get(d.get("status"))]
+    if not workable:
+        return
+    cid, d = random.choice(workable)
+    stats.call("timeline", _timeline, backend, cid)
+    _pause(think)
+    nxt = ALLOWED_TRANSITIONS[d["status"]][0]
+    stats.call("transition", backend.transition_complaint, cid, nxt, "load test", account["uid"],
+               account["name"], update_id=new_doc_id())
+
+
+def _signin(backend, account):
+    res = backend.signin_with_email_password(account["email"], PASSWORD)
+    return backend.get_user_doc(res["localId"])
+
+
+def _timeline(backend, cid):
+    backend.get_complaint(cid)
+    return backend.get_complaint_updates(cid)
+
+
+# -------------------------------------------------------
+# SETUP / RUN
+# -------------------------------------------------------
+def create_accounts(backend, users, staff, workers=16):
+    def make(i, role):
+        email = f"lt-{role}-{i}@example.com"
+        try:
+            uid = backend.signup_with_email_password(email, PASSWORD)["localId"]
+        except Exception:  # left over from an earlier run
+            uid = backend.signin_with_email_password(email, PASSWORD)["localId"]
+        name = f"LT {role} {i}"
+        backend.create_user_doc(uid, email, name, role=role)
+        return {"uid": uid, "email": email, "name": name, "role": role}
+
+    with ThreadPoolExecutor(workers) as pool:
+        accounts = list(pool.map(lambda a: make(*a), [(i, "user") for i in range(users)] +
+                                 [(i, "staff") for i in range(staff)]))
+    return [a for a in accounts if a["role"] == "user"], [a for a in accounts if a["role"] == "staff"]
+
+
+def seed_complaints(backend, users, count, workers=16):
+    with ThreadPoolExecutor(workers) as pool:
+        list(pool.map(lambda _: backend.create_complaint_doc(new_complaint(random.choice(users)),
+                                                             doc_id=new_doc_id()), range(count)))
+
+
+def run(backend, users, staff, duration=30.0, concurrency=32, staff_share=0.1, think=0.0, max_sessions=None):
+    """Run the session mix; returns (Stats, elapsed seconds, sessions run)."""
+    stats = Stats()
+    counter = {"n": 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker():
+        while time.monotonic() < deadline:
+            with lock:
+                if max_sessions and counter["n"] >= max_sessions:
+                    return
+                counter["n"] += 1
+            try:
+                if staff and random.random() < staff_share:
+                    staff_session(backend, stats, random.choice(staff), think)
+                else:
+                    user_session(backend, stats, random.choice(users), think)
+            except Exception:
+                pass  # already counted as an error of the failing operation
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return stats, time.perf_counter() - t0, counter["n"]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Load-test CRTS sessions against the data layer")
+    ap.add_argument("--backend", choices=("memory", "emulator"), default="memory")
+    ap.add_argument("--users", type=int, default=200, help="student accounts to simulate")
+    ap.add_argument("--staff", type=int, default=10, help="staff accounts to simulate")
+    ap.add_argument("--staff-share", type=float, default=0.1, help="fraction of sessions that are staff")
+    ap.add_argument("--concurrency", type=int, default=32, help="sessions running at once (threads)")
+    ap.add_argument("--duration", type=float, default=30, help="seconds to run")
+    ap.add_argument("--sessions", type=int, help="stop after this many sessions")
+    ap.add_argument("--think", type=float, default=0.0, help="mean pause between steps, seconds")
+    ap.add_argument("--seed", type=int, default=200, help="complaints created before measuring")
+    ap.add_argument("--json", help="also write the report to this file")
+    args = ap.parse_args(argv)
+
+    auth = None
+    if args.backend == "memory":
+        backend = MemoryStore()
+    else:
+        if not os.environ.get("FIRESTORE_EMULATOR_HOST"):
+            ap.error("start the emulator (firebase emulators:start --only firestore) "
+                     "and set FIRESTORE_EMULATOR_HOST")
+        import firebase_client as backend
+        auth = StubAuthServer().start()
+        backend.FIREBASE_REST_SIGNUP = f"{auth.url}/v1/accounts:signUp"
+        backend.FIREBASE_REST_SIGNIN = f"{auth.url}/v1/accounts:signInWithPassword"
+
+    print(f"Creating {args.users} users, {args.staff} staff, {args.seed} complaints...")
+    users, staff = create_accounts(backend, args.users, args.staff)
+    seed_complaints(backend, users, args.seed)
+
+    print(f"Running {args.concurrency} concurrent sessions for {args.duration:.0f}s...")
+    stats, elapsed, sessions = run(backend, users, staff, args.duration, args.concurrency,
+                                   args.staff_share, args.think, args.sessions)
+    report = stats.report(elapsed)
+    print_report(report, elapsed, sessions)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"backend": args.backend, "elapsed": elapsed, "sessions": sessions,
+                       "args": vars(args), "operations": report}, f, indent=2)
+    if auth:
+        auth.stop()
+
+
+if __name__ == "__main__":
+    main()
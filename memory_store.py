@@ -0,0 +1,379 @@
+# memory_store.py
+"""
+In-memory stand-in for firebase_client, for local runs and tests without a
+Firebase project (api_server --backend memory, load tests, trace replay).
+
+MemoryStore exposes the same function names and return shapes as
+firebase_client, so code written against the module works unchanged against
+an instance. Auth is simulated: signup/signin hand out opaque tokens that
+verify_id_token() maps back to the uid. All methods are thread-safe.
+One instance holds one tenant's data (firebase_client.set_tenant has no
+counterpart here); use an instance per institution.
+"""
+
+import copy
+import threading
+import uuid
+from types import SimpleNamespace
+
+from schema import (
+    LOAD_STATUSES,
+    STATUSES,
+    check_transition,
+    load_change,
+    normalize_dates,
+    note_fields,
+    now_ts,
+    page_users,
+    prepare_complaint_doc,
+    rollup_delta,
+    rollup_id,
+    sort_newest,
+    status_count_delta,
+    status_fields,
+    summary_fields,
+    to_datetime,
+    user_search_fields,
+)
+
+
+class AuthError(Exception):
+    """Raised with the Firebase REST error code as message (e.g. EMAIL_EXISTS)."""
+
+
+def _project(rows, fields):
+    """select() stand-in: keep only fields (plus created_at) of each doc."""
+    if not fields:
+        return rows
+    keep = set(fields) | {"created_at"}
+    return [(cid, {k: v for k, v in d.items() if k in keep}) for cid, d in rows]
+
+
+def _apply_paths(doc: dict, fields: dict):
+    """Apply {'a.b': v} style field paths like Firestore's update()."""
+    for path, value in fields.items():
+        node = doc
+        *parents, leaf = path.split(".")
+        for p in parents:
+            node = node.setdefault(p, {})
+        node[leaf] = value
+
+
+class MemoryStore:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.accounts = {}      # email -> {"uid", "password"}
+        self.tokens = {}        # idToken -> uid
+        self.users = {}         # uid -> doc
+        self.complaints = {}    # cid -> doc
+        self.updates = {}       # cid -> {update_id: doc}
+        self.rollups = {}       # rollup id -> doc
+        self.archive = {}       # cid -> (doc, {update_id: doc})
+        self.counters = {}      # counter name -> {field: total} (no shards needed here)
+
+    # ---------------- auth ----------------
+    def signup_with_email_password(self, email: str, password: str):
+        with self._lock:
+            if email in self.accounts:
+                raise AuthError("EMAIL_EXISTS")
+            if len(password) < 6:
+                raise AuthError("WEAK_PASSWORD")
+            uid = uuid.uuid4().hex[:28]
+            self.accounts[email] = {"uid": uid, "password": password}
+            return self._issue(uid, email)
+
+    def signin_with_email_password(self, email: str, password: str):
+        with self._lock:
+            acct = self.accounts.get(email)
+            if acct is None:
+                raise AuthError("EMAIL_NOT_FOUND")
+            if acct["password"] != password:
+                raise AuthError("INVALID_PASSWORD")
+            return self._issue(acct["uid"], email)
+
+    def _issue(self, uid, email):
+        token = uuid.uuid4().hex
+        self.tokens[token] = uid
+        return {"localId": uid, "idToken": token, "email": email, "refreshToken": token, "expiresIn": "3600"}
+
+    def verify_id_token(self, id_token: str):
+        with self._lock:
+            if id_token not in self.tokens:
+                raise AuthError("INVALID_ID_TOKEN")
+            return self.tokens[id_token]
+
+    # ---------------- users ----------------
+    def create_user_doc(self, uid: str, email: str, name: str, role="user"):
+        with self._lock:
+            doc = {"email": email, "name": name, "role": role, "created_at": now_ts()}
+            self.users[uid] = dict(doc, **user_search_fields(doc))
+
+    def get_user_doc(self, uid: str):
+        with self._lock:
+            doc = self.users.get(uid)
+            return copy.deepcopy(doc) if doc is not None else None
+
+    def list_all_users(self):
+        with self._lock:
+            return [(uid, copy.deepcopy(d)) for uid, d in self.users.items()]
+
+    def update_user(self, uid: str, fields: dict):
+        with self._lock:
+            if uid not in self.users:
+                raise KeyError(f"No user {uid}")
+            self.users[uid].update(fields, **user_search_fields(fields))
+
+    def set_user_roles(self, uids, role: str):
+        with self._lock:
+            for uid in uids:
+                self.update_user(uid, {"role": role})
+
+    def search_users(self, prefix="", field="email", role=None, limit=50, after=None):
+        return page_users(self.list_all_users(), prefix, field, role, limit, after)
+
+    # ---------------- complaints ----------------
+    def create_complaint_doc(self, doc_data: dict, doc_id: str = None):
+        with self._lock:
+            if doc_id and (doc_id in self.complaints or doc_id in self.archive):
+                return None, SimpleNamespace(id=doc_id)  # already created
+            data = prepare_complaint_doc(doc_data)
+            cid = doc_id or uuid.uuid4().hex[:20]
+            self.complaints[cid] = data
+            self.updates[cid] = {}
+            self._bump_rollup(data, "CREATED", data["created_at"])
+            self._bump_counter("complaint_status", status_count_delta(None, data["status"]))
+            # same shape as firebase_client: (write time, ref with .id)
+            return data["created_at"], SimpleNamespace(id=cid)
+
+    def get_all_complaints(self, fields=None):
+        with self._lock:
+            items = [(cid, copy.deepcopy(d)) for cid, d in self.complaints.items()]
+        return _project(sort_newest([(cid, normalize_dates(d)) for cid, d in items], "created_at"), fields)
+
+    def query_complaints(self, status=None, category=None, priority=None, created_by_uid=None,
+                         created_from=None, created_to=None, limit=None, fields=None, assigned_to_uid=None):
+        created_from, created_to = to_datetime(created_from), to_datetime(created_to)
+        rows = []
+        for cid, d in self.get_all_complaints():
+            if status == "ALL" and d.get("status") == "CLOSED":
+                continue
+            if status and status != "ALL" and d.get("status") != status:
+                continue
+            if any(v and d.get(f) != v for f, v in
+                   (("category", category), ("priority", priority), ("created_by_uid", created_by_uid),
+                    ("assigned_to_uid", assigned_to_uid))):
+                continue
+            at = d.get("created_at")
+            if (created_from or created_to) and at is None:
+                continue  # a Firestore range filter never matches a missing date
+            if (created_from and at < created_from) or (created_to and at >= created_to):
+                continue
+            rows.append((cid, d))
+        return _project(rows[:limit] if limit else rows, fields)
+
+    def get_status_changes(self, since, fields=None):
+        since = to_datetime(since)
+        with self._lock:
+            rows = [(cid, copy.deepcopy(d)) for cid, d in self.complaints.items()
+                    if d.get("status_changed_at") is not None and d["status_changed_at"] >= since]
+        return _project(rows, fields)
+
+    def get_overdue_complaints(self, now=None, limit=200, fields=None):
+        now = to_datetime(now) or now_ts()
+        with self._lock:
+            rows = [(cid, copy.deepcopy(d)) for cid, d in self.complaints.items()
+                    if d.get("sla_due_at") is not None and d["sla_due_at"] < now]
+        rows.sort(key=lambda r: r[1]["sla_due_at"])
+        return _project(rows[:limit] if limit else rows, set(fields or ()) | {"sla_due_at"} if fields else None)
+
+    def get_complaint(self, complaint_id: str, include_archive=False):
+        with self._lock:
+            doc = self.complaints.get(complaint_id)
+            if doc is None and include_archive and complaint_id in self.archive:
+                doc = self.archive[complaint_id][0]
+            return normalize_dates(copy.deepcopy(doc)) if doc is not None else None
+
+    def update_complaint_status(self, complaint_id: str, status: str):
+        with self._lock:
+            current = self._require(complaint_id)
+            at = now_ts()
+            fields = dict(status_fields(current, status, at), status=status, updated_at=at)
+            self._status_change(current, status, at)
+            _apply_paths(current, fields)
+
+    def _status_change(self, current, status, at):
+        if status != current.get("status"):
+            self._bump_rollup(current, status, at)
+            self._bump_load(current.get("assigned_to_uid"), load_change(current.get("status"), status))
+            self._bump_counter("complaint_status", status_count_delta(current.get("status"), status))
+
+    def _require(self, complaint_id):
+        if complaint_id not in self.complaints:
+            raise KeyError(f"No complaint {complaint_id}")
+        return self.complaints[complaint_id]
+
+    def _write_update(self, complaint_id, update_data, set_status, update_id=None):
+        with self._lock:
+            current = self._require(complaint_id)
+            if update_id and update_id in self.updates[complaint_id]:
+                return False
+            if set_status:
+                check_transition(current.get("status"), update_data["status"])
+            fields = summary_fields(current, update_data)
+            if set_status:
+                fields["status"] = update_data["status"]
+                fields["updated_at"] = update_data.get("updated_at")
+                self._status_change(current, update_data["status"], update_data.get("updated_at"))
+            self.updates[complaint_id][update_id or uuid.uuid4().hex[:20]] = dict(update_data)
+            _apply_paths(current, copy.deepcopy(fields))
+            return True
+
+    def add_complaint_update(self, complaint_id: str, update_data: dict):
+        update_data = dict(update_data)
+        update_data["updated_at"] = to_datetime(update_data.get("updated_at")) or now_ts()
+        self._write_update(complaint_id, update_data, False)
+
+    def transition_complaint(self, complaint_id: str, status: str, remark: str,
+                             updated_by_uid: str, updated_by_name: str, update_id: str = None):
+        update_data = {
+            "status": status,
+            "remark": remark or "",
+            "updated_by_uid": updated_by_uid,
+            "updated_by_name": updated_by_name,
+            "updated_at": now_ts(),
+        }
+        self._write_update(complaint_id, update_data, True, update_id)
+        return update_data
+
+    def get_complaint_updates(self, complaint_id: str, include_archive=False):
+        with self._lock:
+            ups = self.updates.get(complaint_id)
+            if ups is None and include_archive and complaint_id in self.archive:
+                ups = self.archive[complaint_id][1]
+            items = [(uid, copy.deepcopy(u)) for uid, u in (ups or {}).items()]
+        return sort_newest(items, "updated_at")
+
+    def get_recent_updates(self, start=None, end=None, updated_by_uid=None, limit=200):
+        start, end = to_datetime(start), to_datetime(end)
+        rows = []
+        with self._lock:
+            for cid, ups in self.updates.items():
+                for uid, u in ups.items():
+                    at = u.get("updated_at")
+                    if updated_by_uid and u.get("updated_by_uid") != updated_by_uid:
+                        continue
+                    if (start and at < start) or (end and at >= end):
+                        continue
+                    rows.append((cid, uid, copy.deepcopy(u)))
+        rows = sort_newest(rows, "updated_at", key=lambda r: r[2])
+        return rows[:limit] if limit else rows
+
+    # ---------------- assignment ----------------
+    def _bump_load(self, uid, delta):
+        if uid and delta and uid in self.users:
+            self.users[uid]["open_load"] = self.users[uid].get("open_load", 0) + delta
+
+    def assign_complaint(self, complaint_id, staff_uid, staff_name, assigned_by_uid, assigned_by_name,
+                         if_unassigned=False):
+        with self._lock:
+            current = self._require(complaint_id)
+            old = current.get("assigned_to_uid")
+            if old == staff_uid or (if_unassigned and old):
+                return False
+            entry = {
+                "status": current.get("status", ""),
+                "remark": f"Assigned to {staff_name}",
+                "updated_by_uid": assigned_by_uid,
+                "updated_by_name": assigned_by_name,
+                "updated_at": now_ts(),
+                "assigned_to_uid": staff_uid,
+                "assigned_to_name": staff_name,
+            }
+            fields = note_fields(current, entry)
+            fields.update({"assigned_to_uid": staff_uid, "assigned_to_name": staff_name,
+                           "assigned_at": entry["updated_at"]})
+            if current.get("status") in LOAD_STATUSES:
+                self._bump_load(staff_uid, 1)
+                self._bump_load(old, -1)
+            self.updates[complaint_id][uuid.uuid4().hex[:20]] = entry
+            _apply_paths(current, copy.deepcopy(fields))
+            return True
+
+    def recount_open_loads(self):
+        with self._lock:
+            loads = {uid: 0 for uid, d in self.users.items() if d.get("role") == "staff"}
+            for d in self.complaints.values():
+                if d.get("status") in LOAD_STATUSES and d.get("assigned_to_uid"):
+                    loads[d["assigned_to_uid"]] = loads.get(d["assigned_to_uid"], 0) + 1
+            for uid, load in loads.items():
+                if uid in self.users:
+                    self.users[uid]["open_load"] = load
+            return loads
+
+    # ---------------- archive ----------------
+    def archive_closed(self, older_than):
+        """Move CLOSED complaints last updated before older_than (datetime)."""
+        moved = 0
+        with self._lock:
+            for cid, d in list(self.complaints.items()):
+                at = to_datetime(d.get("updated_at"))
+                if d.get("status") == "CLOSED" and at and at < older_than:
+                    doc = dict(self.complaints.pop(cid), archived_at=now_ts())
+                    self._bump_counter("complaint_status", {"CLOSED": -1})
+                    self.archive[cid] = (doc, self.updates.pop(cid, {}))
+                    moved += 1
+        return moved
+
+    def query_archive(self, category=None, priority=None, created_by_uid=None, limit=200, fields=None):
+        with self._lock:
+            items = [(cid, copy.deepcopy(doc)) for cid, (doc, _) in self.archive.items()]
+        rows = [
+            (cid, d) for cid, d in sort_newest(items, "created_at")
+            if not any(v and d.get(f) != v for f, v in
+                       (("category", category), ("priority", priority), ("created_by_uid", created_by_uid)))
+        ]
+        return _project(rows[:limit] if limit else rows, fields)
+
+    # ---------------- analytics ----------------
+    def _bump_rollup(self, complaint, event, at):
+        res = rollup_delta(complaint, event, at)
+        if res is None:
+            return
+        day, category, priority, delta = res
+        doc = self.rollups.setdefault(
+            rollup_id(day, category, priority),
+            {"day": day, "category": category, "priority": priority},
+        )
+        for path, value in delta.items():
+            node = doc
+            *parents, leaf = path.split(".")
+            for p in parents:
+                node = node.setdefault(p, {})
+            node[leaf] = node.get(leaf, 0) + value
+
+    def get_rollups(self, start_day: str, end_day: str = None):
+        with self._lock:
+            return [
+                copy.deepcopy(r) for r in self.rollups.values()
+                if r["day"] >= start_day and (end_day is None or r["day"] <= end_day)
+            ]
+
+    # ---------------- counters ----------------
+    def _bump_counter(self, name, delta):
+        totals = self.counters.setdefault(name, {})
+        for key, value in delta.items():
+            totals[key] = totals.get(key, 0) + value
+
+    def get_counter(self, name="complaint_status", max_age=None):
+        with self._lock:
+            totals = self.counters.get(name)
+            return dict(totals) if totals is not None else None
+
+    def rebuild_status_counter(self):
+        with self._lock:
+            totals = dict.fromkeys(STATUSES, 0)
+            for d in self.complaints.values():
+                if d.get("status") in totals:
+                    totals[d["status"]] += 1
+            self.counters["complaint_status"] = dict(totals)
+            return totals
@@ -0,0 +1,168 @@
+# migrate_timestamps.py
+"""
+One-off migration of legacy "YYYY-MM-DD HH:MM:SS" string dates to native
+Firestore timestamps.
+
+    python migrate_timestamps.py                 # all targets
+    python migrate_timestamps.py --only updates  # one target
+    python migrate_timestamps.py --dry-run
+
+Documents are read in pages ordered by document path and rewritten with
+batched writes that are committed on a thread pool. Progress is recorded in
+a checkpoint file after every page whose batch (and every earlier batch)
+has committed, so an interrupted run resumes where it stopped. Re-running is
+safe: documents without string dates are skipped.
+
+firebase_client reads both formats, so the apps keep working while this
+runs. Set firebase_client.LEGACY_STRING_DATES = False afterwards.
+"""
+
+import argparse
+import json
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from firebase_client import db, firestore
+from schema import TS_FIELDS, to_datetime
+
+CHECKPOINT_PATH = "migrate_timestamps.checkpoint.json"
+
+TARGETS = {
+    "complaints": lambda: db.collection("complaints"),
+    "updates": lambda: db.collection_group("updates"),
+    "users": lambda: db.collection("users"),
+}
+
+
+def converted_fields(data: dict) -> dict:
+    """Field-path -> timestamp for every string date in one document."""
+    out = {}
+
+    def conv(value):
+        return to_datetime(value) if isinstance(value, str) else None
+
+    for f in TS_FIELDS:
+        ts = conv(data.get(f))
+        if ts is not None:
+            out[f] = ts
+    for st, value in (data.get("status_times") or {}).items():
+        ts = conv(value)
+        if ts is not None:
+            out[f"status_times.{st}"] = ts
+    ts = conv((data.get("last_update") or {}).get("updated_at"))
+    if ts is not None:
+        out["last_update.updated_at"] = ts
+    recent = data.get("recent_updates") or []
+    if any(conv(u.get("updated_at")) is not None for u in recent):
+        out["recent_updates"] = [
+            dict(u, updated_at=conv(u.get("updated_at")) or u.get("updated_at")) for u in recent
+        ]
+    return out
+
+
+class Checkpoint:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.state = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    def get(self, target):
+        with self.lock:
+            return dict(self.state.get(target, {}))
+
+    def update(self, target, **fields):
+        with self.lock:
+            self.state.setdefault(target, {}).update(fields)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.state, f, indent=2)
+            os.replace(tmp, self.path)
+
+
+def migrate_target(name, checkpoint, pool, page_size=300, max_inflight=4, dry_run=False):
+    state = checkpoint.get(name)
+    if state.get("done"):
+        print(f"[{name}] already migrated, skipping")
+        return
+    scanned, converted = state.get("scanned", 0), state.get("converted", 0)
+    cursor = state.get("cursor")
+    inflight = deque()  # (future, last_path, scanned, converted) in page order
+
+    def settle(wait_all=False):
+        # checkpoint only advances over a prefix of committed pages
+        while inflight:
+            if not inflight[0][0].done() and not wait_all and len(inflight) < max_inflight:
+                break
+            fut, path, sc, cv = inflight.popleft()
+            fut.result()
+            if not dry_run:
+                checkpoint.update(name, cursor=path, scanned=sc, converted=cv)
+
+    base = TARGETS[name]().order_by(firestore.FieldPath.document_id())
+    while True:
+        q = base.limit(page_size)
+        if cursor:
+            q = q.start_after({firestore.FieldPath.document_id(): db.document(cursor)})
+        page = list(q.stream())
+        if not page:
+            break
+
+        batch, n = db.batch(), 0
+        for snap in page:
+            fields = converted_fields(snap.to_dict() or {})
+            if fields:
+                batch.update(snap.reference, fields); n += 1
+        scanned += len(page); converted += n
+        cursor = page[-1].reference.path
+
+        if dry_run or n == 0:
+            fut = pool.submit(lambda: None)
+        else:
+            fut = pool.submit(batch.commit)
+        inflight.append((fut, cursor, scanned, converted))
+        settle()
+        print(f"[{name}] scanned={scanned} converted={converted}")
+
+    settle(wait_all=True)
+    if not dry_run:
+        checkpoint.update(name, done=True, scanned=scanned, converted=converted)
+    print(f"[{name}] finished: scanned={scanned} converted={converted}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Migrate string dates to Firestore timestamps")
+    ap.add_argument("--only", choices=sorted(TARGETS), action="append", help="limit to target(s)")
+    ap.add_argument("--page-size", type=int, default=300, help="documents per batch (max 500)")
+    ap.add_argument("--workers", type=int, default=4, help="concurrent batch commits per target")
+    ap.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    ap.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    ap.add_argument("--dry-run", action="store_true", help="count only, write nothing")
+    args = ap.parse_args(argv)
+
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    checkpoint = Checkpoint(args.checkpoint)
+    targets = args.only or list(TARGETS)
+    page_size = min(args.page_size, 500)
+
+    with ThreadPoolExecutor(max_workers=args.workers * len(targets)) as pool:
+        threads = [
+            threading.Thread(
+                target=migrate_target,
+                args=(t, checkpoint, pool, page_size, args.workers, args.dry_run),
+            )
+            for t in targets
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+
+if __name__ == "__main__":
+    main()
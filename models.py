@@ -1,6 +1,6 @@
 # models.py
 from typing import Optional
-from firebase_client import get_user_doc, get_all_complaints, get_complaint, get_complaint_updates
+from firebase_client import get_user_doc, get_all_complaints, query_complaints
 
 def user_role(uid: str) -> Optional[str]:
     u = get_user_doc(uid)
@@ -11,7 +11,6 @@ def complaints_for_user(uid: str, role: str):
     If role == 'user' => return only complaints created by uid.
     else return all complaints
     """
-    all_complaints = get_all_complaints()
     if role == "user":
-        return [(cid, data) for cid, data in all_complaints if data.get("created_by_uid") == uid]
-    return all_complaints
+        return query_complaints(created_by_uid=uid)
+    return get_all_complaints()
@@ -0,0 +1,230 @@
+# outbox.py
+"""
+Durable local queue for writes made from the desktop apps.
+
+Submitting a complaint or a status change only inserts a row into a SQLite
+file and returns at once; a background flusher sends queued operations to
+the backend (firebase_client by default) and retries failures with
+exponential backoff, so nothing is lost when campus Wi-Fi drops.
+
+Every operation carries an idempotency key, which becomes the document id
+of the new complaint / timeline entry. firebase_client treats a repeated
+write with the same key as a no-op, so an operation whose first attempt
+succeeded but whose reply was lost can be resent safely.
+
+    box = Outbox(on_event=...)                 # starts the flusher
+    key = box.enqueue_create(complaint_data)
+    key = box.enqueue_transition(cid, "RESOLVED", remark, uid, name)
+
+on_event(kind, key, op, info) is called from the flusher thread with kind
+"sent" (info = backend result), "retry" (info = exception) or "failed"
+(gave up after MAX_ATTEMPTS, or the backend rejected a transition as
+stale; the row stays in the file, see failed()).
+
+Operations on one complaint are sent strictly in order: while an earlier
+one is waiting for a retry or has failed, later ones for the same
+complaint stay queued.
+"""
+
+import contextlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import traceback
+from datetime import datetime
+
+from schema import InvalidTransition, new_doc_id, to_datetime
+from util import DATA_DIR
+
+DEFAULT_PATH = os.path.join(DATA_DIR, "outbox.sqlite3")
+MAX_ATTEMPTS = 8
+BASE_DELAY = 2.0        # seconds, doubled per attempt
+MAX_DELAY = 300.0
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"$ts": value.isoformat()}
+    raise TypeError(f"Cannot queue {type(value).__name__}")
+
+
+def _decode(obj):
+    if set(obj) == {"$ts"}:
+        return to_datetime(obj["$ts"])
+    return obj
+
+
+def backoff(attempts):
+    """Delay before the next try: exponential with jitter, capped."""
+    return min(MAX_DELAY, BASE_DELAY * 2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+
+
+class Outbox:
+    def __init__(self, path=DEFAULT_PATH, backend=None, on_event=None, start=True):
+        if backend is None:
+            import firebase_client as backend
+        self.backend = backend
+        self.on_event = on_event
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = False
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS ops (
+                   seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                   key TEXT UNIQUE NOT NULL,
+                   kind TEXT NOT NULL,
+                   payload TEXT NOT NULL,
+                   attempts INTEGER NOT NULL DEFAULT 0,
+                   next_try REAL NOT NULL DEFAULT 0,
+                   failed INTEGER NOT NULL DEFAULT 0,
+                   last_error TEXT
+               )"""
+        )
+        self.thread = threading.Thread(target=self._run, name="crts-outbox", daemon=True)
+        if start:
+            self.thread.start()
+
+    # ---------------- enqueue ----------------
+    def _enqueue(self, kind, payload, key=None):
+        key = key or new_doc_id()
+        # sent later, maybe after a logout, so remember whose data it is
+        tenant = getattr(self.backend, "current_tenant", None)
+        if tenant is not None and tenant():
+            payload = dict(payload, tenant=tenant())
+        with self._lock:
+            # same key twice (double click) keeps the first row
+            self.conn.execute(
+                "INSERT OR IGNORE INTO ops (key, kind, payload) VALUES (?, ?, ?)",
+                (key, kind, json.dumps(payload, default=_encode)),
+            )
+        self._wake.set()
+        return key
+
+    def enqueue_create(self, doc_data: dict, key=None):
+        return self._enqueue("create", {"doc": doc_data}, key)
+
+    def enqueue_transition(self, complaint_id, status, remark, updated_by_uid, updated_by_name, key=None):
+        return self._enqueue("transition", {
+            "cid": complaint_id, "status": status, "remark": remark,
+            "uid": updated_by_uid, "name": updated_by_name,
+        }, key)
+
+    # ---------------- inspection ----------------
+    def _rows(self, where, args=()):
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT key, kind, payload, attempts, last_error FROM ops WHERE {where} ORDER BY seq", args
+            ).fetchall()
+        return [
+            {"key": k, "kind": kind, "op": json.loads(p, object_hook=_decode), "attempts": a, "error": e}
+            for k, kind, p, a, e in rows
+        ]
+
+    def pending(self, kind=None):
+        if kind:
+            return self._rows("failed = 0 AND kind = ?", (kind,))
+        return self._rows("failed = 0")
+
+    def failed(self):
+        return self._rows("failed = 1")
+
+    def retry_failed(self):
+        with self._lock:
+            self.conn.execute("UPDATE ops SET failed = 0, attempts = 0, next_try = 0 WHERE failed = 1")
+        self._wake.set()
+
+    # ---------------- flusher ----------------
+    def _send(self, kind, op, key):
+        scope = getattr(self.backend, "tenant_scope", None)
+        with scope(op.get("tenant", "")) if scope else contextlib.nullcontext():
+            return self._send_op(kind, op, key)
+
+    def _send_op(self, kind, op, key):
+        if kind == "create":
+            return self.backend.create_complaint_doc(op["doc"], doc_id=key)
+        if kind == "transition":
+            return self.backend.transition_complaint(
+                op["cid"], op["status"], op["remark"], op["uid"], op["name"], update_id=key
+            )
+        raise ValueError(f"Unknown outbox operation {kind!r}")
+
+    def _notify(self, *args):
+        if self.on_event:
+            try:
+                self.on_event(*args)
+            except Exception:
+                print("Error in outbox callback:\n", traceback.format_exc())
+
+    @staticmethod
+    def _complaint_of(kind, op, key):
+        # a queued create uses its key as the new complaint's id
+        return key if kind == "create" else op.get("cid")
+
+    def flush_once(self):
+        """
+        Send every due operation once; returns seconds until the next is due.
+        An operation is held back while an earlier one for the same complaint
+        is not yet due or has failed.
+        """
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT seq, key, kind, payload, attempts, next_try, failed FROM ops ORDER BY seq"
+            ).fetchall()
+        blocked, wake = set(), None
+        for seq, key, kind, payload, attempts, next_try, failed in rows:
+            if self._stop:
+                break
+            op = json.loads(payload, object_hook=_decode)
+            cid = self._complaint_of(kind, op, key)
+            if failed or cid in blocked:
+                blocked.add(cid)
+                continue
+            if next_try > time.time():
+                blocked.add(cid)
+                wake = next_try if wake is None else min(wake, next_try)
+                continue
+            try:
+                result = self._send(kind, op, key)
+            except Exception as e:
+                blocked.add(cid)
+                attempts += 1
+                # a stale transition will never apply; don't retry it
+                gave_up = attempts >= MAX_ATTEMPTS or isinstance(e, InvalidTransition)
+                next_try = time.time() + backoff(attempts)
+                with self._lock:
+                    self.conn.execute(
+                        "UPDATE ops SET attempts = ?, next_try = ?, failed = ?, last_error = ? WHERE seq = ?",
+                        (attempts, next_try, int(gave_up), str(e), seq),
+                    )
+                if not gave_up:
+                    wake = next_try if wake is None else min(wake, next_try)
+                self._notify("failed" if gave_up else "retry", key, op, e)
+                continue
+            with self._lock:
+                self.conn.execute("DELETE FROM ops WHERE seq = ?", (seq,))
+            self._notify("sent", key, op, result)
+        return None if wake is None else max(0.0, wake - time.time())
+
+    def _run(self):
+        while not self._stop:
+            self._wake.clear()
+            try:
+                wait = self.flush_once()
+            except Exception:
+                print("Outbox flush error:\n", traceback.format_exc())
+                wait = BASE_DELAY
+            self._wake.wait(timeout=wait)
+
+    def close(self):
+        self._stop = True
+        self._wake.set()
+        if self.thread.is_alive():
+            self.thread.join(timeout=5)
+        with self._lock:
+            self.conn.close()
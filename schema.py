@@ -0,0 +1,375 @@
+# schema.py
+"""
+Document shapes shared by every backend (Firestore, async Firestore and the
+in-memory store): allowed values, date handling, the status-history summary
+and the analytics rollup counters. Nothing here talks to Firebase.
+"""
+import uuid
+from datetime import datetime, timedelta, timezone
+
+# -------------------------------------------------------
+# COMPLAINT SCHEMA
+# -------------------------------------------------------
+STATUSES = ("OPEN", "IN_PROGRESS", "RESOLVED", "CLOSED")
+PRIORITIES = ("LOW", "MEDIUM", "HIGH", "CRITICAL")
+CATEGORIES = ("IT", "HR", "Facilities", "Finance", "Admin", "Other")
+COMPLAINT_FIELDS = (
+    "title", "description", "category", "priority", "location", "contact",
+    "status", "created_at", "created_by_uid", "name", "email",
+)
+
+# What the list views show; list queries fetch only these (select()), the
+# detail windows read the full document.
+LIST_FIELDS = ("title", "name", "email", "category", "priority", "status", "created_at", "created_by_uid",
+               "assigned_to_name")
+
+# What the student app's duplicate check may read of other people's
+# complaints: the text only, never who filed it or how to reach them.
+DUPLICATE_FIELDS = ("title", "description", "status", "created_at")
+
+# Forward-only lifecycle: OPEN -> IN_PROGRESS -> RESOLVED -> CLOSED
+ALLOWED_TRANSITIONS = {"OPEN": ["IN_PROGRESS"], "IN_PROGRESS": ["RESOLVED"], "RESOLVED": ["CLOSED"], "CLOSED": []}
+
+
+class InvalidTransition(ValueError):
+    """Status change not allowed from the complaint's stored status."""
+
+
+def check_transition(current: str, status: str):
+    """Raise InvalidTransition unless current -> status is in ALLOWED_TRANSITIONS."""
+    if status not in ALLOWED_TRANSITIONS.get(current, []):
+        raise InvalidTransition(f"Invalid transition {current} -> {status}")
+
+
+def new_doc_id() -> str:
+    """
+    Client-generated id for a new complaint / timeline entry. Generate one
+    per form session (not per click) and pass it as doc_id / update_id:
+    resending the same write is then a no-op instead of a duplicate.
+    """
+    return uuid.uuid4().hex
+
+
+# -------------------------------------------------------
+# USERS
+# -------------------------------------------------------
+ROLES = ("user", "staff", "admin")
+# lower-cased copies used for case-insensitive prefix search
+USER_SEARCH_FIELDS = {"email": "email_lower", "name": "name_lower"}
+
+
+def user_search_fields(fields: dict) -> dict:
+    """email_lower / name_lower for whichever of email / name is in fields."""
+    return {USER_SEARCH_FIELDS[f]: (fields[f] or "").lower() for f in USER_SEARCH_FIELDS if f in fields}
+
+
+def page_users(rows, prefix="", field="email", role=None, limit=50, after=None):
+    """
+    In-memory equivalent of firebase_client.search_users over (uid, doc)
+    rows: case-insensitive prefix match on field, ordered by (value, uid).
+    Returns (page, cursor) with cursor None on the last page.
+    """
+    prefix = (prefix or "").lower()
+    keyed = sorted(
+        ((((d.get(field) or "").lower(), uid), uid, d) for uid, d in rows
+         if (not role or d.get("role", "user") == role)),
+        key=lambda r: r[0],
+    )
+    keyed = [r for r in keyed if r[0][0].startswith(prefix) and (after is None or r[0] > tuple(after))]
+    page = keyed[:limit]
+    cursor = page[-1][0] if len(keyed) > limit else None
+    return [(uid, d) for _, uid, d in page], cursor
+
+
+# -------------------------------------------------------
+# TIMESTAMPS
+# -------------------------------------------------------
+# Dates are stored as native Firestore timestamps. Older documents still
+# hold "YYYY-MM-DD HH:MM:SS" strings (local time) until
+# `python migrate_timestamps.py` has been run, so every read path accepts
+# both and normalizes to timezone-aware datetimes.
+TS_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Top-level date fields on complaint / user / update documents.
+TS_FIELDS = ("created_at", "updated_at", "status_changed_at")
+
+
+def now_ts():
+    return datetime.now(timezone.utc)
+
+
+def to_datetime(value):
+    """
+    Legacy string or Firestore timestamp -> aware datetime.
+    Returns None for missing / unparseable values.
+    """
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.astimezone()
+    if isinstance(value, str):
+        try:
+            # legacy strings were written with datetime.now(), i.e. local time
+            return datetime.strptime(value, TS_FORMAT).astimezone()
+        except ValueError:
+            pass
+        try:
+            # ISO-8601, e.g. from JSON exports
+            return to_datetime(datetime.fromisoformat(value))
+        except ValueError:
+            return None
+    return None
+
+
+def format_ts(value, fmt=TS_FORMAT):
+    """Display form of a stored date, in local time ('' if missing)."""
+    dt = to_datetime(value)
+    if dt is None:
+        return value if isinstance(value, str) else ""
+    return dt.astimezone().strftime(fmt)
+
+
+def normalize_dates(data: dict):
+    """Convert every known date field of a document to aware datetimes in place."""
+    if not data:
+        return data
+    for f in TS_FIELDS:
+        if f in data:
+            data[f] = to_datetime(data[f])
+    if isinstance(data.get("status_times"), dict):
+        data["status_times"] = {k: to_datetime(v) for k, v in data["status_times"].items()}
+    if isinstance(data.get("last_update"), dict):
+        normalize_dates(data["last_update"])
+    for u in data.get("recent_updates") or []:
+        normalize_dates(u)
+    return data
+
+
+def sort_newest(items, field, key=lambda item: item[1]):
+    """Client-side newest-first sort; mixed string/timestamp values do not sort in Firestore."""
+    floor = datetime.min.replace(tzinfo=timezone.utc)
+    return sorted(items, key=lambda item: key(item).get(field) or floor, reverse=True)
+
+
+def validate_complaint(row: dict):
+    """
+    Check a raw complaint record (e.g. a spreadsheet row) against the schema.
+    Returns (clean_data, errors); clean_data only holds COMPLAINT_FIELDS,
+    with defaults applied and created_at parsed.
+    """
+    errors = []
+    data = {k: (row.get(k).strip() if isinstance(row.get(k), str) else row.get(k))
+            for k in COMPLAINT_FIELDS if row.get(k) not in (None, "")}
+
+    for k in ("title", "description"):
+        if not data.get(k):
+            errors.append(f"{k} is required")
+    data.setdefault("category", "Other")
+    data.setdefault("priority", "MEDIUM")
+    data.setdefault("status", "OPEN")
+    data["priority"] = str(data["priority"]).upper()
+    data["status"] = str(data["status"]).upper()
+    if data["category"] not in CATEGORIES:
+        errors.append(f"unknown category {data['category']!r}")
+    if data["priority"] not in PRIORITIES:
+        errors.append(f"unknown priority {data['priority']!r}")
+    if data["status"] not in STATUSES:
+        errors.append(f"unknown status {data['status']!r}")
+    if "created_at" in data:
+        created = to_datetime(data["created_at"])
+        if created is None:
+            errors.append(f"bad created_at {data['created_at']!r} (want YYYY-MM-DD HH:MM:SS)")
+        data["created_at"] = created
+    else:
+        errors.append("created_at is required")
+    data.setdefault("location", "")
+    data.setdefault("contact", data.get("email", ""))
+    return data, errors
+
+
+# -------------------------------------------------------
+# STATUS-HISTORY SUMMARY
+# -------------------------------------------------------
+# How many timeline entries are mirrored onto the complaint document.
+RECENT_UPDATES_LIMIT = 5
+
+
+def summary_fields(current: dict, update_data: dict):
+    """
+    Denormalized status-history summary kept on the complaint document:
+        last_update      -> the newest timeline entry
+        recent_updates   -> last RECENT_UPDATES_LIMIT entries, newest first
+        status_times     -> {status: updated_at} of the latest entry per status
+        status_changed_at
+    """
+    entry = {
+        "status": update_data.get("status", ""),
+        "remark": update_data.get("remark", ""),
+        "updated_by_uid": update_data.get("updated_by_uid"),
+        "updated_by_name": update_data.get("updated_by_name", ""),
+        "updated_at": update_data.get("updated_at"),
+    }
+    recent = [entry] + list(current.get("recent_updates") or [])
+    fields = {
+        "last_update": entry,
+        "recent_updates": recent[:RECENT_UPDATES_LIMIT],
+    }
+    if entry["status"]:
+        fields.update(status_fields(current, entry["status"], entry["updated_at"]))
+    return fields
+
+
+def status_fields(current: dict, status: str, at):
+    """status_times entry, plus status_changed_at / sla_due_at if the status changes."""
+    fields = {f"status_times.{status}": at}
+    if status != current.get("status"):
+        fields["status_changed_at"] = at
+        fields["sla_due_at"] = sla_due_at(current.get("priority"), status, at)
+    return fields
+
+
+def note_fields(current: dict, update_data: dict):
+    """
+    summary_fields() for a timeline entry that does not change the status
+    (escalation, assignment): status_times keeps meaning "when the
+    complaint entered each status", so it is left alone.
+    """
+    return {k: v for k, v in summary_fields(current, update_data).items() if not k.startswith("status_times.")}
+
+
+def prepare_complaint_doc(doc_data: dict):
+    """
+    Copy of doc_data ready to store: created_at as a native timestamp (now
+    if missing) and the status-history summary fields (see summary_fields)
+    initialised, so detail windows never need a second read.
+    """
+    data = dict(doc_data)
+    status = data.get("status", "OPEN")
+    created_at = to_datetime(data.get("created_at")) or now_ts()
+    data["created_at"] = created_at
+    data.setdefault("status_times", {status: created_at})
+    data.setdefault("status_changed_at", created_at)
+    data.setdefault("recent_updates", [])
+    data.setdefault("sla_due_at", sla_due_at(data.get("priority"), status, created_at))
+    data.setdefault("assigned_to_uid", None)  # explicit null so "unassigned" is queryable
+    return data
+
+
+# -------------------------------------------------------
+# SLA / ESCALATION
+# -------------------------------------------------------
+# Hours a complaint may stay in an actionable status before it is overdue.
+# sla_due_at on the complaint holds the deadline for its current status
+# (null once RESOLVED / CLOSED), so overdue work is one range query.
+SLA_HOURS = {"CRITICAL": 4, "HIGH": 24, "MEDIUM": 72, "LOW": 168}
+SLA_STATUSES = ("OPEN", "IN_PROGRESS")
+ESCALATE_TO = {"LOW": "MEDIUM", "MEDIUM": "HIGH", "HIGH": "CRITICAL", "CRITICAL": "CRITICAL"}
+
+
+def sla_due_at(priority, status, since):
+    """Deadline for a complaint that entered status at since, or None."""
+    since = to_datetime(since)
+    if status not in SLA_STATUSES or since is None:
+        return None
+    return since + timedelta(hours=SLA_HOURS.get(priority, SLA_HOURS["MEDIUM"]))
+
+
+# -------------------------------------------------------
+# ASSIGNMENT
+# -------------------------------------------------------
+# Staff user documents carry open_load, the number of complaints assigned to
+# them that are still in a LOAD_STATUSES status, and optionally categories,
+# the complaint categories they handle (missing / empty = any category).
+LOAD_STATUSES = ("OPEN", "IN_PROGRESS")
+
+
+def load_change(old_status, new_status) -> int:
+    """Change to the assignee's open_load when a complaint moves old -> new."""
+    return (new_status in LOAD_STATUSES) - (old_status in LOAD_STATUSES)
+
+
+# -------------------------------------------------------
+# STATUS COUNTERS (dashboard totals, sharded in firebase_client)
+# -------------------------------------------------------
+def status_count_delta(old_status, new_status) -> dict:
+    """Per-status count changes when a complaint moves old -> new (old None: created)."""
+    if old_status == new_status:
+        return {}
+    delta = {}
+    if old_status in STATUSES:
+        delta[old_status] = -1
+    if new_status in STATUSES:
+        delta[new_status] = 1
+    return delta
+
+
+def sum_counter_shards(shards) -> dict:
+    """Field-wise total of counter shard documents."""
+    totals = {}
+    for shard in shards:
+        for key, value in (shard or {}).items():
+            if isinstance(value, (int, float)):
+                totals[key] = totals.get(key, 0) + value
+    return totals
+
+# -------------------------------------------------------
+# ANALYTICS ROLLUP COUNTERS
+# -------------------------------------------------------
+# Time-to-resolve histogram: (field key, upper bound in hours; None = open ended)
+RESOLVE_BUCKETS = [
+    ("lt_1h", 1),
+    ("1h_4h", 4),
+    ("4h_1d", 24),
+    ("1d_3d", 72),
+    ("3d_7d", 168),
+    ("gt_7d", None),
+]
+
+
+def resolve_bucket(seconds: float) -> str:
+    hours = seconds / 3600
+    for key, upper in RESOLVE_BUCKETS:
+        if upper is None or hours < upper:
+            return key
+    return RESOLVE_BUCKETS[-1][0]
+
+
+def rollup_id(day: str, category: str, priority: str) -> str:
+    # '/' would be read as a path separator in a document id
+    return "|".join(str(p or "-").replace("/", "-") for p in (day, category, priority))
+
+
+def rollup_delta(complaint: dict, event: str, at):
+    """
+    Counter increments for one event on one complaint, as plain numbers.
+    event is "CREATED" or the status the complaint moved into.
+    Days are bucketed in local time.
+    Returns (day, category, priority, delta) or None if 'at' is unusable.
+    """
+    at_dt = to_datetime(at)
+    if at_dt is None:
+        return None
+    category = complaint.get("category") or "Other"
+    priority = complaint.get("priority") or "MEDIUM"
+    delta = {}
+    if event == "CREATED":
+        delta["created"] = 1
+    else:
+        delta[f"entered.{event}"] = 1
+        created = to_datetime(complaint.get("created_at"))
+        if event == "RESOLVED" and created is not None:
+            secs = max((at_dt - created).total_seconds(), 0)
+            delta["resolved_count"] = 1
+            delta["resolve_seconds_sum"] = secs
+            delta[f"resolve_hist.{resolve_bucket(secs)}"] = 1
+    return at_dt.astimezone().strftime("%Y-%m-%d"), category, priority, delta
+
+
+def nest_paths(delta: dict, wrap):
+    """{'a.b': 1} -> {'a': {'b': wrap(1)}} for set(..., merge=True)."""
+    out = {}
+    for path, value in delta.items():
+        node = out
+        *parents, leaf = path.split(".")
+        for p in parents:
+            node = node.setdefault(p, {})
+        node[leaf] = wrap(value)
+    return out
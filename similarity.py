@@ -0,0 +1,123 @@
+# similarity.py
+"""
+In-memory near-duplicate index over complaint text (no Firebase imports).
+
+Each complaint is reduced to a set of normalised words; a MinHash signature
+of that set is split into LSH bands, so a lookup only compares against the
+few complaints that share a band instead of every open complaint. Candidates
+are then scored by exact Jaccard similarity (title weighted higher than the
+description).
+
+    index = DuplicateIndex()
+    index.apply([(cid, doc), ...], removed_ids)    # e.g. from a snapshot listener
+    index.query(title, description)                # -> [(score, cid, doc), ...]
+
+All methods are thread-safe: updates usually arrive on a listener thread
+while lookups happen on the Tk thread.
+"""
+
+import random
+import re
+import threading
+import zlib
+
+_PRIME = (1 << 61) - 1
+_WORD = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have i in is it its my of on or our
+please the this to was were with not no very there here we me you your can
+""".split())
+
+
+def tokens(text: str) -> frozenset:
+    """Lower-cased words, stop words and single letters dropped, plural 's' stripped."""
+    out = set()
+    for w in _WORD.findall((text or "").lower()):
+        if len(w) < 2 or w in STOPWORDS:
+            continue
+        if len(w) > 3 and w.endswith("s") and not w.endswith("ss"):
+            w = w[:-1]
+        out.add(w)
+    return frozenset(out)
+
+
+def jaccard(a, b) -> float:
+    if not a and not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class DuplicateIndex:
+    def __init__(self, num_perm=32, bands=16, threshold=0.5, title_weight=0.6):
+        assert num_perm % bands == 0
+        rnd = random.Random(1)  # fixed seed: signatures are stable across runs
+        self.perms = [(rnd.randrange(1, _PRIME), rnd.randrange(0, _PRIME)) for _ in range(num_perm)]
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.title_weight = title_weight
+        self._lock = threading.Lock()
+        self.entries = {}   # cid -> (title_tokens, all_tokens, band_keys, doc)
+        self.buckets = {}   # band_key -> set of cids
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _band_keys(self, words):
+        hashes = [zlib.crc32(w.encode()) for w in words]
+        if not hashes:
+            return ()
+        sig = [min((a * h + b) % _PRIME for h in hashes) for a, b in self.perms]
+        r = self.rows
+        return tuple((i, tuple(sig[i * r:(i + 1) * r])) for i in range(self.bands))
+
+    def _entry(self, title, description):
+        t = tokens(title)
+        words = t | tokens(description)
+        return t, words, self._band_keys(words)
+
+    def add(self, cid, doc: dict):
+        t, words, keys = self._entry(doc.get("title", ""), doc.get("description", ""))
+        with self._lock:
+            self._remove(cid)
+            self.entries[cid] = (t, words, keys, doc)
+            for k in keys:
+                self.buckets.setdefault(k, set()).add(cid)
+
+    def remove(self, cid):
+        with self._lock:
+            self._remove(cid)
+
+    def _remove(self, cid):
+        old = self.entries.pop(cid, None)
+        if old is None:
+            return
+        for k in old[2]:
+            bucket = self.buckets.get(k)
+            if bucket is not None:
+                bucket.discard(cid)
+                if not bucket:
+                    del self.buckets[k]
+
+    def apply(self, upserts, removed=()):
+        """Incremental update: upserts is [(cid, doc)], removed is [cid]."""
+        for cid, doc in upserts:
+            self.add(cid, doc)
+        for cid in removed:
+            self.remove(cid)
+
+    def query(self, title: str, description: str = "", limit=5):
+        """Most similar indexed complaints scoring >= threshold, best first."""
+        t, words, keys = self._entry(title, description)
+        with self._lock:
+            candidates = set()
+            for k in keys:
+                candidates |= self.buckets.get(k, set())
+            scored = []
+            for cid in candidates:
+                et, ewords, _, doc = self.entries[cid]
+                score = self.title_weight * jaccard(t, et) + (1 - self.title_weight) * jaccard(words, ewords)
+                if score >= self.threshold:
+                    scored.append((round(score, 3), cid, doc))
+        scored.sort(key=lambda s: s[0], reverse=True)
+        return scored[:limit]
@@ -0,0 +1,434 @@
+# tracer.py
+"""
+Record and replay of data-layer calls, to reproduce slow sessions offline.
+
+    CRTS_TRACE=~/crts-trace.jsonl.gz python admin_app.py       # record
+    CRTS_TRACE_RESULTS=1 CRTS_TRACE=... python user_app.py     # ... with result snapshots
+    python tracer.py show trace.jsonl.gz
+    python tracer.py replay trace.jsonl.gz                     # MemoryStore, original pacing
+    python tracer.py replay trace.jsonl.gz --speed 10          # 10x faster; 0 = back to back
+    python tracer.py replay trace.jsonl.gz --backend firestore --writes
+
+Recording is off unless CRTS_TRACE is set. firebase_client and
+firebase_client_async then wrap their public functions when imported
+(before the apps bind the names), and every call is appended to a gzip'd
+JSON-lines file: start offset, duration, thread, the enclosing traced call,
+arguments, result size, error and, with CRTS_TRACE_RESULTS, the result.
+Passwords and tokens are never written.
+
+Replay runs the top-level calls against a backend at their recorded start
+offsets divided by --speed, on a thread pool so calls that overlapped still
+overlap, and prints recorded against replayed latency per function. On the
+memory backend the documents seen in recorded results are loaded first, so
+reads find what they found when the trace was taken. Against Firestore,
+writes are skipped unless --writes is given.
+"""
+
+import argparse
+import atexit
+import contextvars
+import functools
+import gzip
+import inspect
+import itertools
+import json
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from util import percentile
+
+ENV_PATH = "CRTS_TRACE"
+ENV_RESULTS = "CRTS_TRACE_RESULTS"
+FORMAT = 1
+FLUSH_EVERY = 50          # records between gzip flushes (a crash loses at most these)
+REDACT = {"password", "id_token", "idToken", "refreshToken"}   # argument / result keys
+# module helpers that are not data calls
+SKIP = {"budgeted", "resource_path", "collection", "current_tenant", "tenant_scope", "updates_group", "in_tenant",
+        "closed_before_queries", "archive_decrement", "forget_status_counter"}
+
+AUTH = {"signup_with_email_password", "signin_with_email_password", "verify_id_token"}
+WRITES = {
+    "create_user_doc", "update_user", "set_user_roles", "backfill_user_search_fields",
+    "create_complaint_doc", "update_complaint_status", "add_complaint_update",
+    "transition_complaint", "assign_complaint", "recount_open_loads",
+}
+
+# seq of the traced call this context is inside of (None at top level)
+_parent = contextvars.ContextVar("crts_trace_parent", default=None)
+
+
+# -------------------------------------------------------
+# ENCODING
+# -------------------------------------------------------
+def encode(value):
+    """JSON-safe form of an argument / result (datetimes kept as {"$dt": iso})."""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, datetime):
+        return {"$dt": value.isoformat()}
+    if isinstance(value, dict):
+        return {str(k): "***" if k in REDACT else encode(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [encode(v) for v in value]
+    if callable(value):
+        return {"$fn": getattr(value, "__qualname__", type(value).__name__)}
+    return {"$repr": repr(value)[:200]}
+
+
+def _noop(*_args, **_kwargs):
+    pass
+
+
+def decode(value):
+    if isinstance(value, list):
+        return [decode(v) for v in value]
+    if isinstance(value, dict):
+        if "$dt" in value:
+            return datetime.fromisoformat(value["$dt"])
+        if "$fn" in value:
+            return _noop   # callbacks (watch_complaints) are replayed as no-ops
+        if "$repr" in value:
+            return None
+        return {k: decode(v) for k, v in value.items()}
+    return value
+
+
+def result_size(result):
+    """Rows in a list result, 1 for a single document, 0 for None."""
+    if isinstance(result, tuple) and result and isinstance(result[0], list):
+        result = result[0]   # search_users: (page, cursor)
+    if result is None:
+        return 0
+    return len(result) if isinstance(result, list) else 1
+
+
+# -------------------------------------------------------
+# RECORDING
+# -------------------------------------------------------
+class Tracer:
+    def __init__(self, path, results=False):
+        self.path = os.path.expanduser(path)
+        self.results = results
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._t0 = time.perf_counter()
+        self._pending = 0
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._file = gzip.open(self.path, "wt", encoding="utf-8")
+        self._write({"crts_trace": FORMAT, "started": datetime.now().isoformat(),
+                     "pid": os.getpid(), "results": results})
+        atexit.register(self.close)
+
+    def _write(self, rec):
+        line = json.dumps(rec, separators=(",", ":"), default=str)
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(line + "\n")
+            self._pending += 1
+            if self._pending >= FLUSH_EVERY:
+                self._file.flush()
+                self._pending = 0
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _record(self, seq, parent, fn, module, bound, start, result=None, error=None, tenant=""):
+        rec = {
+            "seq": seq,
+            "t": round(start - self._t0, 6),
+            "ms": round((time.perf_counter() - start) * 1000, 3),
+            "fn": fn,
+            "mod": module,
+            "th": threading.current_thread().name,
+            "args": encode(bound),
+        }
+        if parent is not None:
+            rec["p"] = parent
+        if tenant:
+            rec["tn"] = tenant
+        if error is not None:
+            rec["err"] = f"{type(error).__name__}: {error}"
+        else:
+            rec["n"] = result_size(result)
+            if self.results:
+                rec["res"] = encode(result)
+        self._write(rec)
+
+    def wrap(self, fn, module, tenant=None):
+        sig = inspect.signature(fn)
+        name = fn.__name__
+
+        def bind(args, kwargs):
+            try:
+                return sig.bind_partial(*args, **kwargs).arguments
+            except TypeError:
+                return {"args": args, "kwargs": kwargs}
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def traced(*args, **kwargs):
+                seq, parent = next(self._seq), _parent.get()
+                token = _parent.set(seq)
+                start = time.perf_counter()
+                try:
+                    result = await fn(*args, **kwargs)
+                except Exception as e:
+                    self._record(seq, parent, name, module, bind(args, kwargs), start, error=e,
+                                     tenant=tenant() if tenant else "")
+                    raise
+                finally:
+                    _parent.reset(token)
+                self._record(seq, parent, name, module, bind(args, kwargs), start, result,
+                             tenant=tenant() if tenant else "")
+                return result
+        else:
+            @functools.wraps(fn)
+            def traced(*args, **kwargs):
+                seq, parent = next(self._seq), _parent.get()
+                token = _parent.set(seq)
+                start = time.perf_counter()
+                try:
+                    result = fn(*args, **kwargs)
+                except Exception as e:
+                    self._record(seq, parent, name, module, bind(args, kwargs), start, error=e,
+                                     tenant=tenant() if tenant else "")
+                    raise
+                finally:
+                    _parent.reset(token)
+                self._record(seq, parent, name, module, bind(args, kwargs), start, result,
+                             tenant=tenant() if tenant else "")
+                return result
+        return traced
+
+    def install(self, module):
+        """Replace the module's public functions with traced versions."""
+        tenant = getattr(module, "current_tenant", None)
+        for name, obj in list(vars(module).items()):
+            if (name.startswith("_") or name in SKIP or not inspect.isfunction(obj)
+                    or inspect.isgeneratorfunction(obj) or obj.__module__ != module.__name__):
+                continue
+            setattr(module, name, self.wrap(obj, module.__name__, tenant))
+
+
+active = None
+
+
+def install(module):
+    """Trace module's calls if CRTS_TRACE is set (firebase_client calls this)."""
+    global active
+    path = os.environ.get(ENV_PATH)
+    if not path:
+        return None
+    if active is None:
+        active = Tracer(path, results=os.environ.get(ENV_RESULTS, "") not in ("", "0"))
+    active.install(module)
+    return active
+
+
+# -------------------------------------------------------
+# READING / REPLAY
+# -------------------------------------------------------
+def load(path):
+    """(header, records); a trace cut short by a crash loads up to the break."""
+    records = []
+    with gzip.open(os.path.expanduser(path), "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        try:
+            for line in f:
+                records.append(json.loads(line))
+        except (EOFError, json.JSONDecodeError):
+            pass
+    records.sort(key=lambda r: r["t"])
+    return header, records
+
+
+def seed_memory(store, records):
+    """Load the documents seen in recorded results into a MemoryStore; returns the count."""
+    from schema import rollup_id
+
+    n = 0
+    with store._lock:
+        for rec in records:
+            if "res" not in rec or rec.get("err"):
+                continue
+            fn, args, res = rec["fn"], decode(rec["args"]), decode(rec["res"])
+            if res is None:
+                continue
+            if fn in ("get_all_complaints", "query_complaints", "get_overdue_complaints"):
+                for cid, doc in res:
+                    store.complaints.setdefault(cid, {}).update(doc); n += 1
+            elif fn == "get_complaint":
+                store.complaints.setdefault(args["complaint_id"], {}).update(res); n += 1
+            elif fn == "get_complaint_updates":
+                for uid, doc in res:
+                    store.updates.setdefault(args["complaint_id"], {})[uid] = doc; n += 1
+            elif fn == "get_recent_updates":
+                for cid, uid, doc in res:
+                    store.updates.setdefault(cid, {})[uid] = doc; n += 1
+            elif fn in ("list_all_users", "search_users"):
+                for uid, doc in (res[0] if fn == "search_users" else res):
+                    store.users.setdefault(uid, {}).update(doc); n += 1
+            elif fn == "get_user_doc":
+                store.users.setdefault(args["uid"], {}).update(res); n += 1
+            elif fn == "get_rollups":
+                for doc in res:
+                    store.rollups[rollup_id(doc.get("day"), doc.get("category"), doc.get("priority"))] = doc
+                    n += 1
+    return n
+
+
+def replay(records, backend, speed=1.0, workers=32, writes=True):
+    """
+    Re-run the trace's top-level calls against backend (firebase_client or a
+    MemoryStore). A call the backend lacks (e.g. an async-only helper) is
+    replaced by the calls it made. Returns (results, skipped, elapsed) with
+    results [(record, seconds, rows, error)] and skipped {reason: count}.
+    """
+    children = {}
+    for rec in records:
+        if "p" in rec:
+            children.setdefault(rec["p"], []).append(rec)
+    calls = []
+    for rec in records:
+        if "p" in rec:
+            continue
+        if not hasattr(backend, rec["fn"]) and rec["seq"] in children:
+            calls.extend(children[rec["seq"]])
+        else:
+            calls.append(rec)
+    calls.sort(key=lambda r: r["t"])
+
+    skipped = Counter()
+    watches = []
+
+    scope = getattr(backend, "tenant_scope", None)
+
+    def one(rec):
+        fn = getattr(backend, rec["fn"])
+        start = time.perf_counter()
+        try:
+            if scope is not None:
+                with scope(rec.get("tn", "")):   # calls run in the tenant they were made in
+                    result = fn(**decode(rec["args"]))
+            else:
+                result = fn(**decode(rec["args"]))
+        except Exception as e:
+            return rec, time.perf_counter() - start, 0, f"{type(e).__name__}: {e}"
+        if hasattr(result, "unsubscribe"):
+            watches.append(result)
+        return rec, time.perf_counter() - start, result_size(result), None
+
+    t0 = calls[0]["t"] if calls else 0.0
+    start = time.perf_counter()
+    futures = []
+    with ThreadPoolExecutor(workers) as pool:
+        for rec in calls:
+            if rec["fn"] in AUTH:
+                skipped["auth"] += 1; continue
+            if rec["fn"] in WRITES and not writes:
+                skipped["write"] += 1; continue
+            if not hasattr(backend, rec["fn"]):
+                skipped["not on backend"] += 1; continue
+            if speed:
+                delay = (rec["t"] - t0) / speed - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            futures.append(pool.submit(one, rec))
+        results = [f.result() for f in futures]
+    elapsed = time.perf_counter() - start
+    for w in watches:
+        try:
+            w.unsubscribe()
+        except Exception:
+            pass
+    return results, dict(skipped), elapsed
+
+
+# -------------------------------------------------------
+# REPORTS
+# -------------------------------------------------------
+def print_summary(records, top=10):
+    roots = [r for r in records if "p" not in r]
+    span = (roots[-1]["t"] + roots[-1]["ms"] / 1000 - roots[0]["t"]) if roots else 0.0
+    print(f"{len(records)} calls ({len(roots)} top-level) over {span:.1f}s")
+    by_fn = {}
+    for r in roots:
+        by_fn.setdefault(r["fn"], []).append(r)
+    cols = ("calls", "errors", "p50_ms", "p95_ms", "max_ms", "rows")
+    print(f"\n{'function':<30}" + "".join(f"{c:>10}" for c in cols))
+    for fn, rs in sorted(by_fn.items(), key=lambda kv: -sum(r["ms"] for r in kv[1])):
+        ms = [r["ms"] for r in rs]
+        row = (len(rs), sum(1 for r in rs if r.get("err")), round(percentile(ms, 0.5), 1),
+               round(percentile(ms, 0.95), 1), round(max(ms), 1), sum(r.get("n", 0) for r in rs))
+        print(f"{fn:<30}" + "".join(f"{v:>10}" for v in row))
+    print(f"\nSlowest {top}:")
+    for r in sorted(roots, key=lambda r: -r["ms"])[:top]:
+        args = json.dumps(r["args"], separators=(",", ":"))[:80]
+        print(f"  {r['t']:>9.3f}s {r['ms']:>9.1f}ms  [{r['th']}] {r['fn']}({args})"
+              + (f"  !! {r['err']}" if r.get("err") else ""))
+
+
+def print_replay(results, skipped, elapsed):
+    by_fn = {}
+    for rec, seconds, rows, error in results:
+        by_fn.setdefault(rec["fn"], []).append((rec, seconds * 1000, rows, error))
+    cols = ("calls", "errors", "rec_p50", "rep_p50", "rec_p95", "rep_p95", "rows_diff")
+    print(f"\nReplayed {len(results)} calls in {elapsed:.1f}s"
+          + (f"; skipped {', '.join(f'{n} {k}' for k, n in skipped.items())}" if skipped else ""))
+    print(f"\n{'function':<30}" + "".join(f"{c:>10}" for c in cols))
+    for fn, rs in sorted(by_fn.items()):
+        rec_ms = [r[0]["ms"] for r in rs]
+        rep_ms = [r[1] for r in rs]
+        row = (len(rs), sum(1 for r in rs if r[3]),
+               round(percentile(rec_ms, 0.5), 1), round(percentile(rep_ms, 0.5), 1),
+               round(percentile(rec_ms, 0.95), 1), round(percentile(rep_ms, 0.95), 1),
+               sum(1 for r in rs if not r[3] and "n" in r[0] and r[0]["n"] != r[2]))
+        print(f"{fn:<30}" + "".join(f"{v:>10}" for v in row))
+    errors = [r for r in results if r[3]]
+    for rec, _, _, error in errors[:5]:
+        print(f"  error in {rec['fn']} (seq {rec['seq']}): {error}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Inspect or replay a CRTS data-layer trace")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    show = sub.add_parser("show", help="per-function timings and the slowest calls")
+    show.add_argument("trace")
+    show.add_argument("--top", type=int, default=10)
+    rp = sub.add_parser("replay", help="re-run the trace against a backend")
+    rp.add_argument("trace")
+    rp.add_argument("--backend", choices=("memory", "firestore"), default="memory",
+                    help="firestore uses firebase_client (set FIRESTORE_EMULATOR_HOST for the emulator)")
+    rp.add_argument("--speed", type=float, default=1.0, help="pacing factor; 0 = no pauses")
+    rp.add_argument("--workers", type=int, default=32, help="calls in flight at most")
+    rp.add_argument("--writes", action="store_true", help="replay writes against firestore too")
+    args = ap.parse_args(argv)
+
+    header, records = load(args.trace)
+    print(f"Trace from {header.get('started')} (pid {header.get('pid')})")
+    if args.cmd == "show":
+        print_summary(records, args.top)
+        return
+
+    if args.backend == "memory":
+        from memory_store import MemoryStore
+        backend = MemoryStore()
+        print(f"Loaded {seed_memory(backend, records)} recorded document(s) into memory")
+        writes = True
+    else:
+        import firebase_client as backend
+        writes = args.writes
+    results, skipped, elapsed = replay(records, backend, args.speed, args.workers, writes)
+    print_replay(results, skipped, elapsed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+# ui_watchdog.py
+"""
+Tk main-thread stall watchdog and UI timing (no Firebase imports).
+
+    watchdog = UiWatchdog(root)                    # starts heartbeats
+    populate = watchdog.timed("complaints.populate")(populate)
+    open_diagnostics(parent, watchdog)             # live numbers
+
+A heartbeat is scheduled with root.after every INTERVAL_MS; how late each
+one fires is the event-loop latency (anything blocking the Tk thread shows
+up here). A monitor thread notices when no heartbeat has run for STALL_MS
+and, while the stall is still going on, records the main thread's stack,
+so the log shows what was blocking rather than what ran afterwards.
+Stalls are appended to ~/.crts/ui_stalls.log as well.
+
+timed(name) records how long a view builder / populate() call takes on
+the Tk thread; the diagnostics window lists count, last, p95 and max.
+"""
+
+import os
+import sys
+import threading
+import time
+import tkinter as tk
+import traceback
+from collections import deque
+from datetime import datetime
+from functools import wraps
+
+from util import DATA_DIR, percentile
+
+INTERVAL_MS = 100
+STALL_MS = 500
+KEEP = 500            # samples kept per series
+LOG_PATH = os.path.join(DATA_DIR, "ui_stalls.log")
+
+
+class UiWatchdog:
+    def __init__(self, root, interval_ms=INTERVAL_MS, stall_ms=STALL_MS, log_path=LOG_PATH, start=True):
+        self.root = root
+        self.interval = interval_ms / 1000
+        self.stall = stall_ms / 1000
+        self.log_path = log_path
+        self.main_ident = threading.get_ident()  # create on the Tk thread
+        self.latencies = deque(maxlen=KEEP)      # seconds late, per heartbeat
+        self.timings = {}                        # name -> deque of seconds
+        self.stalls = deque(maxlen=50)           # {"at", "seconds", "stack"}
+        self._lock = threading.Lock()
+        self._last_beat = time.perf_counter()
+        self._expected = None
+        self._current = None                     # stall being recorded
+        self._stop = threading.Event()
+        if start:
+            self.start()
+
+    def start(self):
+        self._beat()
+        threading.Thread(target=self._monitor, name="crts-ui-watchdog", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    # ---------------- Tk side ----------------
+    def _beat(self):
+        now = time.perf_counter()
+        with self._lock:
+            if self._expected is not None:
+                self.latencies.append(max(0.0, now - self._expected))
+            self._last_beat = now
+            stall, self._current = self._current, None
+            if stall is not None:
+                stall["seconds"] = now - stall["started"]
+        if stall is not None:
+            self._log(stall)
+        if self._stop.is_set():
+            return
+        self._expected = time.perf_counter() + self.interval
+        try:
+            self.root.after(int(self.interval * 1000), self._beat)
+        except tk.TclError:
+            pass  # root destroyed
+
+    def timed(self, name):
+        """Decorator recording how long each call takes under name."""
+        def deco(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                t0 = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(name, time.perf_counter() - t0)
+            return wrapper
+        return deco
+
+    def record(self, name, seconds):
+        with self._lock:
+            self.timings.setdefault(name, deque(maxlen=KEEP)).append(seconds)
+
+    # ---------------- monitor thread ----------------
+    def _monitor(self):
+        while not self._stop.wait(self.stall / 4):
+            with self._lock:
+                since = time.perf_counter() - self._last_beat
+                if since < self.stall + self.interval or self._current is not None:
+                    continue
+                frame = sys._current_frames().get(self.main_ident)
+                stack = "".join(traceback.format_stack(frame)) if frame else "(main thread not found)"
+                self._current = {
+                    "at": datetime.now(),
+                    "started": self._last_beat + self.interval,
+                    "seconds": None,   # filled in when the loop comes back
+                    "stack": stack,
+                }
+                self.stalls.append(self._current)
+
+    def _log(self, stall):
+        try:
+            os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(f"--- {stall['at']:%Y-%m-%d %H:%M:%S} UI stalled {stall['seconds'] * 1000:.0f} ms\n{stall['stack']}\n")
+        except OSError:
+            pass
+
+    # ---------------- numbers ----------------
+    def summary(self):
+        """{"latency": {p50, p95, p99, max} in ms, "views": {name: {...}}, "stalls": [...]}"""
+        with self._lock:
+            lat = list(self.latencies)
+            views = {name: list(v) for name, v in self.timings.items()}
+            stalls = list(self.stalls)
+        ms = lambda v: round(v * 1000, 1)
+        return {
+            "latency": {"p50": ms(percentile(lat, 0.5)), "p95": ms(percentile(lat, 0.95)),
+                        "p99": ms(percentile(lat, 0.99)), "max": ms(max(lat, default=0.0))},
+            "views": {name: {"count": len(v), "last": ms(v[-1]), "p95": ms(percentile(v, 0.95)), "max": ms(max(v))}
+                      for name, v in views.items()},
+            "stalls": stalls,
+        }
+
+
+def open_diagnostics(parent, watchdog, refresh_ms=1000):
+    """Toplevel with live event-loop latency, view timings and captured stalls."""
+    import ttkbootstrap as ttk
+
+    win = tk.Toplevel(parent)
+    win.title("UI Diagnostics")
+    win.geometry("760x560")
+    lat_label = ttk.Label(win, text="", font=("Segoe UI", 11, "bold"), padding=8)
+    lat_label.pack(anchor="w")
+
+    views = ttk.Treeview(win, columns=("name", "count", "last", "p95", "max"), show="headings", height=8)
+    for c, wd in (("name", 280), ("count", 70), ("last", 90), ("p95", 90), ("max", 90)):
+        views.heading(c, text=c.title() + ("" if c in ("name", "count") else " (ms)"))
+        views.column(c, width=wd)
+    views.pack(fill="x", padx=8)
+
+    ttk.Label(win, text="Stalls (main-thread stack captured during the stall)", padding=(8, 10, 8, 4)).pack(anchor="w")
+    body = ttk.Frame(win)
+    body.pack(fill="both", expand=True, padx=8, pady=(0, 8))
+    stall_list = tk.Listbox(body, width=28)
+    stall_list.pack(side="left", fill="y")
+    stack_text = tk.Text(body, wrap="none", font=("Consolas", 9))
+    stack_text.pack(side="left", fill="both", expand=True)
+    shown = {"stalls": [], "labels": []}
+
+    def show_stack(e=None):
+        sel = stall_list.curselection()
+        if not sel:
+            return
+        stack_text.delete("1.0", tk.END)
+        stack_text.insert("1.0", shown["stalls"][sel[0]]["stack"])
+
+    def refresh():
+        try:
+            if not win.winfo_exists():
+                return
+        except tk.TclError:
+            return
+        s = watchdog.summary()
+        lat = s["latency"]
+        lat_label.config(text=f"Event-loop latency  p50 {lat['p50']} ms · p95 {lat['p95']} ms · "
+                              f"p99 {lat['p99']} ms · max {lat['max']} ms")
+        views.delete(*views.get_children())
+        for name, v in sorted(s["views"].items(), key=lambda kv: -kv[1]["p95"]):
+            views.insert("", tk.END, values=(name, v["count"], v["last"], v["p95"], v["max"]))
+        labels = [f"{st['at']:%H:%M:%S}  " + ("ongoing" if st["seconds"] is None else f"{st['seconds'] * 1000:.0f} ms")
+                  for st in s["stalls"]]
+        if labels != shown["labels"]:
+            shown.update(stalls=s["stalls"], labels=labels)
+            stall_list.delete(0, tk.END)
+            for text in labels:
+                stall_list.insert(tk.END, text)
+        win.after(refresh_ms, refresh)
+
+    stall_list.bind("<<ListboxSelect>>", show_stack)
+    refresh()
+    return win
@@ -1,7 +1,10 @@
+import multiprocessing
+import os
 import threading
 import traceback
 from datetime import datetime
 import tkinter as tk
+from tkinter import filedialog
 from typing import Optional
 
 import requests
@@ -13,20 +16,47 @@ from firebase_client import (
     signin_with_email_password,
     create_user_doc,
     get_user_doc,
-    create_complaint_doc,
-    get_all_complaints,
+    update_user,
+    query_complaints,
+    query_archive,
+    ACTIVE,
+    ACTIVE_STATUSES,
+    get_status_changes,
+    get_complaint,
     get_complaint_updates,
+    now_ts,
+    format_ts,
+    usage,
+    READ_BUDGET,
+    WRITE_BUDGET,
+    list_tenants,
+    set_tenant,
+    DEFAULT_TENANT,
 )
+from attachments import IMAGE_FILETYPES, MAX_ATTACHMENTS, ThumbnailCache, Uploader, show_thumbnails
+from outbox import Outbox
+from util import DATA_DIR
+from schema import DUPLICATE_FIELDS, LIST_FIELDS, new_doc_id
+from similarity import DuplicateIndex
+from ui_watchdog import UiWatchdog, open_diagnostics
 
 # -----------------------
 # Global session & root
 # -----------------------
-session = {"idToken": None, "uid": None, "email": None, "name": None, "role": None}
+session = {"idToken": None, "uid": None, "email": None, "name": None, "role": None, "tenant": "", "tenant_name": ""}
+USAGE_REFRESH_MS = 2000  # status bar Firestore read/write counter
+DUP_REFRESH_MS = 5 * 60 * 1000  # how often the duplicate index picks up new complaints
 
-root = tk.Tk()
-root.withdraw()  # hidden root, used only for event loop / after
+# attachment image workers (attachments.py) re-import this file as
+# __mp_main__ on Windows; only the real app opens Tk and the outbox
+APP_PROCESS = __name__ != "__mp_main__"
 
-style = ttk.Style(theme="cosmo")
+if APP_PROCESS:
+    root = tk.Tk()
+    root.withdraw()  # hidden root, used only for event loop / after
+
+    style = ttk.Style(theme="cosmo")
+    watchdog = UiWatchdog(root)  # Tk stall detection; Ctrl+Shift+D shows it
 
 login_win: Optional[tk.Toplevel] = None
 main_win: Optional[tk.Toplevel] = None
@@ -123,6 +153,49 @@ def safe_run_in_thread(source_win: Optional[tk.Toplevel], func, on_done=None):
     threading.Thread(target=worker, daemon=True).start()
 
 
+# -----------------------
+# Offline outbox
+# -----------------------
+# submissions are queued locally and sent by a background flusher; the main
+# window registers a handler here to hear about sent / failed writes
+outbox_handlers = []
+
+
+def _outbox_event(kind, key, op, info):
+    def cb():
+        for handler in list(outbox_handlers):
+            try:
+                handler(kind, key, op, info)
+            except Exception:
+                print("Error in outbox handler:\n", traceback.format_exc())
+
+    safe_after(cb)
+
+
+# photos: processed and uploaded in the background (see attachments.py);
+# upload_state maps attachment id -> "processing" / "sent" / "retry" / "failed"
+upload_handlers = []
+upload_state = {}
+
+
+def _upload_event(kind, ref, info):
+    def cb():
+        upload_state[ref["id"]] = kind
+        for handler in list(upload_handlers):
+            try:
+                handler(kind, ref, info)
+            except Exception:
+                print("Error in upload handler:\n", traceback.format_exc())
+
+    safe_after(cb)
+
+
+if APP_PROCESS:
+    outbox = Outbox(os.path.join(DATA_DIR, "user_outbox.sqlite3"), on_event=_outbox_event)
+    uploader = Uploader(on_event=_upload_event)
+    thumbs = ThumbnailCache(uploader.store)
+
+
 def show_error(parent: Optional[tk.Toplevel], message: str):
     parent = parent or main_win or login_win or root
     try:
@@ -204,7 +277,7 @@ def open_login_window():
     lw = tk.Toplevel(root)
     login_win = lw
     lw.title("CRTS — User Login")
-    center_window(lw, 480, 360)
+    center_window(lw, 480, 400)
     lw.resizable(False, False)
 
     frame = ttk.Frame(lw, padding=18)
@@ -228,6 +301,30 @@ def open_login_window():
     name_entry = ttk.Entry(frame, width=40)
     name_entry.grid(row=3, column=1, pady=6)
 
+    # institution picker, shown once the project has tenants registered
+    tenants = {}  # display name -> tenant id
+    tenant_label = ttk.Label(frame, text="Institution:", font=("Segoe UI", 10))
+    tenant_var = ttk.StringVar()
+    tenant_combo = ttk.Combobox(frame, textvariable=tenant_var, width=38, state="readonly")
+
+    def tenants_loaded(rows, exc):
+        if exc or not rows:
+            return  # single-institution project
+        for tid, d in rows:
+            tenants[d.get("name") or tid] = tid
+        tenant_combo.config(values=list(tenants))
+        tenant_var.set(next((n for n, t in tenants.items() if t == DEFAULT_TENANT), next(iter(tenants))))
+        tenant_label.grid(row=4, column=0, sticky="w", pady=6)
+        tenant_combo.grid(row=4, column=1, pady=6)
+
+    safe_run_in_thread(lw, list_tenants, tenants_loaded)
+
+    def use_tenant():
+        name = tenant_var.get()
+        session["tenant"] = tenants.get(name, DEFAULT_TENANT)
+        session["tenant_name"] = name if name in tenants else ""
+        set_tenant(session["tenant"])
+
     def disable_inputs(disabled: bool):
         state = "disabled" if disabled else "normal"
         for w in (email_entry, pwd_entry, name_entry):
@@ -248,11 +345,17 @@ def open_login_window():
             show_error(lw, "Password must be at least 6 characters.")
             return
 
+        use_tenant()
         loader = show_loader(lw, "Creating your account...")
         disable_inputs(True)
 
         def work():
-            return signup_with_email_password(email, pwd)
+            res = signup_with_email_password(email, pwd)
+            try:
+                create_user_doc(uid=res.get("localId"), email=email, name=name, role="user")
+            except Exception as e:
+                print("Warning: failed to create user doc:", e)
+            return res
 
         def done(res, exc):
             if loader:
@@ -265,11 +368,6 @@ def open_login_window():
                 msg = map_firebase_error(exc, context="signup")
                 show_error(lw, msg)
                 return
-            uid = res.get("localId")
-            try:
-                create_user_doc(uid=uid, email=email, name=name, role="user")
-            except Exception as e:
-                print("Warning: failed to create user doc:", e)
             show_info(lw, "Account created. Please login.")
 
         safe_run_in_thread(lw, work, done)
@@ -285,13 +383,20 @@ def open_login_window():
             show_error(lw, "Please enter a valid email address.")
             return
 
+        use_tenant()
         loader = show_loader(lw, "Signing you in...")
         disable_inputs(True)
 
         def work():
-            return signin_with_email_password(email, pwd)
+            # the profile read runs here too, not on the Tk thread
+            res = signin_with_email_password(email, pwd)
+            try:
+                doc = get_user_doc(res.get("localId"))
+            except Exception:
+                doc = None
+            return res, doc
 
-        def done(res, exc):
+        def done(out, exc):
             if loader:
                 try:
                     loader.destroy()
@@ -303,16 +408,17 @@ def open_login_window():
                 show_error(lw, msg)
                 return
 
+            res, doc = out
+            if doc is None and session.get("tenant"):
+                show_error(lw, f"No account at {session['tenant_name']}. Sign up there first.")
+                return
             session["idToken"] = res.get("idToken")
             session["uid"] = res.get("localId")
             session["email"] = email
-            try:
-                doc = get_user_doc(session["uid"])
-                session["name"] = doc.get("name") if doc else email.split("@")[0]
-                session["role"] = doc.get("role", "user") if doc else "user"
-            except Exception:
-                session["name"] = email.split("@")[0]
-                session["role"] = "user"
+            session["name"] = doc.get("name") if doc else email.split("@")[0]
+            session["role"] = doc.get("role", "user") if doc else "user"
+            usage.reset()  # budgets are per session
+            usage.set_budget(reads=READ_BUDGET, writes=WRITE_BUDGET)
 
             try:
                 lw.destroy()
@@ -323,7 +429,7 @@ def open_login_window():
         safe_run_in_thread(lw, work, done)
 
     buttons = ttk.Frame(frame)
-    buttons.grid(row=4, column=1, sticky="e", pady=(12, 0))
+    buttons.grid(row=5, column=1, sticky="e", pady=(12, 0))
     ttk.Button(buttons, text="Sign up", bootstyle="success", command=do_signup).pack(side="left", padx=(0, 8))
     ttk.Button(buttons, text="Login", bootstyle="primary", command=do_login).pack(side="left")
 
@@ -360,12 +466,47 @@ def open_main_window():
     mw.title("CRTS — User Portal")
     center_window(mw, 1150, 720)
 
+    # open complaints for duplicate checks: projected to DUPLICATE_FIELDS so
+    # other students' names / emails / contacts never reach this app; after
+    # the first load only complaints created or moved since are fetched, and
+    # the ones that left the active statuses are dropped
+    dup_index = DuplicateIndex()
+    dup_since = {"at": None}
+
+    def refresh_dup_index():
+        since = now_ts()
+
+        def work():
+            if dup_since["at"] is None:
+                return query_complaints(status=ACTIVE, fields=DUPLICATE_FIELDS)
+            return get_status_changes(dup_since["at"], fields=DUPLICATE_FIELDS)
+
+        def done(rows, exc):
+            if exc:
+                print("Duplicate index unavailable:", exc)
+            else:
+                dup_index.apply(
+                    [(cid, d) for cid, d in rows if d.get("status") in ACTIVE_STATUSES],
+                    [cid for cid, d in rows if d.get("status") not in ACTIVE_STATUSES],
+                )
+                dup_since["at"] = since
+            safe_after(refresh_dup_index, DUP_REFRESH_MS)
+
+        safe_run_in_thread(mw, work, done)
+
+    refresh_dup_index()
+
+    def release_listeners():
+        outbox_handlers.clear()
+        upload_handlers.clear()
+
     # top bar
     topbar = ttk.Frame(mw, padding=(10, 8))
     topbar.pack(side="top", fill="x")
     ttk.Label(
         topbar,
-        text=f"Logged in as: {session.get('name')} ({session.get('email')})",
+        text=f"Logged in as: {session.get('name')} ({session.get('email')})"
+        + (f"  |  {session['tenant_name']}" if session.get("tenant_name") else ""),
         font=("Segoe UI", 10),
     ).pack(side="left")
 
@@ -375,6 +516,7 @@ def open_main_window():
                 mw.destroy()
             except tk.TclError:
                 pass
+            release_listeners()
             session.update({"idToken": None, "uid": None, "email": None, "name": None, "role": None})
             open_login_window()
 
@@ -393,8 +535,12 @@ def open_main_window():
     content = ttk.Frame(body, padding=10)
     content.pack(side="left", fill="both", expand=True)
 
-    status_bar = ttk.Label(mw, text="Ready", anchor="w", bootstyle="secondary")
-    status_bar.pack(side="bottom", fill="x")
+    bar = ttk.Frame(mw)
+    bar.pack(side="bottom", fill="x")
+    status_bar = ttk.Label(bar, text="Ready", anchor="w", bootstyle="secondary")
+    status_bar.pack(side="left", fill="x", expand=True)
+    usage_bar = ttk.Label(bar, anchor="e", bootstyle="secondary", padding=(8, 0))
+    usage_bar.pack(side="right")
 
     def set_status(msg: str, style: str = "secondary"):
         try:
@@ -402,8 +548,32 @@ def open_main_window():
         except tk.TclError:
             pass
 
+    def refresh_usage():
+        # Firestore reads / writes this session (firebase_client.usage)
+        text, style = usage.summary()
+        try:
+            usage_bar.config(text=text, bootstyle=f"inverse-{style}")
+        except tk.TclError:
+            return
+        safe_after(refresh_usage, USAGE_REFRESH_MS)
+
+    refresh_usage()
+
     current_view = {"name": None}
 
+    def on_outbox(kind, key, op, info):
+        if kind == "sent":
+            left = len(outbox.pending())
+            set_status("Complaint submitted" + (f" ({left} still queued)" if left else ""), "success")
+            if current_view["name"] in ("dashboard", "my"):
+                {"dashboard": show_dashboard, "my": show_my_complaints}[current_view["name"]]()
+        elif kind == "retry":
+            set_status(f"Offline? {len(outbox.pending())} write(s) queued, retrying – {info}", "warning")
+        elif kind == "failed":
+            show_error(mw, f"Could not submit \"{op.get('doc', {}).get('title', '')}\":\n{info}")
+
+    outbox_handlers[:] = [on_outbox]
+
     def clear_content():
         for w in content.winfo_children():
             try:
@@ -416,15 +586,18 @@ def open_main_window():
             if isinstance(child, ttk.Button):
                 child.config(bootstyle="secondary-outline")
         btn.config(bootstyle="secondary")
+        usage.set_view(btn.cget("text"))
 
-    def fetch_user_complaints(on_done):
+    def fetch_user_complaints(on_done, status=None):
         loader = show_loader(mw, "Loading your complaints...")
         set_status("Loading complaints...", "info")
+        uid = session.get("uid")
 
         def work():
-            all_docs = get_all_complaints()
-            uid = session.get("uid")
-            return [(cid, d) for cid, d in all_docs if d.get("created_by_uid") == uid]
+            # only this user's documents, and only the fields the lists show
+            if status == "ARCHIVED":
+                return query_archive(created_by_uid=uid, fields=LIST_FIELDS)
+            return query_complaints(created_by_uid=uid, status=status, fields=LIST_FIELDS)
 
         def done(res, exc):
             if loader:
@@ -443,6 +616,7 @@ def open_main_window():
         safe_run_in_thread(mw, work, done)
 
     # -------- Views --------
+    @watchdog.timed("Dashboard")
     def show_dashboard():
         current_view["name"] = "dashboard"
         clear_content()
@@ -483,6 +657,7 @@ def open_main_window():
             justify="left",
         ).pack(anchor="w")
 
+    @watchdog.timed("New complaint")
     def show_new_complaint():
         current_view["name"] = "new"
         clear_content()
@@ -555,6 +730,55 @@ def open_main_window():
         last_label = ttk.Label(right, text="Last submitted: None", bootstyle="info")
         last_label.pack(anchor="w", pady=(12, 0))
 
+        ttk.Label(right, text="Photos", font=("Segoe UI", 12, "bold")).pack(anchor="w", pady=(16, 6))
+        attach_btn = ttk.Button(right, text="Attach photos...", bootstyle="outline-primary")
+        attach_btn.pack(anchor="w")
+        photos_label = ttk.Label(right, text="No photos attached.", wraplength=240, justify="left")
+        photos_label.pack(anchor="w", pady=(6, 0))
+
+        # one id per filled-in form: a second click on Submit re-sends the
+        # same complaint instead of creating another one
+        form = {"id": new_doc_id(), "attachments": []}
+
+        def refresh_photos():
+            try:
+                if not photos_label.winfo_exists():
+                    return
+            except tk.TclError:
+                return
+            if not form["attachments"]:
+                photos_label.config(text="No photos attached.")
+                return
+            states = {"sent": "uploaded", "retry": "retrying...", "failed": "upload failed"}
+            photos_label.config(text="\n".join(
+                f"• {ref['name']} – {states.get(upload_state.get(ref['id']), 'uploading...')}"
+                for ref in form["attachments"]
+            ))
+
+        def on_upload(kind, ref, info):
+            refresh_photos()
+            if kind == "failed":
+                set_status(f"Photo {ref['name']} not uploaded yet; will retry on next start", "warning")
+
+        upload_handlers[:] = [on_upload]
+
+        def attach_photos():
+            room = MAX_ATTACHMENTS - len(form["attachments"])
+            if room <= 0:
+                show_error(mw, f"At most {MAX_ATTACHMENTS} photos per complaint.")
+                return
+            paths = filedialog.askopenfilenames(parent=mw, title="Attach photos", filetypes=IMAGE_FILETYPES)
+            # processing and upload run in the background; only the
+            # references go into the complaint
+            for path in list(paths)[:room]:
+                try:
+                    form["attachments"].append(uploader.add(form["id"], path))
+                except (OSError, ValueError) as e:
+                    show_error(mw, str(e))
+            refresh_photos()
+
+        attach_btn.config(command=attach_photos)
+
         def submit():
             title = title_var.get().strip()
             desc = desc_text.get("1.0", "end").strip()
@@ -562,6 +786,20 @@ def open_main_window():
                 show_error(mw, "Title and Description are required.")
                 return
 
+            similar = dup_index.query(title, desc, limit=3)
+            if similar:
+                lines = "\n".join(
+                    f"• {d.get('title', '')} [{d.get('status', '')}] – {format_ts(d.get('created_at'))}"
+                    for _, _, d in similar
+                )
+                answer = Messagebox.yesno(
+                    "Possible duplicate",
+                    f"Similar open complaints already exist:\n\n{lines}\n\nSubmit anyway?",
+                    parent=mw,
+                )
+                if answer != "Yes":
+                    return
+
             data = {
                 "title": title,
                 "description": desc,
@@ -570,40 +808,34 @@ def open_main_window():
                 "location": location_var.get() or "",
                 "contact": contact_var.get() or session.get("email"),
                 "status": "OPEN",
-                "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "created_at": now_ts(),
                 "created_by_uid": session.get("uid"),
                 "name": session.get("name"),
                 "email": session.get("email"),
             }
+            if form["attachments"]:
+                data["attachments"] = list(form["attachments"])
 
-            submit_btn.config(state="disabled")
-            loader = show_loader(mw, "Submitting complaint...")
-
-            def work():
-                return create_complaint_doc(data)
-
-            def done(res, exc):
-                if loader:
-                    try:
-                        loader.destroy()
-                    except tk.TclError:
-                        pass
-                submit_btn.config(state="normal")
-                if exc:
-                    show_error(mw, f"Failed to submit complaint:\n{exc}")
-                    return
-                title_var.set("")
-                desc_text.delete("1.0", "end")
-                last_label.config(
-                    text=f"Last submitted: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-                )
-                show_info(mw, "Complaint submitted successfully.")
-                set_status("Complaint submitted", "success")
-
-            safe_run_in_thread(mw, work, done)
+            # saved locally at once; the outbox sends it in the background
+            try:
+                outbox.enqueue_create(data, key=form["id"])
+            except Exception as e:
+                show_error(mw, f"Failed to save complaint:\n{e}")
+                return
+            form["id"] = new_doc_id()
+            form["attachments"] = []
+            refresh_photos()
+            title_var.set("")
+            desc_text.delete("1.0", "end")
+            last_label.config(
+                text=f"Last submitted: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+            )
+            show_toast(mw, "Complaint saved – sending...")
+            set_status("Complaint queued for sending", "info")
 
         submit_btn.config(command=submit)
 
+    @watchdog.timed("My complaints")
     def show_my_complaints():
         current_view["name"] = "my"
         clear_content()
@@ -620,7 +852,7 @@ def open_main_window():
         status_combo = ttk.Combobox(
             filter_frame,
             textvariable=status_filter,
-            values=["ALL", "OPEN", "IN_PROGRESS", "RESOLVED", "CLOSED"],
+            values=["ALL", "OPEN", "IN_PROGRESS", "RESOLVED", "CLOSED", "ARCHIVED"],
             state="readonly",
             width=14,
         )
@@ -664,17 +896,15 @@ def open_main_window():
 
         data_cache = {"items": []}
 
+        @watchdog.timed("My complaints: populate")
         def populate():
             q = search_var.get().strip().lower()
-            st_filter = status_filter.get()
 
             for r in tree.get_children():
                 tree.delete(r)
 
             for cid, d in data_cache["items"]:
                 st = d.get("status", "")
-                if st_filter != "ALL" and st != st_filter:
-                    continue
                 title = d.get("title", "")
                 if q and q not in title.lower():
                     continue
@@ -685,20 +915,29 @@ def open_main_window():
                 tree.insert(
                     "",
                     tk.END,
-                    values=(cid, title[:80], d.get("category", ""), pr_disp, st_disp, d.get("created_at", "")),
+                    values=(cid, title[:80], d.get("category", ""), pr_disp, st_disp, format_ts(d.get("created_at"))),
                 )
 
         def reload():
-            fetch_user_complaints(on_done_reload)
+            st = status_filter.get()
+            fetch_user_complaints(on_done_reload, None if st == "ALL" else st)
 
         def on_done_reload(res, exc):
             if exc:
                 show_error(mw, f"Failed to reload:\n{exc}")
                 return
-            data_cache["items"] = res
+            # complaints still in the outbox are listed as SENDING
+            sent = {cid for cid, _ in res}
+            queued = [
+                (p["key"], dict(p["op"]["doc"], status="SENDING"))
+                for p in outbox.pending("create")
+                if p["key"] not in sent and p["op"]["doc"].get("created_by_uid") == session.get("uid")
+            ]
+            data_cache["items"] = queued[::-1] + res
             populate()
 
         refresh_btn.config(command=reload)
+        status_combo.bind("<<ComboboxSelected>>", lambda e: reload())
 
         def show_detail():
             sel = tree.focus()
@@ -711,15 +950,36 @@ def open_main_window():
                 return
             cid = vals[0]
 
-            doc = None
-            for id_, dd in data_cache["items"]:
-                if id_ == cid:
-                    doc = dd
-                    break
-            if not doc:
+            cached = next((dd for id_, dd in data_cache["items"] if id_ == cid), None)
+            if cached is None:
                 show_error(mw, "Complaint not found. Try refreshing.")
                 return
+            if cached.get("status") == "SENDING":
+                # still in the outbox: the queued payload is the whole doc
+                open_detail_window(cid, cached)
+                return
+
+            # list rows only carry LIST_FIELDS; the full doc is read now
+            loader = show_loader(mw, "Loading complaint...")
 
+            def work():
+                return get_complaint(cid, include_archive=status_filter.get() == "ARCHIVED")
+
+            def done(doc, exc):
+                if loader:
+                    try:
+                        loader.destroy()
+                    except tk.TclError:
+                        pass
+                if exc or not doc:
+                    show_error(mw, f"Failed to load complaint:\n{exc or 'not found'}")
+                    return
+                open_detail_window(cid, doc)
+
+            safe_run_in_thread(mw, work, done)
+
+        @watchdog.timed("Complaint detail")
+        def open_detail_window(cid, doc):
             detail = tk.Toplevel(mw)
             detail.title("Complaint Details")
             center_window(detail, 820, 560)
@@ -737,7 +997,11 @@ def open_main_window():
             ).pack(anchor="w", pady=(2, 0))
             ttk.Label(
                 top,
-                text=f"Created at: {doc.get('created_at','')}",
+                text=f"Handled by: {doc.get('assigned_to_name') or 'not assigned yet'}",
+            ).pack(anchor="w", pady=(2, 0))
+            ttk.Label(
+                top,
+                text=f"Created at: {format_ts(doc.get('created_at'))}",
                 bootstyle="secondary",
             ).pack(anchor="w", pady=(2, 6))
 
@@ -751,6 +1015,11 @@ def open_main_window():
             txt.config(state="disabled")
             pan.add(desc_frame, weight=1)
 
+            if doc.get("attachments"):
+                photos_frame = ttk.Labelframe(pan, text="Photos (click to open)", padding=8)
+                show_thumbnails(photos_frame, doc["attachments"], thumbs)
+                pan.add(photos_frame, weight=0)
+
             timeline_frame = ttk.Labelframe(pan, text="Status Timeline", padding=8)
             lst = tk.Listbox(timeline_frame, height=10)
             lst.pack(fill="both", expand=True)
@@ -758,27 +1027,17 @@ def open_main_window():
 
             btn_row = ttk.Frame(detail)
             btn_row.pack(fill="x", padx=10, pady=(0, 8))
+            full_btn = ttk.Button(btn_row, text="Load full history", bootstyle="outline-secondary")
+            full_btn.pack(side="left")
             ttk.Button(btn_row, text="Close", bootstyle="secondary", command=detail.destroy).pack(side="right")
 
-            loader = show_loader(detail, "Loading timeline...")
-
-            def work():
-                return get_complaint_updates(cid)
-
-            def done(res, exc):
-                if loader:
-                    try:
-                        loader.destroy()
-                    except tk.TclError:
-                        pass
-                if exc:
-                    show_error(detail, f"Failed to load timeline:\n{exc}")
-                    return
-                if not res:
+            def fill_timeline(updates):
+                lst.delete(0, tk.END)
+                if not updates:
                     lst.insert(tk.END, "No status updates yet.")
                     return
-                for _, upd in reversed(res):
-                    ts = upd.get("updated_at", "")
+                for upd in reversed(updates):
+                    ts = format_ts(upd.get("updated_at"))
                     st = upd.get("status", "")
                     by = upd.get("updated_by_name", "System")
                     rm = upd.get("remark", "")
@@ -787,11 +1046,40 @@ def open_main_window():
                         lst.insert(tk.END, f"  - {rm}")
                         lst.insert(tk.END, "")
 
-            safe_run_in_thread(detail, work, done)
+            def load_full_history():
+                full_btn.config(state="disabled")
+                loader = show_loader(detail, "Loading timeline...")
+
+                def work():
+                    return get_complaint_updates(cid, include_archive="archived_at" in doc)
+
+                def done(res, exc):
+                    if loader:
+                        try:
+                            loader.destroy()
+                        except tk.TclError:
+                            pass
+                    if exc:
+                        full_btn.config(state="normal")
+                        show_error(detail, f"Failed to load timeline:\n{exc}")
+                        return
+                    fill_timeline([upd for _, upd in res])
+
+                safe_run_in_thread(detail, work, done)
+
+            full_btn.config(command=load_full_history)
+
+            # The complaint doc carries the last few updates; only documents
+            # written before that summary existed need the subcollection read.
+            if "recent_updates" in doc:
+                fill_timeline(doc.get("recent_updates") or [])
+            else:
+                load_full_history()
 
         detail_btn.config(command=show_detail)
         reload()
 
+    @watchdog.timed("Profile")
     def show_profile():
         current_view["name"] = "profile"
         clear_content()
@@ -821,10 +1109,9 @@ def open_main_window():
 
         def save_profile():
             new_name = name_var.get().strip() or session.get("name")
-            from firebase_client import db
 
             try:
-                db.collection("users").document(session["uid"]).update({"name": new_name})
+                update_user(session["uid"], {"name": new_name})
                 session["name"] = new_name
                 show_info(mw, "Profile updated.")
             except Exception as e:
@@ -875,15 +1162,19 @@ def open_main_window():
             mw.destroy()
         except tk.TclError:
             pass
+        release_listeners()
         session.update({"idToken": None, "uid": None, "email": None, "name": None, "role": None})
         open_login_window()
 
     mw.protocol("WM_DELETE_WINDOW", on_close_main)
+    mw.bind("<Control-Shift-D>", lambda e: open_diagnostics(mw, watchdog))
 
 
 # -----------------------
 # Entry point
 # -----------------------
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    uploader.resume_pending()
     open_login_window()
     root.mainloop()
@@ -0,0 +1,18 @@
+# util.py
+"""
+Small helpers shared by the apps and the command-line tools (no Firebase
+imports): where local state lives, and latency percentiles.
+"""
+
+import os
+
+# Outbox queues, staged uploads, local blobs and UI logs live here.
+DATA_DIR = os.path.join(os.path.expanduser("~"), ".crts")
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of values for q in [0, 1]; 0.0 if empty."""
+    if not values:
+        return 0.0
+    s = sorted(values)
+    return s[min(len(s) - 1, int(q * len(s)))]